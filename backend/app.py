@@ -1,46 +1,40 @@
 from flask import Flask, jsonify, request # type: ignore
 from flask_cors import CORS # type: ignore
 import os
-from routes.auth import auth_bp
-from routes.dashboard import dashboard_bp
-from routes.network_billing import network_billing_bp
-from routes.mediation_billing import mediation_billing_bp
-from routes.crm_billing import crm_billing_bp
-from routes.b2b import b2b_bp
-from routes.b2c import b2c_bp
-from routes.fixed_line import fixed_line_bp
-from routes.crm import crm_bp
-from routes.alarms import alarms_bp
-from routes.users import users_bp
-from routes.cases import cases_bp
-from routes.settings import settings_bp
-from routes.upcoming_features import upcoming_features_bp
-from routes.network_billing_data import network_billing_data_bp
-from routes.network_billing_sms import network_billing_sms_bp
-from routes.network_billing_voice import network_billing_voice_bp
+import importlib
+from middleware.compression import ResponseCompression
+
+# (module, blueprint, url prefix). Route modules defer their heavy models
+# through LazyImport, so importing them here only loads Flask.
+BLUEPRINTS = [
+    ('routes.auth', 'auth_bp', '/api/auth'),
+    ('routes.dashboard', 'dashboard_bp', '/api/dashboard'),
+    ('routes.network_billing', 'network_billing_bp', '/api/network-billing'),
+    ('routes.mediation_billing', 'mediation_billing_bp', '/api/mediation-billing'),
+    ('routes.crm_billing', 'crm_billing_bp', '/api/crm-billing'),
+    ('routes.b2b', 'b2b_bp', '/api/b2b'),
+    ('routes.b2c', 'b2c_bp', '/api/b2c'),
+    ('routes.fixed_line', 'fixed_line_bp', '/api/fixed-line'),
+    ('routes.crm', 'crm_bp', '/api/crm'),
+    ('routes.alarms', 'alarms_bp', '/api/alarms'),
+    ('routes.users', 'users_bp', '/api/users'),
+    ('routes.cases', 'cases_bp', '/api/cases'),
+    ('routes.settings', 'settings_bp', '/api/settings'),
+    ('routes.upcoming_features', 'upcoming_features_bp', '/api/upcoming-features'),
+    ('routes.network_billing_data', 'network_billing_data_bp', '/api/network-billing-data'),
+    ('routes.network_billing_sms', 'network_billing_sms_bp', '/api/network-billing-sms'),
+    ('routes.network_billing_voice', 'network_billing_voice_bp', '/api/network-billing-voice'),
+    ('routes.reconciliation_runs', 'reconciliation_runs_bp', '/api/reconciliation-runs'),
+    ('routes.health', 'health_bp', '/api/health')
+]
 
 app = Flask(__name__)
 CORS(app)
+ResponseCompression.init_app(app)
 
 # Register blueprints
-app.register_blueprint(auth_bp, url_prefix='/api/auth')
-app.register_blueprint(dashboard_bp, url_prefix='/api/dashboard')
-app.register_blueprint(network_billing_bp, url_prefix='/api/network-billing')
-app.register_blueprint(mediation_billing_bp, url_prefix='/api/mediation-billing')
-app.register_blueprint(crm_billing_bp, url_prefix='/api/crm-billing')
-app.register_blueprint(b2b_bp, url_prefix='/api/b2b')
-app.register_blueprint(b2c_bp, url_prefix='/api/b2c')
-app.register_blueprint(fixed_line_bp, url_prefix='/api/fixed-line')
-app.register_blueprint(crm_bp, url_prefix='/api/crm')
-app.register_blueprint(alarms_bp, url_prefix='/api/alarms')
-app.register_blueprint(users_bp, url_prefix='/api/users')
-app.register_blueprint(cases_bp, url_prefix='/api/cases')
-app.register_blueprint(settings_bp, url_prefix='/api/settings')
-app.register_blueprint(upcoming_features_bp, url_prefix='/api/upcoming-features')
-app.register_blueprint(network_billing_data_bp, url_prefix='/api/network-billing-data')
-app.register_blueprint(network_billing_sms_bp, url_prefix='/api/network-billing-sms')
-app.register_blueprint(network_billing_voice_bp, url_prefix='/api/network-billing-voice')
-
+for module_name, blueprint_name, url_prefix in BLUEPRINTS:
+    app.register_blueprint(getattr(importlib.import_module(module_name), blueprint_name), url_prefix=url_prefix)
 
 @app.route('/')
 def index():
@@ -50,4 +44,7 @@ def index():
     })
 
 if __name__ == "__main__":
+    # Under gunicorn the post_worker_init hook in gunicorn.conf.py starts this instead
+    from warmup import Warmup
+    Warmup.start()
     app.run(host="0.0.0.0", port=13130)
\ No newline at end of file
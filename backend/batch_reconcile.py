@@ -0,0 +1,255 @@
+"""Offline batch reconciliation
+
+Runs reconciliations outside the web server, one worker process per input
+pair, and writes a summary plus one file per mismatch category for each
+pair, with a manifest.json over the whole run:
+
+    python batch_reconcile.py data --billing 'in/Billing_*.csv' --network 'in/Network_*.csv' \\
+        --output out/ --format csv --workers 4 --memory-budget 4G
+
+Globs are expanded and sorted, and the n-th file of each side forms the
+n-th pair. Without inputs the bundled assets are reconciled. Workers are
+started only while the estimated footprint of the running pairs (input
+bytes times AdmissionControl.MEMORY_FACTOR) fits in the memory budget, and
+they run at a lower CPU priority so a nightly cron leaves the API
+responsive. Each pair's run is also added to the result store (ResultStore)
+unless --no-store is given. Exits non-zero when any pair fails.
+"""
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import importlib
+import importlib.util
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from middleware.admission import AdmissionControl
+
+# Reconciliation type -> (module, function, input sides in the order the function takes them)
+RECONCILIATIONS = {
+    'data': ('models.services', 'ServicesModel.get_network_vs_billing_data_opt', ('billing', 'network')),
+    'sms': ('models.services', 'ServicesModel.get_network_vs_billing_sms_opt', ('billing', 'network')),
+    'voice': ('models.services', 'ServicesModel.get_network_vs_billing_voice_opt', ('billing', 'network')),
+    'crm': ('models.data_processor', 'DataProcessor.get_crm_billing_analytics', ('crm', 'billing'))
+}
+
+# Bundled inputs used when a side is not given on the command line
+DEFAULT_INPUTS = {
+    'data': ('models.services', 'ServicesModel.DATA_FILES'),
+    'sms': ('models.services', 'ServicesModel.SMS_FILES'),
+    'voice': ('models.services', 'ServicesModel.VOICE_FILES'),
+    'crm': ('models.data_processor', 'DataProcessor.CRM_BILLING_FILES')
+}
+
+# Record lists written as per-category files for CRM; network types use LeakageModel.NETWORK_VALUATION
+CRM_CATEGORIES = ['mismatched_accounts']
+
+# Bulky blocks left out of the summary (their records are in the category files)
+SUMMARY_EXCLUDE = {'records_display_card', 'mismatch_visualization', 'ml_tf_comparison', 'duplicate_records'}
+
+FORMATS = ('csv', 'json', 'parquet')
+
+UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+
+
+def resolve(module_name, path):
+    target = importlib.import_module(module_name)
+    for part in path.split('.'):
+        target = getattr(target, part)
+    return target
+
+
+def parse_size(value):
+    """Bytes from 512M, 4G, 1.5T or a plain byte count"""
+    text = value.strip().upper().rstrip('B')
+    unit = text[-1:] if text[-1:] in UNITS and not text[-1:].isdigit() else ''
+    try:
+        return int(float(text[:len(text) - len(unit)]) * UNITS[unit])
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid size: {value}")
+
+
+def expand(pattern):
+    paths = sorted(path for path in glob.glob(os.path.expanduser(pattern)) if os.path.isfile(path))
+    if not paths:
+        raise SystemExit(f"No input files match {pattern}")
+    return paths
+
+
+def build_jobs(args):
+    """One job per input pair, as (name, files) with files in the order the function takes them"""
+    _, _, sides = RECONCILIATIONS[args.type]
+    defaults = resolve(*DEFAULT_INPUTS[args.type])
+    inputs = [
+        expand(getattr(args, side)) if getattr(args, side) else [default]
+        for side, default in zip(sides, defaults)
+    ]
+    if len(set(len(paths) for paths in inputs)) != 1:
+        counts = ', '.join(f"{len(paths)} {side}" for side, paths in zip(sides, inputs))
+        raise SystemExit(f"Inputs do not pair up: {counts} files")
+
+    jobs = []
+    for files in zip(*inputs):
+        # Named after the non-billing input
+        name = os.path.splitext(os.path.basename(files[1] if args.type != 'crm' else files[0]))[0]
+        jobs.append((name, tuple(files)))
+    if len(set(name for name, _ in jobs)) != len(jobs):
+        jobs = [(f"{index:03d}_{name}", files) for index, (name, files) in enumerate(jobs)]
+    return jobs
+
+
+def write_frame(df, path, fmt):
+    if fmt == 'csv':
+        df.to_csv(path, index=False)
+    elif fmt == 'json':
+        df.to_json(path, orient='records', date_format='iso')
+    else:
+        df.to_parquet(path, index=False)
+
+
+def run_job(reconciliation, name, files, output_dir, fmt, sample, nice, engine=None, store=True):
+    """Worker entry point: reconcile one input pair and write its result files"""
+    if nice:
+        os.nice(nice)
+    import pandas as pd # type: ignore
+    from models.leakage import LeakageModel
+    from models.result_store import ResultStore
+
+    module_name, path, _ = RECONCILIATIONS[reconciliation]
+    started = time.time()
+    started_at = datetime.now()
+    if reconciliation == 'crm':
+        result = resolve(module_name, path)(files=files, engine=engine)
+        data = result
+        categories = CRM_CATEGORIES
+    else:
+        result = resolve(module_name, path)(sample=sample, files=files, engine=engine)
+        data = result['data']
+        categories = list(LeakageModel.NETWORK_VALUATION) + ['duplicate_records']
+
+    source = 'crm_billing' if reconciliation == 'crm' else f'network_{reconciliation}'
+    run_id = ResultStore.record(source, data, started_at, {'inputs': list(files), 'sample': sample, 'engine': engine, 'batch': name}) if store else None
+
+    job_dir = os.path.join(output_dir, name)
+    os.makedirs(job_dir, exist_ok=True)
+
+    written = {}
+    for category in categories:
+        records = data.get(category)
+        if not isinstance(records, list):
+            continue
+        file_name = f"{category}.{fmt}"
+        write_frame(pd.DataFrame(records), os.path.join(job_dir, file_name), fmt)
+        written[category] = {'records': len(records), 'file': file_name}
+
+    summary = {
+        'type': reconciliation,
+        'name': name,
+        'run_id': run_id,
+        'inputs': list(files),
+        'elapsed_seconds': round(time.time() - started, 2),
+        'categories': written,
+        'result': {key: value for key, value in data.items() if key not in written and key not in SUMMARY_EXCLUDE}
+    }
+    with open(os.path.join(job_dir, 'summary.json'), 'w') as f:
+        json.dump(summary, f, indent=2, default=str)
+    return {key: summary[key] for key in ('name', 'run_id', 'inputs', 'elapsed_seconds', 'categories')}
+
+
+def run(args):
+    jobs = build_jobs(args)
+    output_dir = os.path.join(args.output, args.type)
+    os.makedirs(output_dir, exist_ok=True)
+
+    budget = args.memory_budget
+    if budget is None:
+        available = AdmissionControl.available_memory()
+        budget = int(available * AdmissionControl.MEMORY_FRACTION) if available else None
+
+    manifest = {
+        'type': args.type,
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+        'format': args.format,
+        'workers': args.workers,
+        'memory_budget': budget,
+        'sample': args.sample,
+        'engine': args.engine,
+        'jobs': []
+    }
+    pending = [(name, files, AdmissionControl.estimate_memory(files)) for name, files in jobs]
+    running = {}
+    reserved = 0
+
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        while pending or running:
+            # Start pairs in order while they fit; one always runs, even over budget, so the queue drains
+            while pending and len(running) < args.workers and (
+                not running or budget is None or reserved + pending[0][2] <= budget
+            ):
+                name, files, estimate = pending.pop(0)
+                if budget is not None and estimate > budget:
+                    print(f"{name}: estimated {estimate >> 20} MB exceeds the {budget >> 20} MB budget, running it alone")
+                future = pool.submit(run_job, args.type, name, files, output_dir, args.format, args.sample, args.nice, args.engine, args.store)
+                running[future] = (name, files, estimate, time.time())
+                reserved += estimate
+                print(f"{name}: started ({len(pending)} pending)")
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name, files, estimate, started = running.pop(future)
+                reserved -= estimate
+                try:
+                    job = future.result()
+                    job['status'] = 'success'
+                    print(f"{name}: done in {job['elapsed_seconds']}s")
+                except Exception as e:
+                    job = {'name': name, 'inputs': list(files), 'status': 'error', 'message': str(e),
+                           'elapsed_seconds': round(time.time() - started, 2)}
+                    print(f"{name}: failed: {e}")
+                manifest['jobs'].append(job)
+
+    manifest['finished_at'] = datetime.now().isoformat(timespec='seconds')
+    manifest['jobs'].sort(key=lambda job: job['name'])
+    with open(os.path.join(output_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    failed = [job['name'] for job in manifest['jobs'] if job['status'] != 'success']
+    print(f"{len(jobs) - len(failed)}/{len(jobs)} reconciliations written to {output_dir}")
+    return 1 if failed else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('type', choices=sorted(RECONCILIATIONS))
+    parser.add_argument('--billing', help='billing file path or glob')
+    parser.add_argument('--network', help='network file path or glob (data, sms, voice)')
+    parser.add_argument('--crm', help='CRM file path or glob (crm)')
+    parser.add_argument('--output', '-o', required=True, help='output directory')
+    parser.add_argument('--format', '-f', choices=FORMATS, default='csv')
+    parser.add_argument('--workers', '-j', type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument('--memory-budget', type=parse_size, help='e.g. 4G; defaults to the memory available to admission control')
+    parser.add_argument('--sample', type=float, help='reconcile an MSISDN-hash sample of this fraction (network types)')
+    parser.add_argument('--engine', choices=['pandas', 'duckdb'], help='execution engine (default REVENUEFIX_ENGINE, else pandas)')
+    parser.add_argument('--no-store', dest='store', action='store_false', help='do not add the runs to the result store')
+    parser.add_argument('--nice', type=int, default=10, help='CPU niceness added to the workers (0 to keep)')
+    args = parser.parse_args(argv)
+
+    _, _, sides = RECONCILIATIONS[args.type]
+    for side in ('billing', 'network', 'crm'):
+        if getattr(args, side) and side not in sides:
+            parser.error(f"--{side} does not apply to {args.type}")
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.sample is not None and (args.type == 'crm' or not 0 < args.sample <= 1):
+        parser.error("--sample takes a fraction in (0, 1] and applies to data, sms and voice")
+    if args.format == 'parquet' and not (importlib.util.find_spec('pyarrow') or importlib.util.find_spec('fastparquet')):
+        parser.error("--format parquet needs pyarrow or fastparquet installed")
+    if args.engine == 'duckdb' and not importlib.util.find_spec('duckdb'):
+        parser.error("--engine duckdb needs the duckdb package installed")
+    return run(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
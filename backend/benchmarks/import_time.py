@@ -0,0 +1,61 @@
+"""Worker boot-time benchmark
+
+Imports the app in fresh interpreters, the way a gunicorn worker boots
+without --preload, and reports the median import time, whether pandas and
+the reconciliation models were pulled in, and the latency of the first
+light and first heavy request.
+
+    python benchmarks/import_time.py [--runs 5]
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = '''
+import sys, time, json
+started = time.perf_counter()
+import app
+boot = time.perf_counter() - started
+loaded = {name: name in sys.modules for name in ('pandas', 'numpy', 'models.services', 'models.data_processor')}
+client = app.app.test_client()
+started = time.perf_counter()
+client.get('/api/settings')
+light = time.perf_counter() - started
+started = time.perf_counter()
+client.get('/api/users/tasks')
+heavy = time.perf_counter() - started
+print(json.dumps({'boot': boot, 'loaded': loaded, 'first_light_request': light, 'first_heavy_request': heavy}))
+'''
+
+
+def run_probe():
+    result = subprocess.run(
+        [sys.executable, '-c', PROBE],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    runs = [run_probe() for _ in range(args.runs)]
+    print(f"runs:                 {args.runs}")
+    for key in ('boot', 'first_light_request', 'first_heavy_request'):
+        values = [run[key] * 1000 for run in runs]
+        print(f"{key + ':':<22}median {statistics.median(values):8.1f} ms   max {max(values):8.1f} ms")
+    print(f"loaded at boot:       {', '.join(name for name, loaded in runs[0]['loaded'].items() if loaded) or 'none of the heavy modules'}")
+
+
+if __name__ == '__main__':
+    main()
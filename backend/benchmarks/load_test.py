@@ -0,0 +1,340 @@
+"""Local HTTP load test
+
+Starts the API under gunicorn (gunicorn.conf.py) on a free local port,
+waits until its workers report ready, then drives a weighted mix of
+requests from N concurrent clients for a fixed time and reports
+throughput, p50/p95/p99 latency and error rate per route:
+
+    python benchmarks/load_test.py --clients 16 --duration 60 --workers 2 \\
+        --mix reconciliation=1,alarms=3,cases=3,users=2
+
+Each client picks a scenario by weight (see SCENARIOS): reconciliation
+GETs, alarm and case reads and create/update/claim flows, and user and
+task reads. Errors are responses of 400 and above and failed requests.
+--url targets a running server instead of starting one. Alarm and case
+writes go to assets/alarms.csv and assets/cases.csv, which are restored
+afterwards; runs the reconciliations store go to a temporary result store.
+--json writes the report to a file.
+"""
+import os
+import sys
+import json
+import math
+import time
+import random
+import shutil
+import signal
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.client
+from urllib.parse import urlsplit
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TICKET_FILES = [os.path.join(BACKEND_DIR, 'assets', name) for name in ('alarms.csv', 'cases.csv')]
+
+RECONCILIATION_PATHS = [
+    '/api/network-billing-data',
+    '/api/network-billing-sms',
+    '/api/network-billing-voice',
+    '/api/crm-billing',
+    '/api/network-billing-data?sections=mismatch_count,service_mismatch_count'
+]
+USER_PATHS = ['/api/users', '/api/users/1', '/api/users/roles', '/api/users/tasks']
+
+# Share of alarm and case scenarios that write rather than read
+WRITE_SHARE = 0.3
+
+
+class Client:
+    """One simulated user: a keep-alive connection and the latencies it measured, per route"""
+
+    def __init__(self, base_url, timeout):
+        parts = urlsplit(base_url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.timeout = timeout
+        self.connection = None
+        self.samples = {}
+        self.errors = {}
+
+    def request(self, method, path, route=None, body=None):
+        """Send one request and record its latency under route (default: method and path); returns the parsed JSON or None"""
+        route = route or f'{method} {path}'
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+        started = time.perf_counter()
+        try:
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            self.connection.request(method, path, body=json.dumps(body) if body is not None else None, headers=headers)
+            response = self.connection.getresponse()
+            payload = response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            if self.connection is not None:
+                self.connection.close()
+            self.connection = None
+            payload, status = None, None
+        self.samples.setdefault(route, []).append(time.perf_counter() - started)
+        if status is None or status >= 400:
+            self.errors[route] = self.errors.get(route, 0) + 1
+            return None
+        try:
+            return json.loads(payload)
+        except ValueError:
+            return None
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+
+
+def reconciliation(client):
+    client.request('GET', random.choice(RECONCILIATION_PATHS))
+
+
+def tickets(client, table, new, update, claim):
+    if random.random() >= WRITE_SHARE:
+        client.request('GET', f'/api/{table}?limit=50')
+        return
+    created = client.request('POST', f'/api/{table}', body=new)
+    if not created:
+        return
+    ticket_id = created['data']['id']
+    client.request('PUT', f'/api/{table}/{ticket_id}', f'PUT /api/{table}/<id>', dict(new, **update))
+    client.request('PUT', f'/api/{table}/{ticket_id}/claim', f'PUT /api/{table}/<id>/claim', claim)
+
+
+def alarms(client):
+    tickets(
+        client,
+        'alarms',
+        {'severity': 'Low', 'source': 'Load Test', 'message': 'Synthetic alarm'},
+        {'status': 'In Progress'},
+        {'assigned_to': 'Load Test'}
+    )
+
+
+def cases(client):
+    tickets(
+        client,
+        'cases',
+        {'priority': 'Low', 'customer': 'Load Test', 'subject': 'Synthetic case', 'description': 'Created by the load test'},
+        {'status': 'In Progress', 'assigned_to': 'Unassigned'},
+        {'assigned_to': 'Load Test'}
+    )
+
+
+def users(client):
+    path = random.choice(USER_PATHS)
+    client.request('GET', path, 'GET /api/users/<id>' if path == '/api/users/1' else None)
+
+
+# Scenario name -> function issuing one user action through a Client
+SCENARIOS = {
+    'reconciliation': reconciliation,
+    'alarms': alarms,
+    'cases': cases,
+    'users': users
+}
+
+DEFAULT_MIX = 'reconciliation=1,alarms=3,cases=3,users=3'
+
+
+def parse_mix(value):
+    """'name=weight,...' -> {name: weight}"""
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f"unknown scenario {name!r}; choose from {', '.join(SCENARIOS)}")
+        try:
+            mix[name] = float(weight) if weight else 1.0
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"weight of {name} must be a number")
+        if mix[name] < 0:
+            raise argparse.ArgumentTypeError(f"weight of {name} must not be negative")
+    if not any(mix.values()):
+        raise argparse.ArgumentTypeError("the mix needs a positive weight")
+    return mix
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(port, workers, threads, warmup, store_path):
+    env = dict(
+        os.environ,
+        REVENUEFIX_BIND=f'127.0.0.1:{port}',
+        REVENUEFIX_WORKERS=str(workers),
+        REVENUEFIX_THREADS=str(threads),
+        REVENUEFIX_RESULT_STORE=store_path
+    )
+    if not warmup:
+        env['REVENUEFIX_WARMUP'] = '0'
+    return subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app'],
+        cwd=BACKEND_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+
+
+def wait_ready(base_url, workers, timeout, server=None):
+    """Wait until as many readiness checks in a row as there are workers pass (they land on any worker)"""
+    client = Client(base_url, timeout=10)
+    deadline = time.monotonic() + timeout
+    passed = 0
+    while passed < max(workers, 1):
+        if server is not None and server.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with code {server.returncode}")
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"server not ready after {timeout} seconds")
+        passed = passed + 1 if client.request('GET', '/api/health/ready') else 0
+        if not passed:
+            time.sleep(0.5)
+    client.close()
+
+
+def drive(base_url, mix, clients, duration, timeout):
+    """Run the clients for duration seconds; returns their merged samples and errors"""
+    names, weights = zip(*mix.items())
+    stop = time.monotonic() + duration
+    pool = [Client(base_url, timeout) for _ in range(clients)]
+
+    def run(client):
+        while time.monotonic() < stop:
+            SCENARIOS[random.choices(names, weights)[0]](client)
+        client.close()
+
+    threads = [threading.Thread(target=run, args=(client,), daemon=True) for client in pool]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    samples, errors = {}, {}
+    for client in pool:
+        for route, latencies in client.samples.items():
+            samples.setdefault(route, []).extend(latencies)
+        for route, count in client.errors.items():
+            errors[route] = errors.get(route, 0) + count
+    return samples, errors, elapsed
+
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of a sorted list"""
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def report(samples, errors, elapsed):
+    routes = {}
+    for route, latencies in sorted(samples.items()):
+        ordered = sorted(latencies)
+        routes[route] = {
+            'requests': len(ordered),
+            'rps': round(len(ordered) / elapsed, 2),
+            'errors': errors.get(route, 0),
+            'error_rate': round(errors.get(route, 0) / len(ordered), 4),
+            'p50_ms': round(percentile(ordered, 0.50) * 1000, 1),
+            'p95_ms': round(percentile(ordered, 0.95) * 1000, 1),
+            'p99_ms': round(percentile(ordered, 0.99) * 1000, 1)
+        }
+    requests = sum(route['requests'] for route in routes.values())
+    failed = sum(errors.values())
+    everything = sorted(latency for latencies in samples.values() for latency in latencies)
+    total = {
+        'requests': requests,
+        'rps': round(requests / elapsed, 2) if elapsed else 0.0,
+        'errors': failed,
+        'error_rate': round(failed / requests, 4) if requests else 0.0,
+        'p50_ms': round(percentile(everything, 0.50) * 1000, 1) if everything else None,
+        'p95_ms': round(percentile(everything, 0.95) * 1000, 1) if everything else None,
+        'p99_ms': round(percentile(everything, 0.99) * 1000, 1) if everything else None
+    }
+    return {'elapsed_seconds': round(elapsed, 2), 'routes': routes, 'total': total}
+
+
+def print_report(result):
+    width = max([len(route) for route in result['routes']] + [5])
+    print(f"{'route':<{width}}  {'requests':>8}  {'req/s':>8}  {'errors':>7}  {'p50 ms':>8}  {'p95 ms':>8}  {'p99 ms':>8}")
+    for route, row in list(result['routes'].items()) + [('total', result['total'])]:
+        print(
+            f"{route:<{width}}  {row['requests']:>8}  {row['rps']:>8.2f}  {row['error_rate']:>7.2%}  "
+            f"{row['p50_ms'] or 0:>8.1f}  {row['p95_ms'] or 0:>8.1f}  {row['p99_ms'] or 0:>8.1f}"
+        )
+    print(f"elapsed: {result['elapsed_seconds']} s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', '-c', type=int, default=8, help='concurrent clients')
+    parser.add_argument('--duration', '-d', type=float, default=30, help='seconds of load')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix(DEFAULT_MIX), help=f'scenario weights (default {DEFAULT_MIX})')
+    parser.add_argument('--workers', '-w', type=int, default=2, help='gunicorn workers')
+    parser.add_argument('--threads', type=int, default=4, help='threads per gunicorn worker')
+    parser.add_argument('--no-warmup', dest='warmup', action='store_false', help='start workers without the background warmup')
+    parser.add_argument('--url', help='load a running server at this base URL instead of starting one')
+    parser.add_argument('--timeout', type=float, default=300, help='per-request and readiness timeout in seconds')
+    parser.add_argument('--seed', type=int, help='random seed for the request mix')
+    parser.add_argument('--json', help='also write the report to this file')
+    args = parser.parse_args(argv)
+    if args.clients < 1 or args.duration <= 0:
+        parser.error("--clients and --duration must be positive")
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    scratch = tempfile.mkdtemp(prefix='revenuefix-load-')
+    backups = []
+    server = None
+    try:
+        if 'alarms' in args.mix or 'cases' in args.mix:
+            for path in TICKET_FILES:
+                backup = os.path.join(scratch, os.path.basename(path))
+                shutil.copy2(path, backup)
+                backups.append((backup, path))
+
+        base_url = args.url
+        if base_url is None:
+            port = free_port()
+            base_url = f'http://127.0.0.1:{port}'
+            server = start_server(port, args.workers, args.threads, args.warmup, os.path.join(scratch, 'results.sqlite'))
+            print(f"gunicorn: {args.workers} workers x {args.threads} threads on {base_url}, waiting for readiness")
+        wait_ready(base_url, args.workers if server else 1, args.timeout, server)
+
+        mix = ', '.join(f'{name}={weight:g}' for name, weight in args.mix.items())
+        print(f"load: {args.clients} clients for {args.duration:g} s, mix {mix}")
+        samples, errors, elapsed = drive(base_url, args.mix, args.clients, args.duration, args.timeout)
+        result = report(samples, errors, elapsed)
+        result['options'] = {
+            'clients': args.clients, 'duration': args.duration, 'mix': args.mix,
+            'workers': args.workers if server else None, 'threads': args.threads if server else None, 'url': args.url
+        }
+        print_report(result)
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump(result, f, indent=2)
+        return 1 if result['total']['requests'] == 0 else 0
+    finally:
+        if server is not None:
+            server.send_signal(signal.SIGTERM)
+            try:
+                server.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                server.kill()
+        # The ticket files are restored after the server stops writing to them
+        for backup, path in backups:
+            shutil.copy2(backup, path)
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
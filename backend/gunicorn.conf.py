@@ -0,0 +1,15 @@
+# Gunicorn settings for the RevenueFix API: gunicorn -c gunicorn.conf.py app:app
+import os
+
+bind = os.environ.get('REVENUEFIX_BIND', '0.0.0.0:13130')
+workers = int(os.environ.get('REVENUEFIX_WORKERS', '2'))
+threads = int(os.environ.get('REVENUEFIX_THREADS', '4'))
+timeout = int(os.environ.get('REVENUEFIX_TIMEOUT', '300'))
+max_requests = int(os.environ.get('REVENUEFIX_MAX_REQUESTS', '0'))
+max_requests_jitter = int(os.environ.get('REVENUEFIX_MAX_REQUESTS_JITTER', '0'))
+
+
+def post_worker_init(worker):
+    """Warm each worker after it forks so /api/health/ready only passes warm workers"""
+    from warmup import Warmup
+    Warmup.start()
@@ -0,0 +1,55 @@
+import importlib
+import threading
+
+
+class LazyImport:
+    """Stand-in for a module, or an attribute of one, that imports it on first use
+
+    Route modules bind their heavy models (and pandas) through this, so
+    importing the app only loads Flask and the light endpoints; the first
+    request that touches a model pays its import, or warm_imports() does
+    it ahead of time after the worker forks.
+    """
+
+    _lock = threading.Lock()
+
+    def __init__(self, module_name, attribute=None):
+        self._module_name = module_name
+        self._attribute = attribute
+        self._target = None
+
+    def _resolve(self):
+        if self._target is None:
+            with self._lock:
+                if self._target is None:
+                    module = importlib.import_module(self._module_name)
+                    self._target = getattr(module, self._attribute) if self._attribute else module
+        return self._target
+
+    def __getattr__(self, name):
+        return getattr(self._resolve(), name)
+
+    def __call__(self, *args, **kwargs):
+        return self._resolve()(*args, **kwargs)
+
+    def __repr__(self):
+        target = f'{self._module_name}.{self._attribute}' if self._attribute else self._module_name
+        return f'<LazyImport {target} ({"loaded" if self._target is not None else "not loaded"})>'
+
+
+# Modules deferred by the routes, in the order a warmup should load them
+HEAVY_MODULES = [
+    'pandas',
+    'numpy',
+    'models.ticket_store',
+    'models.leakage',
+    'models.data_processor',
+    'models.snapshot_processor',
+    'models.services'
+]
+
+
+def warm_imports(modules=None):
+    """Import the deferred heavy modules now, e.g. right after a worker forks"""
+    for name in modules or HEAVY_MODULES:
+        importlib.import_module(name)
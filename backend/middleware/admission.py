@@ -0,0 +1,172 @@
+import os
+import math
+import time
+import threading
+from flask import jsonify # type: ignore
+
+
+class _Gate:
+    """Concurrency slots and wait queue for one endpoint class"""
+
+    def __init__(self, max_concurrent, max_queue):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.condition = threading.Condition()
+        self.running = 0
+        self.waiting = 0
+        self.average_seconds = None
+
+
+class AdmissionRefused(Exception):
+    """A computation was not admitted; retry_after is the suggested wait in seconds"""
+
+    def __init__(self, endpoint_class, retry_after):
+        super().__init__('Server is busy with other reconciliations, please retry shortly')
+        self.endpoint_class = endpoint_class
+        self.retry_after = retry_after
+
+
+class AdmissionControl:
+    """Bounded concurrency and memory-aware admission for expensive endpoints
+
+    Each endpoint class runs at most max_concurrent computations per
+    worker and queues at most max_queue more. A computation is only
+    admitted while its estimated footprint (input bytes times
+    MEMORY_FACTOR) fits in the memory still available, which already
+    reflects the ones running, unless nothing else of its class is
+    running. When the queue is full, or a queued computation waits longer
+    than QUEUE_TIMEOUT, AdmissionRefused is raised and the client gets 429
+    with a Retry-After estimate. SingleFlight takes the gate for the
+    caller that actually computes, so coalesced requests hold no slots.
+    """
+
+    CLASSES = {
+        'reconciliation': {'max_concurrent': 2, 'max_queue': 8},
+        'snapshot': {'max_concurrent': 1, 'max_queue': 4}
+    }
+
+    # Peak pandas footprint per input byte: parsed frames, dedupe copies and the outer merge
+    MEMORY_FACTOR = 8
+    # Share of the currently available memory one admitted computation may need
+    MEMORY_FRACTION = 0.8
+
+    QUEUE_TIMEOUT = 120
+    # Re-check available memory at least this often while queued
+    POLL_SECONDS = 1.0
+    DEFAULT_RETRY_AFTER = 5
+
+    _gates = {}
+    _gates_lock = threading.Lock()
+
+    @classmethod
+    def _gate(cls, endpoint_class):
+        with cls._gates_lock:
+            if endpoint_class not in cls._gates:
+                cls._gates[endpoint_class] = _Gate(**cls.CLASSES[endpoint_class])
+            return cls._gates[endpoint_class]
+
+    @staticmethod
+    def available_memory():
+        """Bytes still available to this container, or None when unknown"""
+        candidates = []
+        try:
+            with open('/proc/meminfo') as f:
+                for line in f:
+                    if line.startswith('MemAvailable:'):
+                        candidates.append(int(line.split()[1]) * 1024)
+                        break
+        except (OSError, ValueError):
+            pass
+        # cgroup v2 limit, which is what the OOM killer enforces in a container
+        try:
+            with open('/sys/fs/cgroup/memory.max') as f:
+                limit = f.read().strip()
+            if limit != 'max':
+                with open('/sys/fs/cgroup/memory.current') as f:
+                    candidates.append(int(limit) - int(f.read().strip()))
+        except (OSError, ValueError):
+            pass
+        return min(candidates) if candidates else None
+
+    @classmethod
+    def estimate_memory(cls, sources):
+        """Estimated peak bytes for a request reading the given files or directories"""
+        total = 0
+        for source in sources:
+            if os.path.isdir(source):
+                for root, _, files in os.walk(source):
+                    total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+            elif os.path.exists(source):
+                total += os.path.getsize(source)
+        return total * cls.MEMORY_FACTOR
+
+    @classmethod
+    def _fits(cls, gate, estimate):
+        if gate.running >= gate.max_concurrent:
+            return False
+        if gate.running == 0:
+            return True
+        available = cls.available_memory()
+        return available is None or estimate <= available * cls.MEMORY_FRACTION
+
+    @classmethod
+    def _retry_after(cls, gate):
+        if gate.average_seconds is None:
+            return cls.DEFAULT_RETRY_AFTER
+        return max(1, math.ceil(gate.average_seconds * (gate.waiting + 1) / gate.max_concurrent))
+
+    @classmethod
+    def acquire(cls, endpoint_class, estimate):
+        """Wait for a slot; returns None once admitted or a Retry-After in seconds when refused"""
+        gate = cls._gate(endpoint_class)
+        with gate.condition:
+            if not cls._fits(gate, estimate):
+                if gate.waiting >= gate.max_queue:
+                    return cls._retry_after(gate)
+                gate.waiting += 1
+                deadline = time.monotonic() + cls.QUEUE_TIMEOUT
+                try:
+                    while not cls._fits(gate, estimate):
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            return cls._retry_after(gate)
+                        gate.condition.wait(min(remaining, cls.POLL_SECONDS))
+                finally:
+                    gate.waiting -= 1
+            gate.running += 1
+            return None
+
+    @classmethod
+    def release(cls, endpoint_class, elapsed):
+        gate = cls._gate(endpoint_class)
+        with gate.condition:
+            gate.running -= 1
+            gate.average_seconds = (
+                elapsed if gate.average_seconds is None else 0.7 * gate.average_seconds + 0.3 * elapsed
+            )
+            gate.condition.notify_all()
+
+    @classmethod
+    def run(cls, endpoint_class, sources, fn):
+        """fn() under the admission rules of endpoint_class; raises AdmissionRefused"""
+        retry_after = cls.acquire(endpoint_class, cls.estimate_memory(sources))
+        if retry_after is not None:
+            print(f"Rejected {endpoint_class} request, retry after {retry_after}s")
+            raise AdmissionRefused(endpoint_class, retry_after)
+
+        started = time.monotonic()
+        try:
+            return fn()
+        finally:
+            cls.release(endpoint_class, time.monotonic() - started)
+
+    @staticmethod
+    def refused(error):
+        """429 response for an AdmissionRefused"""
+        response = jsonify({
+            'status': 'error',
+            'message': str(error)
+        })
+        response.status_code = 429
+        response.headers['Retry-After'] = str(error.retry_after)
+        return response
@@ -0,0 +1,121 @@
+import gzip
+import zlib
+from flask import request # type: ignore
+
+try:
+    import brotli # type: ignore
+except ImportError:
+    brotli = None
+
+
+class ResponseCompression:
+    """Negotiated gzip/Brotli compression for every blueprint's responses
+
+    Bodies smaller than MIN_SIZE are sent as-is. Streamed responses are
+    compressed chunk by chunk, so generators are never buffered whole.
+    Brotli is only offered when the optional brotli package is installed.
+    """
+
+    MIN_SIZE = 1024
+    GZIP_LEVEL = 6
+    BROTLI_QUALITY = 5
+
+    COMPRESSIBLE_TYPES = (
+        'application/json',
+        'application/javascript',
+        'text/'
+    )
+
+    @classmethod
+    def init_app(cls, app):
+        app.after_request(cls.compress)
+
+    @staticmethod
+    def supported_encodings():
+        return ('br', 'gzip') if brotli else ('gzip',)
+
+    @classmethod
+    def negotiate(cls, accept_encoding):
+        """Pick the best supported encoding from an Accept-Encoding header"""
+        weights = {}
+        for part in (accept_encoding or '').split(','):
+            name, _, params = part.strip().partition(';')
+            name = name.strip().lower()
+            if not name:
+                continue
+            quality = 1.0
+            params = params.strip()
+            if params.startswith('q='):
+                try:
+                    quality = float(params[2:])
+                except ValueError:
+                    quality = 0.0
+            weights[name] = quality
+
+        best = None
+        for encoding in cls.supported_encodings():
+            quality = weights.get(encoding, weights.get('*', 0.0))
+            if quality > 0 and (best is None or quality > best[1]):
+                best = (encoding, quality)
+        return best[0] if best else None
+
+    @classmethod
+    def _compressor(cls, encoding):
+        if encoding == 'br':
+            compressor = brotli.Compressor(quality=cls.BROTLI_QUALITY)
+            return compressor.process, compressor.finish
+        # wbits=31 writes a gzip header and trailer around the deflate stream
+        compressor = zlib.compressobj(cls.GZIP_LEVEL, zlib.DEFLATED, 31)
+        return compressor.compress, compressor.flush
+
+    @classmethod
+    def _stream(cls, chunks, encoding):
+        process, finish = cls._compressor(encoding)
+        try:
+            for chunk in chunks:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode('utf-8')
+                data = process(chunk)
+                if data:
+                    yield data
+            yield finish()
+        finally:
+            if hasattr(chunks, 'close'):
+                chunks.close()
+
+    @classmethod
+    def compress(cls, response):
+        response.vary.add('Accept-Encoding')
+        if (
+            response.status_code < 200
+            or response.status_code in (204, 304)
+            or request.method == 'HEAD'
+            or response.direct_passthrough
+            or 'Content-Encoding' in response.headers
+            or not (response.mimetype or '').startswith(cls.COMPRESSIBLE_TYPES)
+        ):
+            return response
+
+        encoding = cls.negotiate(request.headers.get('Accept-Encoding'))
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            response.response = cls._stream(response.response, encoding)
+            response.headers.pop('Content-Length', None)
+        else:
+            body = response.get_data()
+            if len(body) < cls.MIN_SIZE:
+                return response
+            if encoding == 'br':
+                body = brotli.compress(body, quality=cls.BROTLI_QUALITY)
+            else:
+                body = gzip.compress(body, compresslevel=cls.GZIP_LEVEL)
+            response.set_data(body)
+
+        response.headers['Content-Encoding'] = encoding
+        # The encoded bytes differ from the identity body, so a strong validator no longer holds
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
@@ -0,0 +1,107 @@
+import os
+import hashlib
+from datetime import date, datetime, time, timezone
+from functools import wraps
+from flask import request, make_response # type: ignore
+
+
+class ConditionalGet:
+    """ETag/Last-Modified validators derived from the files a response is computed from
+
+    The ETag hashes each source file's path, mtime and size together with
+    the code version and the request's query string, plus today's date for
+    views that depend on it (dated=True). A matching
+    If-None-Match (or an If-Modified-Since no older than the newest source)
+    is answered with 304 before the view runs.
+    """
+
+    CODE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    CODE_PACKAGES = ('models', 'routes', 'middleware')
+
+    _code_version = None
+
+    @classmethod
+    def code_version(cls):
+        """Fingerprint of the backend's Python sources, computed once per process"""
+        if cls._code_version is None:
+            digest = hashlib.sha1()
+            for package in cls.CODE_PACKAGES:
+                for path, mtime_ns, size in cls._stat(os.path.join(cls.CODE_DIR, package)):
+                    if path.endswith('.py'):
+                        digest.update(f'{os.path.relpath(path, cls.CODE_DIR)}:{mtime_ns}:{size};'.encode())
+            cls._code_version = digest.hexdigest()
+        return cls._code_version
+
+    @staticmethod
+    def _stat(path):
+        """(path, mtime_ns, size) for a file, or for every file under a directory"""
+        if os.path.isdir(path):
+            entries = []
+            for root, dirs, files in os.walk(path):
+                dirs[:] = sorted(d for d in dirs if d != '__pycache__')
+                for name in sorted(files):
+                    entries.extend(ConditionalGet._stat(os.path.join(root, name)))
+            return entries
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return [(path, -1, -1)]
+        return [(path, stat.st_mtime_ns, stat.st_size)]
+
+    @classmethod
+    def validators(cls, sources, variant='', dated=False):
+        """(etag, last_modified) for a set of source paths and a response variant
+
+        dated responses also change at midnight: the date is part of the
+        ETag and Last-Modified is never older than the start of the day.
+        """
+        if dated:
+            today = date.today()
+            variant = f'{variant}|{today.isoformat()}'
+        digest = hashlib.sha1(f'{cls.code_version()}|{variant}'.encode())
+        newest = int(datetime.combine(today, time.min).timestamp()) * 1_000_000_000 if dated else None
+        for source in sources:
+            for path, mtime_ns, size in cls._stat(source):
+                digest.update(f'{path}:{mtime_ns}:{size};'.encode())
+                if mtime_ns >= 0 and (newest is None or mtime_ns > newest):
+                    newest = mtime_ns
+        last_modified = (
+            datetime.fromtimestamp(newest // 1_000_000_000, tz=timezone.utc) if newest is not None else None
+        )
+        return digest.hexdigest(), last_modified
+
+    @staticmethod
+    def _not_modified(etag, last_modified):
+        response = make_response('', 304)
+        response.set_etag(etag)
+        if last_modified:
+            response.last_modified = last_modified
+        return response
+
+    @classmethod
+    def cached(cls, sources, dated=False):
+        """Decorate a GET view whose output depends only on the files returned by sources()
+
+        dated=True for views that also depend on the current date
+        (e.g. counts of items created today).
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                etag, last_modified = cls.validators(sources(), request.full_path, dated)
+                if request.if_none_match:
+                    if request.if_none_match.contains_weak(etag):
+                        return cls._not_modified(etag, last_modified)
+                elif request.if_modified_since and last_modified and last_modified <= request.if_modified_since:
+                    return cls._not_modified(etag, last_modified)
+
+                response = make_response(view(*args, **kwargs))
+                if response.status_code == 200:
+                    response.set_etag(etag)
+                    if last_modified:
+                        response.last_modified = last_modified
+                    # Let clients keep the body but revalidate it on every use
+                    response.cache_control.no_cache = True
+                return response
+            return wrapper
+        return decorator
@@ -0,0 +1,206 @@
+import os
+import stat
+import pickle
+import tempfile
+import threading
+from functools import partial
+from middleware.conditional import ConditionalGet
+from middleware.admission import AdmissionControl
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class _Call:
+    """One in-flight computation that followers wait on"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesce identical concurrent reconciliations into one computation
+
+    Calls are keyed by reconciliation name and input fingerprint. Within a
+    worker, followers wait for the leader thread and share its result.
+    Across gunicorn workers, leaders serialize on a lock file per key and
+    the first one leaves its result next to the lock, so the others pick
+    it up instead of recomputing. Each worker marks itself as waiting on a
+    key, and whichever finishes last removes the lock and result files.
+    The files live in LOCK_DIR, which must be private to the app's user
+    (mode 0700) since results are unpickled from it; otherwise, or without
+    fcntl (e.g. on Windows), only the in-process coalescing applies.
+
+    Calls made with retain=True also keep their latest result in memory
+    per worker, one per name, until their inputs or the code change. The
+    routes retain only the default reconciliations, which is what lets a
+    warmup precompute them, and never samples, windows or projections.
+    Retained results are kept pickled, so each caller gets its own copy.
+    """
+
+    LOCK_DIR = os.environ.get('REVENUEFIX_SINGLE_FLIGHT_DIR') or os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'assets', 'single_flight'
+    )
+
+    _lock = threading.Lock()
+    _calls = {}
+    # Name -> (key, pickled result) of the latest retain=True call
+    _retained = {}
+
+    @classmethod
+    def run(cls, name, sources, fn, admission=None, retain=False):
+        """Return fn() for this name and inputs, sharing one computation between concurrent callers
+
+        admission names the AdmissionControl class fn runs under. Only the
+        caller that computes is admitted; followers, in this worker or
+        another, wait for its result without taking a slot. retain keeps
+        the result for later calls with the same inputs.
+        """
+        key = f'{name}-{ConditionalGet.validators(sources)[0]}'
+        with cls._lock:
+            retained = cls._retained.get(name)
+        if retained and retained[0] == key:
+            return pickle.loads(retained[1])
+        with cls._lock:
+            call = cls._calls.get(key)
+            leader = call is None
+            if leader:
+                call = cls._calls[key] = _Call()
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        if admission:
+            fn = partial(AdmissionControl.run, admission, sources, fn)
+        try:
+            call.result = cls._run_across_workers(key, fn)
+            if retain:
+                cls._retain(name, key, call.result)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with cls._lock:
+                cls._calls.pop(key, None)
+            call.event.set()
+
+    @classmethod
+    def _retain(cls, name, key, result):
+        try:
+            pickled = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+        except (pickle.PickleError, TypeError, AttributeError) as e:
+            print(f"Not retaining single-flight result {key}: {e}")
+            return
+        with cls._lock:
+            cls._retained[name] = (key, pickled)
+
+    @classmethod
+    def _private_dir(cls):
+        """LOCK_DIR, created with mode 0700, or None when it is not private to this user"""
+        try:
+            os.makedirs(cls.LOCK_DIR, mode=0o700, exist_ok=True)
+            info = os.lstat(cls.LOCK_DIR)
+            if stat.S_ISDIR(info.st_mode) and info.st_uid == os.getuid() and info.st_mode & 0o077:
+                os.chmod(cls.LOCK_DIR, 0o700)
+                info = os.lstat(cls.LOCK_DIR)
+        except OSError as e:
+            print(f"Not sharing single-flight results across workers: {e}")
+            return None
+        if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+            print(f"Not sharing single-flight results across workers: {cls.LOCK_DIR} is not a directory private to this user")
+            return None
+        return cls.LOCK_DIR
+
+    @classmethod
+    def _run_across_workers(cls, key, fn):
+        directory = cls._private_dir() if fcntl is not None else None
+        if directory is None:
+            return fn()
+
+        base = os.path.join(directory, key)
+        lock_path, result_path, waiter_path = f'{base}.lock', f'{base}.result', f'{base}.{os.getpid()}.wait'
+        os.close(os.open(waiter_path, os.O_WRONLY | os.O_CREAT, 0o600))
+        try:
+            while True:
+                with open(os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o600), 'r+') as lock_file:
+                    # Blocks while another worker computes the same key
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                    if not cls._same_file(lock_file, lock_path):
+                        # The previous holder removed the lock file while this worker waited on it
+                        continue
+                    try:
+                        found, result = cls._read_result(result_path)
+                        if not found:
+                            result = fn()
+                            cls._write_result(directory, result_path, result)
+                        return result
+                    finally:
+                        cls._remove(waiter_path)
+                        if not cls._waiting(directory, key):
+                            cls._remove(result_path)
+                            cls._remove(lock_path)
+        finally:
+            cls._remove(waiter_path)
+
+    @staticmethod
+    def _same_file(file, path):
+        try:
+            info = os.stat(path)
+        except OSError:
+            return False
+        opened = os.fstat(file.fileno())
+        return (info.st_dev, info.st_ino) == (opened.st_dev, opened.st_ino)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    @classmethod
+    def _waiting(cls, directory, key):
+        """Whether another live worker is waiting on key; markers of dead workers are removed"""
+        prefix = f'{key}.'
+        for name in os.listdir(directory):
+            pid = name[len(prefix):-len('.wait')]
+            if not (name.startswith(prefix) and name.endswith('.wait') and pid.isdigit()):
+                continue
+            try:
+                os.kill(int(pid), 0)
+            except ProcessLookupError:
+                cls._remove(os.path.join(directory, name))
+                continue
+            except OSError:
+                pass
+            return True
+        return False
+
+    @staticmethod
+    def _read_result(path):
+        try:
+            with open(path, 'rb') as f:
+                return True, pickle.load(f)
+        except (OSError, pickle.PickleError, EOFError):
+            return False, None
+
+    @classmethod
+    def _write_result(cls, directory, path, result):
+        temp_path = None
+        try:
+            fd, temp_path = tempfile.mkstemp(suffix='.tmp', dir=directory)
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, path)
+        except (OSError, pickle.PickleError) as e:
+            if temp_path:
+                cls._remove(temp_path)
+            print(f"Error sharing single-flight result {path}: {e}")
@@ -3,9 +3,13 @@ import numpy as np # type: ignore
 import os
 import json
 from datetime import datetime, timedelta
-from collections import defaultdict
 import random
 from pathlib import Path
+from models.leakage import LeakageModel
+from models.reconciliation_aggregates import ReconciliationAggregates
+from models.rule_engine import RuleEngine
+from models.sql_reconciliation import SqlReconciliation
+from models.merge_guard import MergeGuard, MemoryBudgetExceeded
 # import tensorflow as tf # type: ignore
 # from sklearn.ensemble import RandomForestClassifier
 # from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score
@@ -14,6 +18,18 @@ from pathlib import Path
 
 class DataProcessor:
     """Process CSV data files and generate analytics with ML and TensorFlow"""
+
+    ASSETS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'assets')
+    CRM_BILLING_FILES = (
+        os.path.join(ASSETS_DIR, 'CRM_100.csv'),
+        os.path.join(ASSETS_DIR, 'Billing_CRM_100.csv')
+    )
+
+    # Full-row duplicate subsets of each side, and the dedupe subset and keys of the CRM/Billing merge
+    CRM_DUPLICATE_SUBSET = ['Account_ID', 'Customer_ID', 'Account_Status', 'BUS_ENT', 'Account_Start_Date', 'MSISDN', 'Bill_Plan', 'Plan_Name', 'Monthly Recurring Charge', 'Service_ID', 'Service_Name', 'Service_Start_Date', 'Service_End_Date']
+    BILLING_DUPLICATE_SUBSET = ['Account_ID', 'Customer_ID', 'Account_Status', 'Ent_Residence', 'Account_Start_Date', 'MSISDN', 'BillPlan_ID', 'BillPlan_Name', 'Charge', 'Service_ID', 'Service_Name', 'Service_Start_Date', 'Service_End_Date']
+    CRM_DEDUPE_SUBSET = ['Account_ID', 'Customer_ID', 'Account_Status']
+    CRM_MERGE_KEYS = ['Account_ID', 'Customer_ID', 'MSISDN']
     
     @staticmethod
     def load_csv(file_path):
@@ -27,52 +43,72 @@ class DataProcessor:
             return pd.DataFrame()
      
     @staticmethod
-    def get_crm_billing_analytics():
-        """Process CRM and Billing data for reconciliation"""
+    def get_crm_billing_analytics(files=None, engine=None):
+        """Process CRM and Billing data for reconciliation; files=(crm, billing) overrides the bundled assets
+
+        engine=duckdb loads, deduplicates and merges the files in SQL (SqlReconciliation).
+        Only the bundled assets fall back to dummy data; given files that are
+        missing or cannot be reconciled raise.
+        """
         
         # print("CSV files:", crm_file, billing_file)
         """Process CRM and Billing data for reconciliation using both ML and TensorFlow"""
-        curr_dir = os.path.dirname(os.path.abspath(__file__))
-        crm_file = os.path.join(curr_dir, '..', 'assets', 'CRM_100.csv')
-        billing_file = os.path.join(curr_dir, '..', 'assets', 'Billing_CRM_100.csv')
+        crm_file, billing_file = files or DataProcessor.CRM_BILLING_FILES
         print("CSV files:", crm_file, billing_file)
         
         try:
             # Check if files exist
             if not os.path.exists(crm_file) or not os.path.exists(billing_file):
+                if files:
+                    raise FileNotFoundError(f"CSV files not found: {crm_file}, {billing_file}")
                 print("CSV files not found, using dummy data")
                 return DataProcessor.generate_dummy_crm_billing_data()
             
-            # Load CSV files
-            crm_df = pd.read_csv(crm_file)
-            billing_df = pd.read_csv(billing_file)
-            total_inc_duplicates = int(max(crm_df.shape[0], billing_df.shape[0]))
-            
-            # Clean and prepare data
-            # Remove leading/trailing spaces from column names
-            crm_df.columns = crm_df.columns.str.strip()
-            billing_df.columns = billing_df.columns.str.strip()
-            
-            # Identify duplicate rows in CRM and Billing
-            crm_duplicates = crm_df.duplicated(subset=['Account_ID', 'Customer_ID', 'Account_Status', 'BUS_ENT', 'Account_Start_Date', 'MSISDN', 'Bill_Plan', 'Plan_Name', 'Monthly Recurring Charge', 'Service_ID', 'Service_Name', 'Service_Start_Date', 'Service_End_Date']).sum()
-            billing_duplicates = billing_df.duplicated(subset=['Account_ID', 'Customer_ID', 'Account_Status', 'Ent_Residence', 'Account_Start_Date', 'MSISDN', 'BillPlan_ID', 'BillPlan_Name', 'Charge', 'Service_ID', 'Service_Name', 'Service_Start_Date', 'Service_End_Date']).sum()
-            total_duplicates = int(crm_duplicates + billing_duplicates)
-            # Convert to TensorFlow datasets for manual calculations
-            # crm_tensor = tf.convert_to_tensor(crm_df.values)
-            # billing_tensor = tf.convert_to_tensor(billing_df.values)
-            
-            # Remove duplicates for analysis
-            crm_df = crm_df.drop_duplicates(subset=['Account_ID', 'Customer_ID', 'Account_Status'])
-            billing_df = billing_df.drop_duplicates(subset=['Account_ID', 'Customer_ID', 'Account_Status'])
-            
-            # Merge datasets on common keys for comparison
-            merged_df = pd.merge(
-                crm_df, 
-                billing_df, 
-                on=['Account_ID', 'Customer_ID', 'MSISDN'], 
-                how='inner',
-                suffixes=('_crm', '_billing')
-            )
+            engine = SqlReconciliation.engine(engine)
+            if engine == 'duckdb':
+                crm_merge = SqlReconciliation.crm_merge(
+                    (crm_file, billing_file),
+                    (DataProcessor.CRM_DUPLICATE_SUBSET, DataProcessor.BILLING_DUPLICATE_SUBSET),
+                    DataProcessor.CRM_DEDUPE_SUBSET,
+                    DataProcessor.CRM_MERGE_KEYS
+                )
+                merged_df = crm_merge['merged']
+                total_inc_duplicates = crm_merge['total_inc_duplicates']
+                total_duplicates = crm_merge['total_duplicates']
+                crm_records, billing_records = crm_merge['crm_records'], crm_merge['billing_records']
+            else:
+                # Load CSV files
+                crm_df = pd.read_csv(crm_file)
+                billing_df = pd.read_csv(billing_file)
+                total_inc_duplicates = int(max(crm_df.shape[0], billing_df.shape[0]))
+
+                # Clean and prepare data
+                # Remove leading/trailing spaces from column names
+                crm_df.columns = crm_df.columns.str.strip()
+                billing_df.columns = billing_df.columns.str.strip()
+
+                # Identify duplicate rows in CRM and Billing
+                crm_duplicates = crm_df.duplicated(subset=DataProcessor.CRM_DUPLICATE_SUBSET).sum()
+                billing_duplicates = billing_df.duplicated(subset=DataProcessor.BILLING_DUPLICATE_SUBSET).sum()
+                total_duplicates = int(crm_duplicates + billing_duplicates)
+                # Convert to TensorFlow datasets for manual calculations
+                # crm_tensor = tf.convert_to_tensor(crm_df.values)
+                # billing_tensor = tf.convert_to_tensor(billing_df.values)
+
+                # Remove duplicates for analysis
+                crm_df = crm_df.drop_duplicates(subset=DataProcessor.CRM_DEDUPE_SUBSET)
+                billing_df = billing_df.drop_duplicates(subset=DataProcessor.CRM_DEDUPE_SUBSET)
+                crm_records, billing_records = len(crm_df), len(billing_df)
+
+                # Merge datasets on common keys for comparison; the whole merge is used, so it must fit
+                MergeGuard.check(crm_df, billing_df, DataProcessor.CRM_MERGE_KEYS, label='CRM/Billing merge')
+                merged_df = pd.merge(
+                    crm_df,
+                    billing_df,
+                    on=DataProcessor.CRM_MERGE_KEYS,
+                    how='inner',
+                    suffixes=('_crm', '_billing')
+                )
             # Save the merged DataFrame to a temporary CSV file
             # temp_file_path = os.path.join(assets_dir, 'temp.csv')
             # crm_df.to_csv(temp_file_path, index=False)
@@ -209,15 +245,8 @@ class DataProcessor:
             # tf_start_date_invalid = tf_results['start_date_invalid'].numpy()
             # tf_account_service_status_invalid = tf_results['account_service_status_invalid'].numpy()
             
-            # Calculate manual results for comparison
-            manual_account_status_mismatches = merged_df['Account_Status_crm'] != merged_df['Account_Status_billing']
-            manual_bill_plan_mismatches = merged_df['Plan_Name'] != merged_df['BillPlan_Name']
-            manual_ent_residence_mismatches = merged_df['BUS_ENT'] != merged_df['Ent_Residence']
-            
-            # Convert dates for comparison
-            manual_account_start_dates = pd.to_datetime(merged_df['Account_Start_Date_crm'])
-            manual_service_start_dates = pd.to_datetime(merged_df['Service_Start_Date_crm'])
-            manual_start_date_invalid = manual_account_start_dates > manual_service_start_dates
+            # Precompute one boolean column per validation rule
+            rules = DataProcessor.build_crm_billing_rules(merged_df)
             
             # Compare ML and TensorFlow results
             comparison_df = pd.DataFrame({
@@ -226,13 +255,13 @@ class DataProcessor:
                 'MSISDN': merged_df['MSISDN'],
                 'ML_Valid': 0,
                 # 'TF_Account_Status_Mismatch': tf_account_status_mismatches,
-                'Manual_Account_Status_Mismatch': manual_account_status_mismatches,
+                'Manual_Account_Status_Mismatch': rules['account_status_mismatch'],
                 # 'TF_Bill_Plan_Mismatch': tf_bill_plan_mismatches,
-                'Manual_Bill_Plan_Mismatch': manual_bill_plan_mismatches,
+                'Manual_Bill_Plan_Mismatch': rules['bill_plan_mismatch'],
                 # 'TF_Ent_Residence_Mismatch': tf_ent_residence_mismatches,
-                'Manual_Ent_Residence_Mismatch': manual_ent_residence_mismatches,
+                'Manual_Ent_Residence_Mismatch': rules['ent_residence_mismatch'],
                 # 'TF_Start_Date_Invalid': tf_start_date_invalid,
-                'Manual_Start_Date_Invalid': manual_start_date_invalid,
+                'Manual_Start_Date_Invalid': rules['start_date_invalid'],
                 # 'TF_Account_Service_Status_Invalid': tf_account_service_status_invalid,
             })
             
@@ -250,161 +279,71 @@ class DataProcessor:
             #     'Start_Date_Discrepancy': comparison_df['Start_Date_Discrepancy'].mean() * 100,
             # }
             
-            # Calculate mismatches based on manual calculations
-            bill_plan_mismatches = merged_df[merged_df['Plan_Name'] != merged_df['BillPlan_Name']]
-            account_status_mismatches = merged_df[merged_df['Account_Status_crm'] != merged_df['Account_Status_billing']]
-            crm_active_billing_inactive = merged_df[(merged_df['Account_Status_crm'] == 'A') & (merged_df['Account_Status_billing'] == 'INA')].shape[0]
-            crm_inactive_billing_active = merged_df[(merged_df['Account_Status_crm'] == 'INA') & (merged_df['Account_Status_billing'] == 'A')].shape[0]
+            # One grouped pass over the rule columns yields the breakdowns,
+            # account status cross-counts and validation totals together
+            rule_counts = DataProcessor.aggregate_crm_billing_rules(merged_df, rules)
+            totals = rule_counts['totals']
+            crm_active_billing_inactive = totals['crm_active_billing_inactive']
+            crm_inactive_billing_active = totals['crm_inactive_billing_active']
+            bill_plan_mismatch_count = totals['bill_plan_mismatch']
+            account_status_mismatch_count = totals['account_status_mismatch']
+            start_date_mismatch_count = totals['start_date_mismatch']
             
-            # Start Date mismatches
-            start_date_mismatches = merged_df[merged_df['Account_Start_Date_crm'] != merged_df['Account_Start_Date_billing']]
-            
-            # Enterprise category breakdown
-            enterprise_breakdown = []
-            for category in merged_df['BUS_ENT'].unique():
-                category_df = merged_df[merged_df['BUS_ENT'] == category]
-                category_bill_plan_mismatches = category_df[category_df['Plan_Name'] != category_df['BillPlan_Name']].shape[0]
-                category_crm_active_billing_inactive = category_df[(category_df['Account_Status_crm'] == 'A') & (category_df['Account_Status_billing'] == 'INA')].shape[0]
-                category_crm_inactive_billing_active = category_df[(category_df['Account_Status_crm'] == 'INA') & (category_df['Account_Status_billing'] == 'A')].shape[0]
-                
-                enterprise_breakdown.append({
-                    'category': category,
-                    'mismatched_bill_plans': category_bill_plan_mismatches,
-                    'crm_active_billing_inactive': category_crm_active_billing_inactive,
-                    'crm_inactive_billing_active': category_crm_inactive_billing_active,
-                    'total_accounts': category_df.shape[0]
-                })
-            
-            # Mismatched accounts for display
-            mismatched_accounts = []
-            mismatch_trend = defaultdict(int)
-            # Add bill plan mismatches
-            for _, row in bill_plan_mismatches.iterrows():
-                existing_account = next((acc for acc in mismatched_accounts if acc['msisdn'] == row['MSISDN']), None)
-                if existing_account:
-                    existing_account['mismatch_type'].append('Bill Plan')
-                    temp_date = datetime.strptime(row['Account_Start_Date_crm'], '%m/%d/%Y')
-                    month = f"{temp_date.month}/{temp_date.year}"
-                    mismatch_trend[month] += 1
-                else:
-                    mismatched_accounts.append({
-                        'customer_id': row['Customer_ID'],
-                        'account_id': row['Account_ID'],
-                        'msisdn': row['MSISDN'],
-                        'crm_status': row['Account_Status_crm'],
-                        'billing_status': row['Account_Status_billing'],
-                        'crm_bill_plan': row['Plan_Name'],
-                        'billing_bill_plan': row['BillPlan_Name'],
-                        'enterprise_category': row['Ent_Residence'],
-                        'crm_bill_start_date': row['Account_Start_Date_crm'],
-                        'billing_bill_start_date': row['Account_Start_Date_billing'],
-                        'mismatch_type': ['Bill Plan']
-                    })
-                    temp_date = datetime.strptime(row['Account_Start_Date_crm'], '%m/%d/%Y')
-                    month = f"{temp_date.month}/{temp_date.year}"
-                    mismatch_trend[month] += 1
-            
-            # Add account status mismatches
-            for _, row in account_status_mismatches.iterrows():
-                existing_account = next((acc for acc in mismatched_accounts if acc['msisdn'] == row['MSISDN']), None)
-                if existing_account:
-                    existing_account['mismatch_type'].append('Account Status')
-                    temp_date = datetime.strptime(row['Account_Start_Date_crm'], '%m/%d/%Y')
-                    month = f"{temp_date.month}/{temp_date.year}"
-                    mismatch_trend[month] += 1
-                else:
-                    mismatched_accounts.append({
-                        'customer_id': row['Customer_ID'],
-                        'account_id': row['Account_ID'],
-                        'msisdn': row['MSISDN'],
-                        'crm_status': row['Account_Status_crm'],
-                        'billing_status': row['Account_Status_billing'],
-                        'crm_bill_plan': row['Plan_Name'],
-                        'billing_bill_plan': row['BillPlan_Name'],
-                        'enterprise_category': row['Ent_Residence'],
-                        'crm_bill_start_date': row['Account_Start_Date_crm'],
-                        'billing_bill_start_date': row['Account_Start_Date_billing'],
-                        'mismatch_type': ['Account Status']
-                    })
-                    temp_date = datetime.strptime(row['Account_Start_Date_crm'], '%m/%d/%Y')
-                    month = f"{temp_date.month}/{temp_date.year}"
-                    mismatch_trend[month] += 1
-            
-            # Add start date mismatches
-            for _, row in start_date_mismatches.iterrows():
-                existing_account = next((acc for acc in mismatched_accounts if acc['msisdn'] == row['MSISDN']), None)
-                if existing_account:
-                    existing_account['mismatch_type'].append('Bill Start Date')
-                    temp_date = datetime.strptime(row['Account_Start_Date_crm'], '%m/%d/%Y')
-                    month = f"{temp_date.month}/{temp_date.year}"
-                    mismatch_trend[month] += 1
-                else:
-                    mismatched_accounts.append({
-                        'customer_id': row['Customer_ID'],
-                        'account_id': row['Account_ID'],
-                        'msisdn': row['MSISDN'],
-                        'crm_status': row['Account_Status_crm'],
-                        'billing_status': row['Account_Status_billing'],
-                        'crm_bill_plan': row['Plan_Name'],
-                        'billing_bill_plan': row['BillPlan_Name'],
-                        'enterprise_category': row['Ent_Residence'],
-                        'crm_bill_start_date': row['Account_Start_Date_crm'],
-                        'billing_bill_start_date': row['Account_Start_Date_billing'],
-                        'mismatch_type': ['Bill Start Date']
-                    })
-                    temp_date = datetime.strptime(row['Account_Start_Date_crm'], '%m/%d/%Y')
-                    month = f"{temp_date.month}/{temp_date.year}"
-                    mismatch_trend[month] += 1
+            # Mismatched accounts for display and monthly mismatch trend
+            mismatched_accounts, trend_data = DataProcessor.aggregate_mismatched_accounts(
+                merged_df,
+                rules['bill_plan_mismatch'],
+                rules['account_status_mismatch'],
+                rules['start_date_mismatch']
+            )
 
-            # Process mismatched records to calculate monthly mismatch trend
-            trend_data = [{'date': i, 'value': mismatch_trend[i]} for i in mismatch_trend.keys()]
+            # Monetary impact per account, per mismatch type and per start month
+            leakage_records = LeakageModel.value_crm_mismatches(merged_df, rules)
+            account_leakage = leakage_records.groupby('record')['value'].sum().round(2).to_dict()
+            for account in mismatched_accounts:
+                account['leakage_value'] = account_leakage.get(account['msisdn'], 0.0)
+            leakage = LeakageModel.summarize(
+                [leakage_records],
+                categories=[label for _, label in DataProcessor.MISMATCH_TYPES]
+            )
+            # Offline (files=) runs stay out of the dashboard aggregates
+            if not files:
+                ReconciliationAggregates.record_leakage('crm_billing', crm_records, billing_records, leakage)
 
             # Calculate total accounts and mismatch percentage
-            total_accounts = merged_df.shape[0]
-            total_mismatches = bill_plan_mismatches.shape[0] + account_status_mismatches.shape[0] + start_date_mismatches.shape[0]
+            total_accounts = totals['total_accounts']
+            total_mismatches = bill_plan_mismatch_count + account_status_mismatch_count + start_date_mismatch_count
             mismatch_percentage = (total_mismatches / total_accounts) * 100 if total_accounts > 0 else 0
             
             # Generate visualization data
             mismatch_visualization = [
-                {'name': 'Bill Plan Mismatches', 'value': bill_plan_mismatches.shape[0]},
-                {'name': 'Account Status Mismatches', 'value': account_status_mismatches.shape[0]},
-                {'name': 'Start Date Mismatches', 'value': start_date_mismatches.shape[0]}
+                {'name': 'Bill Plan Mismatches', 'value': bill_plan_mismatch_count},
+                {'name': 'Account Status Mismatches', 'value': account_status_mismatch_count},
+                {'name': 'Start Date Mismatches', 'value': start_date_mismatch_count}
             ]
         
             
             # Add validation results
-            validation_results = {
-                'account_status_match': {
-                    'description': 'Account Status validation',
-                    'valid_count': total_accounts - int(account_status_mismatches.shape[0]),
-                    'invalid_count': int(account_status_mismatches.shape[0]),
-                    'percentage_valid': ((total_accounts - account_status_mismatches.shape[0]) / total_accounts) * 100 if total_accounts > 0 else 0
-                },
-                'service_details_match': {
-                    'description': 'Account Start Date validation',
-                    'valid_count': total_accounts - int(start_date_mismatches.shape[0]),
-                    'invalid_count': int(start_date_mismatches.shape[0]),
-                    'percentage_valid': ((total_accounts - start_date_mismatches.shape[0]) / total_accounts) * 100 if total_accounts > 0 else 0
-                },
-                'bill_plan_match': {
-                    'description': 'Bill Plan validation',
-                    'valid_count': total_accounts - int(bill_plan_mismatches.shape[0]),
-                    'invalid_count': int(bill_plan_mismatches.shape[0]),
-                    'percentage_valid': ((total_accounts - bill_plan_mismatches.shape[0]) / total_accounts) * 100 if total_accounts > 0 else 0
-                },
-                'ent_residence_match': {
-                    'description': 'Enterprise / Residence validation',
-                    'valid_count': total_accounts - int(manual_ent_residence_mismatches.sum()),
-                    'invalid_count': int(manual_ent_residence_mismatches.sum()),
-                    'percentage_valid': ((total_accounts - manual_ent_residence_mismatches.sum()) / total_accounts) * 100 if total_accounts > 0 else 0
-                },
-                'account_service_start_date': {
-                    'description': 'Service Start Date validation',
-                    'valid_count': total_accounts - int(manual_start_date_invalid.sum()),
-                    'invalid_count': int(manual_start_date_invalid.sum()),
-                    'percentage_valid': ((total_accounts - manual_start_date_invalid.sum()) / total_accounts) * 100 if total_accounts > 0 else 0
+            validation_results = {}
+            for key, (description, rule) in DataProcessor.CRM_BILLING_VALIDATIONS.items():
+                invalid_count = totals[rule]
+                validation_results[key] = {
+                    'description': description,
+                    'valid_count': total_accounts - invalid_count,
+                    'invalid_count': invalid_count,
+                    'percentage_valid': ((total_accounts - invalid_count) / total_accounts) * 100 if total_accounts > 0 else 0
                 }
-            }
+
+            # Every configured rule, including ones added without code changes
+            rule_results = [
+                {
+                    'name': rule['name'],
+                    'category': rule['category'],
+                    'reason': rule['reason'],
+                    'count': totals[rule['name']]
+                }
+                for rule in RuleEngine.rules('crm_billing')
+            ]
             
             # Add ML vs TensorFlow comparison
             ml_tf_comparison = {
@@ -415,9 +354,9 @@ class DataProcessor:
             return {
                 'summary': {
                     'total_accounts': total_inc_duplicates - int(total_duplicates//2),  # Exclude duplicates in total count
-                    'mismatched_bill_plans': bill_plan_mismatches.shape[0],
-                    'mismatched_account_status': account_status_mismatches.shape[0],
-                    'mismatched_start_dates': start_date_mismatches.shape[0],
+                    'mismatched_bill_plans': bill_plan_mismatch_count,
+                    'mismatched_account_status': account_status_mismatch_count,
+                    'mismatched_start_dates': start_date_mismatch_count,
                     'duplicate_records': total_duplicates,
                     'mismatch_percentage': round(mismatch_percentage, 2),
                     'mismatched_accounts': len(mismatched_accounts)
@@ -426,20 +365,173 @@ class DataProcessor:
                     'crm_active_billing_inactive': crm_active_billing_inactive,
                     'crm_inactive_billing_active': crm_inactive_billing_active
                 },
-                'enterprise_breakdown': enterprise_breakdown,
+                'enterprise_breakdown': rule_counts['breakdowns']['enterprise_breakdown'],
+                'plan_breakdown': rule_counts['breakdowns']['plan_breakdown'],
+                'service_breakdown': rule_counts['breakdowns']['service_breakdown'],
                 'trend_data': trend_data,
+                'leakage': leakage,
                 'mismatched_accounts': mismatched_accounts,
                 'mismatch_visualization': mismatch_visualization,
                 'validation_results': validation_results,
+                'rule_results': rule_results,
                 'ml_tf_comparison': ml_tf_comparison
             }
             
+        except MemoryBudgetExceeded:
+            # Dummy data would hide an input that needs fixing
+            raise
         except Exception as e:
             print(f"(Error processing CRM vs Billing data): {e}")
             import traceback
             traceback.print_exc()
+            if files:
+                # Given inputs (e.g. a batch run) must fail rather than report dummy data
+                raise
             return DataProcessor.generate_dummy_crm_billing_data()
     
+    # validation_results key -> (description, rule column)
+    CRM_BILLING_VALIDATIONS = {
+        'account_status_match': ('Account Status validation', 'account_status_mismatch'),
+        'service_details_match': ('Account Start Date validation', 'start_date_mismatch'),
+        'bill_plan_match': ('Bill Plan validation', 'bill_plan_mismatch'),
+        'ent_residence_match': ('Enterprise / Residence validation', 'ent_residence_mismatch'),
+        'account_service_start_date': ('Service Start Date validation', 'start_date_invalid')
+    }
+
+    # Response key -> merged column used for each breakdown dimension
+    CRM_BILLING_BREAKDOWNS = {
+        'enterprise_breakdown': 'BUS_ENT',
+        'plan_breakdown': 'Plan_Name',
+        'service_breakdown': 'Service_Name_crm'
+    }
+
+    @staticmethod
+    def build_crm_billing_rules(merged_df):
+        """Evaluate every CRM vs Billing rule once, as one boolean column each
+
+        The rules are declared in config/mismatch_rules.json (crm_billing).
+        """
+        return RuleEngine.evaluate('crm_billing', merged_df)
+
+    @staticmethod
+    def aggregate_crm_billing_rules(merged_df, rules, breakdowns=None):
+        """Count rule violations overall and per breakdown dimension in one pass
+
+        The rule columns are summed once, grouped by every breakdown column
+        together; the overall totals and each individual breakdown are then
+        rolled up from that small grouped table, so adding a dimension does
+        not add a scan over the merged rows.
+        """
+        breakdowns = breakdowns or DataProcessor.CRM_BILLING_BREAKDOWNS
+        dimensions = list(dict.fromkeys(breakdowns.values()))
+
+        counts = rules.astype(np.int64)
+        counts['total_accounts'] = 1
+        for column in dimensions:
+            counts[column] = merged_df[column]
+        grouped = counts.groupby(dimensions, sort=False, dropna=False).sum()
+
+        totals = {column: int(grouped[column].sum()) for column in grouped.columns}
+
+        breakdown_results = {}
+        for key, column in breakdowns.items():
+            rollup = grouped.groupby(level=column, sort=False, dropna=False).sum()
+            breakdown_results[key] = [
+                {
+                    'category': None if pd.isna(category) else category,
+                    'mismatched_bill_plans': int(row['bill_plan_mismatch']),
+                    'crm_active_billing_inactive': int(row['crm_active_billing_inactive']),
+                    'crm_inactive_billing_active': int(row['crm_inactive_billing_active']),
+                    'total_accounts': int(row['total_accounts'])
+                }
+                for category, row in rollup.iterrows()
+            ]
+
+        return {'totals': totals, 'breakdowns': breakdown_results}
+
+    # Mismatch type bits, in the order they are reported per account
+    MISMATCH_TYPES = [
+        (1, 'Bill Plan'),
+        (2, 'Account Status'),
+        (4, 'Bill Start Date')
+    ]
+
+    @staticmethod
+    def aggregate_mismatched_accounts(merged_df, bill_plan_mask, account_status_mask, start_date_mask):
+        """Group per-row CRM vs Billing mismatches into one entry per MSISDN
+
+        Each row gets a bitmask of its mismatch types; rows are then reduced
+        per MSISDN in a single groupby. The account details come from the
+        first row of the highest-priority mismatch type (bill plan, then
+        account status, then start date), matching the display order.
+        Returns (mismatched_accounts, trend_data).
+        """
+        masks = [bill_plan_mask, account_status_mask, start_date_mask]
+        mismatch_bits = np.zeros(len(merged_df), dtype=np.int8)
+        for (bit, _), mask in zip(DataProcessor.MISMATCH_TYPES, masks):
+            mismatch_bits |= np.where(mask.to_numpy(), bit, 0).astype(np.int8)
+
+        flagged = merged_df.loc[mismatch_bits > 0, [
+            'Customer_ID', 'Account_ID', 'MSISDN', 'Account_Status_crm', 'Account_Status_billing',
+            'Plan_Name', 'BillPlan_Name', 'Ent_Residence', 'Account_Start_Date_crm', 'Account_Start_Date_billing'
+        ]].copy()
+        if flagged.empty:
+            return [], []
+        flagged_bits = mismatch_bits[mismatch_bits > 0]
+        flagged['mismatch_bits'] = flagged_bits
+        # Lowest set bit decides which mismatch type "introduced" the account
+        flagged['first_type'] = np.log2(flagged_bits & -flagged_bits).astype(np.int8)
+        flagged['position'] = np.arange(len(flagged))
+
+        # OR the bitmasks per MSISDN via a max over each bit (cythonized groupby)
+        bit_flags = pd.DataFrame(
+            {bit: (flagged_bits & bit).astype(np.int8) for bit, _ in DataProcessor.MISMATCH_TYPES},
+            index=flagged.index
+        )
+        bit_flags['MSISDN'] = flagged['MSISDN']
+        account_bits = bit_flags.groupby('MSISDN', sort=False).max().sum(axis=1)
+        accounts = (
+            flagged.sort_values(['first_type', 'position'], kind='stable')
+            .drop_duplicates(subset=['MSISDN'], keep='first')
+        )
+        accounts['mismatch_bits'] = accounts['MSISDN'].map(account_bits)
+
+        type_labels = {
+            bits: [label for bit, label in DataProcessor.MISMATCH_TYPES if bits & bit]
+            for bits in range(1, 1 << len(DataProcessor.MISMATCH_TYPES))
+        }
+        accounts = accounts.rename(columns={
+            'Customer_ID': 'customer_id',
+            'Account_ID': 'account_id',
+            'MSISDN': 'msisdn',
+            'Account_Status_crm': 'crm_status',
+            'Account_Status_billing': 'billing_status',
+            'Plan_Name': 'crm_bill_plan',
+            'BillPlan_Name': 'billing_bill_plan',
+            'Ent_Residence': 'enterprise_category',
+            'Account_Start_Date_crm': 'crm_bill_start_date',
+            'Account_Start_Date_billing': 'billing_bill_start_date'
+        })
+        mismatched_accounts = accounts.drop(columns=['mismatch_bits', 'first_type', 'position']).to_dict('records')
+        for account, bits in zip(mismatched_accounts, accounts['mismatch_bits'].tolist()):
+            account['mismatch_type'] = list(type_labels[bits])
+
+        # Every mismatch type on a row counts once towards its start month
+        type_count = np.zeros(len(flagged), dtype=np.int64)
+        for bit, _ in DataProcessor.MISMATCH_TYPES:
+            type_count += (flagged_bits & bit) > 0
+        start_dates = pd.to_datetime(flagged['Account_Start_Date_crm'], format='%m/%d/%Y', errors='coerce')
+        trend = (
+            pd.DataFrame({'year': start_dates.dt.year, 'month': start_dates.dt.month, 'value': type_count})
+            .dropna(subset=['year'])
+            .groupby(['year', 'month'])['value'].sum()
+        )
+        trend_data = [
+            {'date': f"{int(month)}/{int(year)}", 'value': int(value)}
+            for (year, month), value in trend.items()
+        ]
+        return mismatched_accounts, trend_data
+
     @staticmethod
     def generate_dummy_crm_billing_data():
         """Generate dummy CRM vs Billing data with ML and TensorFlow comparison"""
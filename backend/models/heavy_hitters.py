@@ -0,0 +1,139 @@
+import heapq
+from operator import itemgetter
+import numpy as np # type: ignore
+import pandas as pd # type: ignore
+
+
+class CountMinSketch:
+    """Count-min sketch over string keys, updated a batch at a time
+
+    Counts are never underestimated; the overestimate is at most
+    e / width of the total count with probability 1 - exp(-depth).
+    """
+
+    def __init__(self, width=2048, depth=4):
+        self.width = width
+        self.depth = depth
+        self.total = 0
+        self.table = np.zeros((depth, width), dtype=np.int64)
+        # hash_pandas_object takes 16 character keys; one independent hash per row
+        self.hash_keys = [f'revenuefix-cms{row:02d}' for row in range(depth)]
+
+    def _buckets(self, keys):
+        return [
+            (pd.util.hash_pandas_object(keys, index=False, hash_key=hash_key).to_numpy() % self.width).astype(np.int64)
+            for hash_key in self.hash_keys
+        ]
+
+    def add(self, keys, counts):
+        """Add counts (array) for keys (string Series)"""
+        counts = np.asarray(counts, dtype=np.int64)
+        for row, buckets in enumerate(self._buckets(keys)):
+            np.add.at(self.table[row], buckets, counts)
+        self.total += int(counts.sum())
+
+    def estimate(self, keys):
+        buckets = self._buckets(keys)
+        return np.min([self.table[row][bucket] for row, bucket in enumerate(buckets)], axis=0)
+
+    def error_bound(self):
+        return int(np.ceil(np.e / self.width * self.total))
+
+    def merge(self, other):
+        self.table += other.table
+        self.total += other.total
+
+
+class HeavyHitters:
+    """Top-K keys by count: a count-min sketch plus a bounded candidate heap
+
+    Memory is the sketch table plus K candidates, whatever the number of
+    distinct keys. A key enters the candidates when its sketch estimate
+    beats the smallest one kept.
+    """
+
+    def __init__(self, k=20, width=2048, depth=4):
+        self.k = k
+        self.sketch = CountMinSketch(width, depth)
+        self.candidates = {}
+
+    def add(self, values):
+        """Count one occurrence of every value in an iterable or Series; nulls are skipped"""
+        counts = pd.Series(values).dropna().astype(str).value_counts(sort=False)
+        if counts.empty:
+            return
+        keys = pd.Series(counts.index, dtype=object)
+        self.sketch.add(keys, counts.to_numpy())
+
+        # Re-estimate the kept candidates together with this batch's keys
+        keys = pd.concat([keys, pd.Series(list(self.candidates), dtype=object)], ignore_index=True).drop_duplicates()
+        estimates = self.sketch.estimate(keys)
+        self.candidates = dict(heapq.nlargest(self.k, zip(keys.tolist(), estimates.tolist()), key=itemgetter(1)))
+
+    def merge(self, other):
+        """Fold in a sketch built over another chunk of the input"""
+        self.sketch.merge(other.sketch)
+        keys = pd.Series(list(dict.fromkeys(list(self.candidates) + list(other.candidates))), dtype=object)
+        if keys.empty:
+            return
+        estimates = self.sketch.estimate(keys)
+        self.candidates = dict(heapq.nlargest(self.k, zip(keys.tolist(), estimates.tolist()), key=itemgetter(1)))
+
+    def top(self):
+        return [
+            {'key': key, 'mismatches': int(count)}
+            for key, count in sorted(self.candidates.items(), key=itemgetter(1), reverse=True)
+        ]
+
+
+class TopOffenders:
+    """Streaming top-K of mismatches per MSISDN, Service ID and Usage Sub Type
+
+    Fed the mismatch frames of a reconciliation (ServicesModel.network_mismatches)
+    a chunk of rows at a time, before any of them become records, and
+    mergeable, so a reconciliation split into chunks can combine the
+    partial results.
+    """
+
+    # Response key -> columns holding the dimension, in order of preference
+    DIMENSIONS = {
+        'msisdn': ['MSISDN'],
+        'service_id': ['Service ID_Network', 'Service ID Network', 'Service ID'],
+        'usage_sub_type': ['Usage Sub Type_Network', 'Usage Sub Type Network', 'Usage Sub Type']
+    }
+
+    K = 20
+
+    # Rows counted at a time, bounding the temporary key strings
+    CHUNK_SIZE = 500000
+
+    def __init__(self, k=None):
+        self.k = k or self.K
+        self.hitters = {dimension: HeavyHitters(self.k) for dimension in self.DIMENSIONS}
+
+    @staticmethod
+    def _keys(series):
+        # Integer IDs read as floats next to NaNs would otherwise show as 15.0
+        return series.astype(str).str.replace(r'\.0$', '', regex=True).where(series.notna())
+
+    def add(self, df):
+        """Count the mismatched records of one DataFrame"""
+        for dimension, columns in self.DIMENSIONS.items():
+            column = next((column for column in columns if column in df.columns), None)
+            if column is None:
+                continue
+            for start in range(0, len(df), self.CHUNK_SIZE):
+                self.hitters[dimension].add(self._keys(df[column].iloc[start:start + self.CHUNK_SIZE]))
+
+    def merge(self, other):
+        for dimension, hitters in self.hitters.items():
+            hitters.merge(other.hitters[dimension])
+
+    def summary(self):
+        return {
+            'total_mismatches': int(self.hitters['msisdn'].sketch.total),
+            'k': self.k,
+            # Largest overcount of any listed count, with probability 1 - exp(-depth)
+            'error_bound': max(hitters.sketch.error_bound() for hitters in self.hitters.values()),
+            **{dimension: hitters.top() for dimension, hitters in self.hitters.items()}
+        }
@@ -0,0 +1,270 @@
+import os
+import numpy as np # type: ignore
+import pandas as pd # type: ignore
+
+
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'assets')
+
+
+class LeakageModel:
+    """Monetary valuation of reconciliation mismatches
+
+    CRM plans are priced from Plan_Charge.csv. Network services are priced
+    from Service_Charge.csv (Service_ID, Recurring_Charge) when that file
+    exists, otherwise from the price suffix in the service name
+    (e.g. basic_199). Records whose service has no known price are counted
+    as unpriced rather than guessed.
+    """
+
+    PLAN_CHARGE_FILE = os.path.join(ASSETS_DIR, 'Plan_Charge.csv')
+    SERVICE_CHARGE_FILE = os.path.join(ASSETS_DIR, 'Service_Charge.csv')
+    CHARGE_FILES = (PLAN_CHARGE_FILE, SERVICE_CHARGE_FILE)
+
+    # Days per billing cycle when pro-rating recurring charges
+    CYCLE_DAYS = 30
+
+    # Network record list -> (category label, valuation mode)
+    #   service:    the service charge, once per MSISDN/service/month
+    #   usage:      the service charge times the unbilled share of usage
+    #   difference: network service charge minus billed service charge
+    #   None:       billed, just inconsistent; counted but not valued
+    NETWORK_VALUATION = {
+        'mismatched_records': ('Mismatched Records', 'service'),
+        'account_status_mismatched_records': ('Account Status Mismatch', 'service'),
+        'transaction_mismatched_records': ('Transaction Mismatch', 'service'),
+        'msisdn_missing_records': ('Missing Records', 'service'),
+        'service_mismatched_records': ('Service Mismatch', 'difference'),
+        'download_mismatched_records': ('Volume Mismatch', 'usage'),
+        'count_mismatched_records': ('Count Mismatch', 'usage'),
+        'duration_mismatched_records': ('Duration Mismatch', 'usage'),
+        'transaction_date_mismatched_records': ('Transaction Date Mismatch', None)
+    }
+
+    _charge_cache = {}
+
+    @classmethod
+    def _load_charges(cls, file_path, key_column, value_column):
+        """Read a charge table into a Series, cached per file modification time"""
+        if not os.path.exists(file_path):
+            return pd.Series(dtype=float)
+        mtime = os.path.getmtime(file_path)
+        cached = cls._charge_cache.get(file_path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        df = pd.read_csv(file_path, encoding='utf-8-sig')
+        df.columns = df.columns.str.strip()
+        charges = pd.to_numeric(df[value_column], errors='coerce')
+        charges.index = df[key_column].astype(str).str.strip()
+        charges = charges[~charges.index.duplicated()]
+        cls._charge_cache[file_path] = (mtime, charges)
+        return charges
+
+    @classmethod
+    def plan_charges(cls):
+        """Recurring charge per Bill_Plan"""
+        return cls._load_charges(cls.PLAN_CHARGE_FILE, 'Bill_Plan', 'Recurring_Charge')
+
+    @classmethod
+    def service_charge(cls, service_ids, service_names):
+        """Recurring charge per record for the given service ID/name columns"""
+        charges = service_ids.astype(str).map(
+            cls._load_charges(cls.SERVICE_CHARGE_FILE, 'Service_ID', 'Recurring_Charge')
+        )
+        from_name = pd.to_numeric(
+            service_names.astype(str).str.extract(r'_(\d+(?:\.\d+)?)$', expand=False),
+            errors='coerce'
+        )
+        return charges.fillna(from_name).astype(float)
+
+    @staticmethod
+    def _first_column(df, candidates):
+        for column in candidates:
+            if column in df.columns:
+                return df[column]
+        return pd.Series(np.nan, index=df.index)
+
+    @classmethod
+    def value_network_frame(cls, df, mode, date_column, usage_column, charged=None):
+        """Vectorized monetary impact for one category of network records
+
+        charged holds the (msisdn, service, month) keys of earlier records
+        of the same category, which are not charged again.
+        """
+        if mode is None:
+            return pd.Series(0.0, index=df.index)
+
+        first = cls._first_column
+        service_ids = first(df, ['Service ID_Network', 'Service ID Network', 'Service ID'])
+        service_names = first(df, ['Service Name_Network', 'Service Name Network', 'Service Name'])
+        charge = cls.service_charge(service_ids, service_names)
+
+        if mode == 'usage':
+            network_usage = pd.to_numeric(first(df, [f'{usage_column}_Network', usage_column]), errors='coerce')
+            billing_usage = pd.to_numeric(first(df, [f'{usage_column}_Billing', f'Billing {usage_column}']), errors='coerce')
+            unbilled_share = ((network_usage - billing_usage) / network_usage).clip(lower=0, upper=1)
+            return charge * unbilled_share.fillna(0)
+
+        if mode == 'difference':
+            billing_ids = first(df, ['Service ID_Billing', 'Billing Service ID', 'Service ID Billing'])
+            billing_names = first(df, ['Service Name_Billing', 'Billing Service Name', 'Service Name Billing'])
+            billing_charge = cls.service_charge(billing_ids, billing_names)
+            difference = (charge - billing_charge).clip(lower=0)
+            value = difference.where(billing_charge.notna(), charge)
+        else:
+            value = charge
+
+        # A missing or unbilled service costs its charge once per cycle, not once per usage record
+        keys = cls.charge_keys(df, date_column)
+        if charged is not None and len(charged):
+            repeated = pd.concat([charged, keys], ignore_index=True).duplicated().to_numpy()[len(charged):]
+        else:
+            repeated = keys.duplicated().to_numpy()
+        return value.where(~repeated | value.isna(), 0.0)
+
+    @classmethod
+    def charge_keys(cls, df, date_column):
+        """MSISDN, service and month of each record: a recurring charge is due once per key"""
+        return pd.DataFrame({
+            'msisdn': cls._first_column(df, ['MSISDN']),
+            'service': cls._first_column(df, ['Service ID_Network', 'Service ID Network', 'Service ID']),
+            'month': cls.record_months(df, date_column)
+        }).reset_index(drop=True)
+
+    @classmethod
+    def record_months(cls, df, date_column):
+        dates = cls._first_column(df, [f'{date_column}_Network', date_column, f'{date_column} Network'])
+        return pd.to_datetime(dates, format='%m/%d/%Y %H:%M', errors='coerce').dt.to_period('M')
+
+    @classmethod
+    def record_keys(cls, df, date_column):
+        """Identity of a usage record, so one flagged in several categories counts once"""
+        first = cls._first_column
+        return (
+            first(df, ['MSISDN']).astype(str) + '|'
+            + first(df, ['Service ID_Network', 'Service ID Network', 'Service ID']).astype(str) + '|'
+            + first(df, [f'{date_column}_Network', date_column, f'{date_column} Network']).astype(str)
+        )
+
+    @classmethod
+    def value_crm_mismatches(cls, merged_df, rules):
+        """Vectorized monetary impact of CRM vs Billing mismatches
+
+        Bill plan mismatches lose the difference between the CRM and billed
+        plan charges, accounts active in CRM but inactive in billing lose
+        the whole CRM plan charge, and a later billing start date loses the
+        pro-rated charge for the unbilled days. Returns one row per merged
+        row and category with MSISDN (record), category, plan, month and value.
+        """
+        plans = cls.plan_charges()
+        crm_charge = merged_df['Bill_Plan'].astype(str).map(plans)
+        if 'Monthly Recurring Charge' in merged_df.columns:
+            crm_charge = crm_charge.fillna(pd.to_numeric(merged_df['Monthly Recurring Charge'], errors='coerce'))
+        billing_charge = merged_df['BillPlan_ID'].astype(str).map(plans)
+        if 'Charge' in merged_df.columns:
+            billing_charge = billing_charge.fillna(pd.to_numeric(merged_df['Charge'], errors='coerce'))
+
+        crm_start = pd.to_datetime(merged_df['Account_Start_Date_crm'], format='%m/%d/%Y', errors='coerce')
+        billing_start = pd.to_datetime(merged_df['Account_Start_Date_billing'], format='%m/%d/%Y', errors='coerce')
+        unbilled_days = (billing_start - crm_start).dt.days.clip(lower=0)
+
+        values = {
+            'Bill Plan': (rules['bill_plan_mismatch'], (crm_charge - billing_charge).clip(lower=0)),
+            'Account Status': (rules['crm_active_billing_inactive'], crm_charge),
+            'Bill Start Date': (rules['start_date_mismatch'], crm_charge * unbilled_days / cls.CYCLE_DAYS)
+        }
+        months = crm_start.dt.to_period('M')
+        frames = []
+        for category, (mask, value) in values.items():
+            frames.append(pd.DataFrame({
+                'record': merged_df.loc[mask, 'MSISDN'],
+                'category': category,
+                'service': merged_df.loc[mask, 'Plan_Name'],
+                'month': months[mask],
+                'value': value[mask].round(2)
+            }))
+        return pd.concat(frames, ignore_index=True)
+
+    @staticmethod
+    def summarize(frames, categories=None):
+        """Total, per-category, per-service and per-month leakage from valued record frames"""
+        frames = [frame for frame in frames if not frame.empty]
+        valued = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=['record', 'category', 'service', 'month', 'value'])
+        valued['value'] = pd.to_numeric(valued['value'], errors='coerce')
+        priced = valued['value'].notna()
+
+        by_category = valued.groupby('category', sort=False).agg(
+            records=('value', 'size'),
+            priced_records=('value', 'count'),
+            value=('value', 'sum')
+        )
+        category_order = categories or list(by_category.index)
+        by_month = valued[priced].dropna(subset=['month']).groupby('month')['value'].sum().sort_index()
+        by_service = (
+            valued.dropna(subset=['service'])
+            .groupby('service')['value'].agg(['size', 'sum'])
+            .sort_values(['sum', 'size'], ascending=False)
+        )
+
+        return {
+            'total_value': round(float(valued['value'].sum()), 2),
+            'discrepant_records': int(valued['record'].nunique()),
+            'priced_records': int(priced.sum()),
+            'unpriced_records': int((~priced).sum()),
+            'by_category': [
+                {
+                    'category': category,
+                    'records': int(by_category.at[category, 'records']) if category in by_category.index else 0,
+                    'unpriced_records': int(by_category.at[category, 'records'] - by_category.at[category, 'priced_records']) if category in by_category.index else 0,
+                    'value': round(float(by_category.at[category, 'value']), 2) if category in by_category.index else 0.0
+                }
+                for category in category_order
+            ],
+            'by_service': [
+                {'service_type': str(service), 'count': int(count), 'value': round(float(value), 2)}
+                for service, count, value in by_service.itertuples(name=None)
+            ],
+            'by_month': [
+                {'date': f"{period.month}/{period.year}", 'value': round(float(value), 2)}
+                for period, value in by_month.items()
+            ]
+        }
+
+
+class NetworkLeakage:
+    """Leakage of one network vs billing reconciliation, valued frame by frame
+
+    Each mismatch frame is valued as its record list is built, so the
+    'Leakage Value' column is part of the frame before it becomes records.
+    summary() then totals the valuations per category and month.
+    """
+
+    def __init__(self, date_column, usage_column):
+        self.date_column = date_column
+        self.usage_column = usage_column
+        self.valued = []
+        # Category -> (msisdn, service, month) keys already charged
+        self.charged = {}
+
+    def value(self, key, df):
+        """df (a frame of record list key) with its 'Leakage Value' column, None when unpriced"""
+        if df.empty:
+            return df
+        category, mode = LeakageModel.NETWORK_VALUATION[key]
+        charged = self.charged.get(category)
+        values = LeakageModel.value_network_frame(df, mode, self.date_column, self.usage_column, charged).round(2)
+        if mode in ('service', 'difference'):
+            keys = LeakageModel.charge_keys(df, self.date_column)
+            self.charged[category] = keys if charged is None else pd.concat([charged, keys], ignore_index=True)
+        self.valued.append(pd.DataFrame({
+            'record': LeakageModel.record_keys(df, self.date_column),
+            'category': category,
+            'service': LeakageModel._first_column(df, ['Service Name_Network', 'Service Name Network', 'Service Name']),
+            'month': LeakageModel.record_months(df, self.date_column),
+            'value': values
+        }))
+        return df.assign(**{'Leakage Value': values.astype(object).where(values.notna(), None)})
+
+    def summary(self):
+        return LeakageModel.summarize(
+            self.valued, categories=[category for category, _ in LeakageModel.NETWORK_VALUATION.values()]
+        )
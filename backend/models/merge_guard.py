@@ -0,0 +1,164 @@
+import os
+import pandas as pd # type: ignore
+from middleware.admission import AdmissionControl
+
+
+class MemoryBudgetExceeded(MemoryError):
+    """A merge cannot be run within the memory budget, even partitioned"""
+
+
+class MergeGuard:
+    """Inner merges sized from key counts before they run
+
+    The output row count of an inner merge is known exactly from the key
+    counts of both sides: each left row yields as many rows as the right
+    side has for its key. guarded_merge() works that out (together with
+    bytes per output row) before merging. Within the budget it merges
+    once; above it, the left side is cut into row chunks whose outputs fit
+    and each chunk is merged and reduced to the rows the caller keeps, so
+    the full product never exists at once. Chunks keep left order, so the
+    result is the same as a single merge. A single left row whose matches
+    alone would not fit in a chunk raises MemoryBudgetExceeded.
+
+    The budget is REVENUEFIX_MERGE_MEMORY_BUDGET (e.g. 2G), or else
+    BUDGET_FRACTION of the memory available when the merge starts.
+    """
+
+    BUDGET = os.environ.get('REVENUEFIX_MERGE_MEMORY_BUDGET')
+    BUDGET_FRACTION = 0.5
+    # Chunks are sized to this share of the budget, leaving room for the caller's reduced output
+    CHUNK_FRACTION = 0.5
+    # Output rows per chunk of a capped merge, so filled values are dropped early
+    CAPPED_CHUNK_ROWS = 50000
+
+    UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+
+    @classmethod
+    def budget(cls):
+        """Bytes a single merge may produce, or None when unknown (no limit)"""
+        if cls.BUDGET:
+            text = cls.BUDGET.strip().upper().rstrip('B')
+            unit = text[-1:] if text[-1:] in cls.UNITS and not text[-1:].isdigit() else ''
+            return int(float(text[:len(text) - len(unit)]) * cls.UNITS[unit])
+        available = AdmissionControl.available_memory()
+        return int(available * cls.BUDGET_FRACTION) if available else None
+
+    @staticmethod
+    def _row_bytes(df, columns):
+        if df.empty or not columns:
+            return 0.0
+        return float(df[columns].memory_usage(deep=True, index=False).sum()) / len(df)
+
+    @staticmethod
+    def fanout(left, right, on):
+        """Number of right rows each left row matches (null keys match each other, as in pd.merge)"""
+        counts = right.groupby(on, dropna=False, sort=False).size().rename('__fanout').reset_index()
+        matched = left[on].merge(counts, on=on, how='left', sort=False)
+        return matched['__fanout'].fillna(0).astype('int64').to_numpy()
+
+    @classmethod
+    def estimate(cls, left, right, on):
+        """(output rows, output bytes, per-left-row fanout, bytes per output row) of an inner merge"""
+        fanout = cls.fanout(left, right, on)
+        row_bytes = cls._row_bytes(left, list(left.columns)) + cls._row_bytes(right, [c for c in right.columns if c not in on])
+        rows = int(fanout.sum())
+        return rows, int(rows * row_bytes), fanout, row_bytes
+
+    @classmethod
+    def check(cls, left, right, on, label='merge'):
+        """Raise MemoryBudgetExceeded when an inner merge that is used whole would not fit"""
+        rows, size, _, _ = cls.estimate(left, right, on)
+        budget = cls.budget()
+        if budget is not None and size > budget:
+            raise MemoryBudgetExceeded(
+                f"{label}: {rows:,} rows on {', '.join(on)} (~{size / 2 ** 20:,.0f} MB) exceed the "
+                f"{budget / 2 ** 20:,.0f} MB merge budget; check the inputs for repeated keys"
+            )
+        return rows
+
+    @staticmethod
+    def key_statistics(left, right, on):
+        """Key multiplicities of an inner merge: matched keys, many-to-many keys and output rows"""
+        left_counts = left.groupby(on, dropna=False, sort=False).size().rename('left')
+        right_counts = right.groupby(on, dropna=False, sort=False).size().rename('right')
+        both = pd.concat([left_counts, right_counts], axis=1, join='inner')
+        return {
+            'left_rows': int(len(left)),
+            'right_rows': int(len(right)),
+            'matched_keys': int(len(both)),
+            'many_to_many_keys': int(((both['left'] > 1) & (both['right'] > 1)).sum()),
+            'max_left_multiplicity': int(both['left'].max()) if len(both) else 0,
+            'max_right_multiplicity': int(both['right'].max()) if len(both) else 0,
+            'output_rows': int((both['left'] * both['right']).sum())
+        }
+
+    @staticmethod
+    def _cap(frame, cap, column, taken):
+        """Rows of frame within cap per column value, counting the taken rows of earlier chunks"""
+        before = frame[column].map(taken).fillna(0).to_numpy() if len(taken) else 0
+        return frame[frame.groupby(column, dropna=False, sort=False).cumcount().to_numpy() + before < cap]
+
+    @classmethod
+    def guarded_merge(cls, left, right, on, suffixes, keep, label='merge', caps=None, cap_column='MSISDN'):
+        """keep(merged) for the inner merge of left and right, run in chunks when it would not fit
+
+        keep takes a merged frame and returns a dict of frames (e.g. the rows
+        each mismatch rule selects); chunk results are concatenated in order.
+        Only rows whose key is on both sides enter the merge. caps limits
+        named outputs to their first N rows per cap_column value; capped
+        merges always run in chunks, and left rows whose value has filled
+        every output's cap are dropped before the next chunk is merged.
+        """
+        rows, size, fanout, row_bytes = cls.estimate(left, right, on)
+        budget = cls.budget()
+        caps = caps or {}
+
+        # Semi-join both sides on the matched keys before merging
+        left = left[fanout > 0]
+        fanout = fanout[fanout > 0]
+        matched = right[on].merge(left[on].drop_duplicates(), on=on, how='left', indicator=True, sort=False)
+        right = right[(matched['_merge'] == 'both').to_numpy()]
+
+        if not caps and (budget is None or size <= budget):
+            return keep(pd.merge(left, right, on=on, how='inner', suffixes=suffixes))
+
+        chunk_rows = cls.CAPPED_CHUNK_ROWS if caps else rows
+        if budget is not None and size > budget:
+            widest = int(fanout.max()) if len(fanout) else 0
+            if widest * row_bytes > budget * cls.CHUNK_FRACTION:
+                raise MemoryBudgetExceeded(
+                    f"{label}: one record matches {widest:,} rows on {', '.join(on)} "
+                    f"(~{widest * row_bytes / 2 ** 20:,.0f} MB), over the {budget / 2 ** 20:,.0f} MB merge budget"
+                )
+            chunk_rows = min(chunk_rows, max(1, int(budget * cls.CHUNK_FRACTION / row_bytes)) if row_bytes else rows)
+            print(f"{label}: {rows:,} rows (~{size / 2 ** 20:,.0f} MB) exceed the {budget / 2 ** 20:,.0f} MB merge budget, "
+                  f"merging in chunks of {chunk_rows:,} rows")
+
+        # Cut the left side where the cumulative output reaches each chunk's row allowance
+        ends = pd.Series(fanout.cumsum()).floordiv(max(chunk_rows, 1)).diff().fillna(0).to_numpy().nonzero()[0].tolist()
+        bounds = [0] + ends + [len(left)]
+
+        parts = {}
+        taken = {name: pd.Series(dtype='int64') for name in caps}
+        for start, end in zip(bounds, bounds[1:]):
+            chunk = left.iloc[start:end]
+            if caps and parts and set(parts) <= set(caps):
+                # Every output is capped: skip values that have filled all of them
+                full = None
+                for name, cap in caps.items():
+                    filled = set(taken[name][taken[name] >= cap].index)
+                    full = filled if full is None else full & filled
+                if full:
+                    chunk = chunk[~chunk[cap_column].isin(full)]
+            if chunk.empty:
+                continue
+            merged = pd.merge(chunk, right, on=on, how='inner', suffixes=suffixes)
+            for name, frame in keep(merged).items():
+                if name in caps:
+                    frame = cls._cap(frame, caps[name], cap_column, taken[name])
+                    taken[name] = taken[name].add(frame[cap_column].value_counts(dropna=False), fill_value=0)
+                parts.setdefault(name, []).append(frame)
+            del merged
+        if not parts:
+            return keep(pd.merge(left.iloc[:0], right.iloc[:0], on=on, how='inner', suffixes=suffixes))
+        return {name: pd.concat(frames, ignore_index=True) for name, frames in parts.items()}
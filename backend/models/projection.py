@@ -0,0 +1,178 @@
+import hashlib
+import pandas as pd # type: ignore
+
+
+class ResponseProjection:
+    """Sections and record fields a reconciliation request asks for
+
+    ?sections= names the data keys to return (e.g. mismatch_count,
+    revenue_trend) and ?fields= the columns to keep in record lists (the
+    *_records keys, mismatched_accounts and the display card). The network
+    reconcilers honour a projection while they run: mismatch stages no
+    requested section depends on are skipped, record lists nobody asked
+    for are never built, and records are built with the requested columns
+    only when nothing derived from them (leakage, top offenders, sample
+    estimates, the display card) is requested. apply() then trims the
+    result itself.
+    """
+
+    # Network section -> rule frames of ServicesModel.network_mismatches it is built from
+    NETWORK_SECTIONS = {
+        'total_records': (),
+        'duplicate_count': (),
+        'duplicate_records': (),
+        'mismatch_status': (),
+        'service_breakdown': (),
+        'join_statistics': ('service_status_mismatch', 'transaction_date_mismatch', 'service_id_mismatch'),
+        'mismatch_count': ('mismatched',),
+        'mismatched_records': ('mismatched',),
+        'revenue_trend': ('mismatched',),
+        'account_status_mismatch_count': ('account_status_mismatch',),
+        'account_status_mismatched_records': ('account_status_mismatch',),
+        'service_mismatch_count': ('service_status_mismatch', 'service_id_mismatch', 'service_date_mismatch'),
+        'service_mismatched_records': ('service_status_mismatch', 'service_id_mismatch', 'service_date_mismatch'),
+        'transaction_mismatch_count': ('transaction_window_mismatch',),
+        'transaction_mismatched_records': ('transaction_window_mismatch',),
+        'msisdn_missing_count': ('msisdn_missing',),
+        'msisdn_missing_records': ('msisdn_missing',),
+        'transaction_date_mismatch_count': ('transaction_date_mismatch',),
+        'transaction_date_mismatched_records': ('transaction_date_mismatch',),
+        'download_mismatch_count': ('usage_mismatch',),
+        'download_mismatched_records': ('usage_mismatch',),
+        'count_mismatch_count': ('usage_mismatch',),
+        'count_mismatched_records': ('usage_mismatch',),
+        'duration_mismatch_count': ('usage_mismatch',),
+        'duration_mismatched_records': ('usage_mismatch',),
+        'leakage': None,
+        'top_offenders': None,
+        'records_display_card': None,
+        'sample': None
+    }
+
+    # Sections computed from every record list, with all their columns
+    DERIVED_SECTIONS = {'leakage', 'top_offenders', 'records_display_card', 'sample'}
+
+    # Columns the network reconcilers add to the input columns of their records
+    NETWORK_RECORD_COLUMNS = ('Leakage Value', 'Mismatch Reason', '_merge')
+    # An input column c may also appear as one of these, once billing and network are joined
+    NETWORK_COLUMN_FORMS = ('{}', '{}_Network', '{}_Billing', '{} Network', '{} Billing', 'Billing {}')
+
+    CRM_FIELDS = (
+        'customer_id', 'account_id', 'msisdn', 'crm_status', 'billing_status', 'crm_bill_plan',
+        'billing_bill_plan', 'enterprise_category', 'crm_bill_start_date', 'billing_bill_start_date',
+        'leakage_value', 'mismatch_type'
+    )
+
+    CRM_SECTIONS = (
+        'summary', 'account_status', 'mismatched_accounts', 'enterprise_breakdown', 'plan_breakdown',
+        'service_breakdown', 'trend_data', 'mismatch_visualization', 'validation_results', 'rule_results',
+        'leakage', 'ml_tf_comparison', 'run_id'
+    )
+
+    def __init__(self, sections=None, fields=None):
+        self.sections = set(sections) if sections else None
+        self.fields = list(fields) if fields else None
+
+    @classmethod
+    def network_fields(cls, files):
+        """Columns the record lists of a network reconciliation of these input files can have"""
+        fields = set(cls.NETWORK_RECORD_COLUMNS)
+        for file_path in files:
+            for column in pd.read_csv(file_path, nrows=0).columns:
+                fields.update(form.format(name) for name in {column, column.strip()} for form in cls.NETWORK_COLUMN_FORMS)
+        return fields
+
+    @classmethod
+    def from_args(cls, args, valid_sections, valid_fields=None):
+        """Projection requested by sections= and fields= (comma separated); raises ValueError on unknown sections or fields"""
+        sections = [value for raw in args.getlist('sections') for value in raw.split(',') if value]
+        fields = [value for raw in args.getlist('fields') for value in raw.split(',') if value]
+        unknown = [section for section in sections if section not in valid_sections]
+        if unknown:
+            raise ValueError(f"Unknown sections: {', '.join(unknown)}; valid sections are {', '.join(sorted(valid_sections))}")
+        if fields and valid_fields is not None:
+            unknown = [field for field in fields if field not in valid_fields]
+            if unknown:
+                raise ValueError(f"Unknown fields: {', '.join(unknown)}; valid fields are {', '.join(sorted(valid_fields))}")
+        return cls(sections, fields)
+
+    @property
+    def complete(self):
+        return self.sections is None and self.fields is None
+
+    @property
+    def key(self):
+        """Stable name for the projection, for caching computed results"""
+        if self.complete:
+            return ''
+        return f"sections={','.join(sorted(self.sections or []))};fields={','.join(self.fields or [])}"
+
+    @property
+    def digest(self):
+        """Short hash of key, safe to use in file names"""
+        return hashlib.blake2b(self.key.encode(), digest_size=8).hexdigest()
+
+    def wants(self, section):
+        return self.sections is None or section in self.sections
+
+    def network_frames(self):
+        """Rule frames the requested network sections need, or None for all"""
+        if self.sections is None:
+            return None
+        frames = set()
+        for section in self.sections:
+            needed = self.NETWORK_SECTIONS[section]
+            if needed is None:
+                return None
+            frames.update(needed)
+        return frames
+
+    @property
+    def _derived(self):
+        return self.sections is None or bool(self.sections & self.DERIVED_SECTIONS)
+
+    @property
+    def full_records(self):
+        """Records keep every column: something is derived from them, or their Leakage Value is asked for"""
+        return self._derived or self.fields is None or 'Leakage Value' in self.fields
+
+    def records(self, key, df, leakage=None):
+        """df as a record list when key (or something derived from it) is requested, else []
+
+        leakage (a NetworkLeakage) values full records first, adding their
+        Leakage Value column.
+        """
+        if not (self.wants(key) or self._derived):
+            return []
+        if self.full_records:
+            if leakage is not None:
+                df = leakage.value(key, df)
+        else:
+            df = df[[column for column in df.columns if column in self.fields]]
+        return df.to_dict(orient='records')
+
+    @staticmethod
+    def is_record_list(key, value):
+        return isinstance(value, list) and (key.endswith('_records') or key == 'mismatched_accounts')
+
+    def _fields(self, records):
+        return [{field: record[field] for field in self.fields if field in record} for record in records]
+
+    def _project(self, key, value):
+        if self.fields is None:
+            return value
+        if self.is_record_list(key, value):
+            return self._fields(value)
+        if key == 'records_display_card':
+            return [dict(card, records=self._fields(card['records'])) for card in value]
+        return value
+
+    def apply(self, data):
+        """Projected copy of a result's data dict; record lists keep only the requested fields"""
+        if self.complete:
+            return data
+        return {
+            key: self._project(key, value)
+            for key, value in data.items()
+            if self.sections is None or key in self.sections
+        }
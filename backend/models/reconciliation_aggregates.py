@@ -0,0 +1,138 @@
+import os
+import sqlite3
+from contextlib import closing
+from datetime import datetime, timedelta
+
+
+class ReconciliationAggregates:
+    """Materialized per-day reconciliation aggregates for the dashboards
+
+    Every reconciliation run upserts one row for its source and day, plus
+    its top discrepancy service types, so the dashboard endpoints read a
+    handful of small rows instead of recomputing or inventing figures.
+    The table lives in a SQLite file so every worker process sees it.
+    """
+
+    DB_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'assets', 'reconciliation_aggregates.sqlite')
+
+    NETWORK_SOURCES = ('network_data', 'network_sms', 'network_voice')
+    MEDIATION_SOURCES = ('mediation',)
+    CRM_SOURCES = ('crm_billing',)
+
+    TREND_DAYS = 14
+    TOP_DISCREPANCIES = 5
+
+    SCHEMA = [
+        '''CREATE TABLE IF NOT EXISTS reconciliation_daily (
+            source TEXT NOT NULL,
+            run_date TEXT NOT NULL,
+            source_records INTEGER NOT NULL,
+            billing_records INTEGER NOT NULL,
+            discrepancy_count INTEGER NOT NULL,
+            financial_impact REAL NOT NULL,
+            updated_at TEXT NOT NULL,
+            PRIMARY KEY (source, run_date)
+        )''',
+        '''CREATE TABLE IF NOT EXISTS reconciliation_top_discrepancies (
+            source TEXT NOT NULL,
+            service_type TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            value REAL NOT NULL,
+            PRIMARY KEY (source, service_type)
+        )'''
+    ]
+
+    @classmethod
+    def _connect(cls):
+        conn = sqlite3.connect(cls.DB_PATH, timeout=30)
+        for statement in cls.SCHEMA:
+            conn.execute(statement)
+        return conn
+
+    @classmethod
+    def record(cls, source, source_records, billing_records, discrepancy_count, financial_impact, top_discrepancies, run_date=None):
+        """Upsert today's aggregates for a source and replace its top discrepancies
+
+        top_discrepancies is a list of {'service_type', 'count', 'value'}.
+        Failures are logged rather than raised so a reconciliation response
+        never fails because the dashboard table could not be written.
+        """
+        run_date = (run_date or datetime.now().date()).isoformat()
+        try:
+            with closing(cls._connect()) as conn, conn:
+                conn.execute(
+                    'INSERT OR REPLACE INTO reconciliation_daily VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (source, run_date, int(source_records), int(billing_records), int(discrepancy_count),
+                     float(financial_impact), datetime.now().isoformat(timespec='seconds'))
+                )
+                conn.execute('DELETE FROM reconciliation_top_discrepancies WHERE source = ?', (source,))
+                conn.executemany(
+                    'INSERT INTO reconciliation_top_discrepancies VALUES (?, ?, ?, ?)',
+                    [
+                        (source, item['service_type'], int(item['count']), float(item['value']))
+                        for item in top_discrepancies[:cls.TOP_DISCREPANCIES]
+                    ]
+                )
+        except sqlite3.Error as e:
+            print(f"Error recording reconciliation aggregates for {source}: {e}")
+
+    @classmethod
+    def record_leakage(cls, source, source_records, billing_records, leakage):
+        """Record a run from the leakage summary built by LeakageModel"""
+        cls.record(
+            source,
+            source_records,
+            billing_records,
+            leakage['discrepant_records'],
+            leakage['total_value'],
+            leakage['by_service']
+        )
+
+    @classmethod
+    def summary(cls, sources, trend_days=None):
+        """Latest totals, daily discrepancy trend and top service types across sources"""
+        placeholders = ', '.join('?' for _ in sources)
+        since = (datetime.now().date() - timedelta(days=(trend_days or cls.TREND_DAYS) - 1)).isoformat()
+        with closing(cls._connect()) as conn:
+            latest = conn.execute(f'''
+                SELECT COALESCE(SUM(source_records), 0), COALESCE(SUM(billing_records), 0),
+                       COALESCE(SUM(discrepancy_count), 0), COALESCE(SUM(financial_impact), 0), MAX(updated_at)
+                FROM reconciliation_daily d
+                WHERE source IN ({placeholders})
+                  AND run_date = (SELECT MAX(run_date) FROM reconciliation_daily WHERE source = d.source)
+            ''', sources).fetchone()
+            trend = conn.execute(f'''
+                SELECT run_date, SUM(discrepancy_count), SUM(source_records)
+                FROM reconciliation_daily
+                WHERE source IN ({placeholders}) AND run_date >= ?
+                GROUP BY run_date
+                ORDER BY run_date
+            ''', (*sources, since)).fetchall()
+            top = conn.execute(f'''
+                SELECT service_type, SUM(count), SUM(value)
+                FROM reconciliation_top_discrepancies
+                WHERE source IN ({placeholders})
+                GROUP BY service_type
+                ORDER BY SUM(value) DESC, SUM(count) DESC
+                LIMIT ?
+            ''', (*sources, cls.TOP_DISCREPANCIES)).fetchall()
+
+        source_records, billing_records, discrepancy_count, financial_impact, updated_at = latest
+        return {
+            'summary': {
+                'total_records': source_records,
+                'total_billing_records': billing_records,
+                'discrepancy_count': discrepancy_count,
+                'discrepancy_percentage': round(discrepancy_count / source_records * 100, 2) if source_records else 0,
+                'financial_impact': round(financial_impact, 2),
+                'last_updated': updated_at
+            },
+            'trend': [
+                {'date': run_date, 'value': round(count / records * 100, 2) if records else 0}
+                for run_date, count, records in trend
+            ],
+            'top_discrepancies': [
+                {'service_type': service_type, 'count': count, 'value': round(value, 2)}
+                for service_type, count, value in top
+            ]
+        }
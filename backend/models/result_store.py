@@ -0,0 +1,405 @@
+import os
+import json
+import uuid
+import hashlib
+import sqlite3
+from contextlib import closing
+from datetime import datetime
+from models.rule_engine import RuleEngine
+
+
+class ResultStore:
+    """Persisted reconciliation runs: metadata, summary metrics and mismatch rows
+
+    Every reconciliation run is written to a SQLite file so its drill-down,
+    filters and exports read stored rows by run_id instead of rerunning
+    the reconciliation, and past runs stay queryable. Mismatch rows are
+    indexed by run, category, MSISDN and service, and carry a fingerprint
+    (a 64-bit hash of the category and the record) so two runs can be
+    compared with indexed set operations (delta()). The last KEEP_RUNS runs
+    of each source are kept.
+    """
+
+    DB_PATH = os.environ.get(
+        'REVENUEFIX_RESULT_STORE',
+        os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'assets', 'reconciliation_results.sqlite')
+    )
+    KEEP_RUNS = int(os.environ.get('REVENUEFIX_RESULT_RUNS', 20))
+
+    NETWORK_SOURCES = ('network_data', 'network_sms', 'network_voice')
+
+    # Per-record lists stored as mismatch rows (LeakageModel.NETWORK_VALUATION plus duplicates for network runs)
+    CATEGORIES = {
+        'network': [
+            'mismatched_records', 'account_status_mismatched_records', 'transaction_mismatched_records',
+            'msisdn_missing_records', 'service_mismatched_records', 'download_mismatched_records',
+            'count_mismatched_records', 'duration_mismatched_records', 'transaction_date_mismatched_records',
+            'duplicate_records'
+        ],
+        'crm_billing': ['mismatched_accounts']
+    }
+
+    # Bulky presentation blocks left out of the stored summary
+    SUMMARY_EXCLUDE = {'records_display_card', 'mismatch_visualization', 'ml_tf_comparison', 'run_id'}
+
+    # Indexed columns -> record fields holding them, in order of preference
+    INDEXED = {
+        'msisdn': ['MSISDN', 'msisdn'],
+        'service_id': ['Service ID_Network', 'Service ID Network', 'Service ID', 'Service_ID'],
+        'service_name': ['Service Name_Network', 'Service Name Network', 'Service Name', 'Service_Name', 'crm_bill_plan']
+    }
+
+    # Fields left out of a mismatch fingerprint: derived from charge tables or rule text, not the data
+    FINGERPRINT_EXCLUDE = {'Leakage Value', 'leakage_value', 'Mismatch Reason', 'category'}
+
+    DELTA_STATUSES = ('new', 'resolved', 'persisting')
+
+    MAX_PAGE_SIZE = 1000
+    EXPORT_BATCH = 5000
+
+    SCHEMA = [
+        '''CREATE TABLE IF NOT EXISTS runs (
+            run_id TEXT PRIMARY KEY,
+            source TEXT NOT NULL,
+            started_at TEXT NOT NULL,
+            finished_at TEXT NOT NULL,
+            elapsed_seconds REAL NOT NULL,
+            options TEXT NOT NULL,
+            summary TEXT NOT NULL,
+            categories TEXT NOT NULL
+        )''',
+        'CREATE INDEX IF NOT EXISTS runs_source ON runs (source, started_at)',
+        '''CREATE TABLE IF NOT EXISTS mismatches (
+            run_id TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            category TEXT NOT NULL,
+            msisdn TEXT,
+            service_id TEXT,
+            service_name TEXT,
+            fingerprint INTEGER NOT NULL,
+            record TEXT NOT NULL,
+            PRIMARY KEY (run_id, seq)
+        ) WITHOUT ROWID''',
+        'CREATE INDEX IF NOT EXISTS mismatches_category ON mismatches (run_id, category, seq)',
+        'CREATE INDEX IF NOT EXISTS mismatches_msisdn ON mismatches (run_id, msisdn)',
+        'CREATE INDEX IF NOT EXISTS mismatches_service ON mismatches (run_id, service_id)',
+        'CREATE INDEX IF NOT EXISTS mismatches_fingerprint ON mismatches (run_id, fingerprint)'
+    ]
+
+    # Public filter name -> column
+    FILTERS = {
+        'category': 'category',
+        'msisdn': 'msisdn',
+        'service': 'service_id',
+        'service_name': 'service_name'
+    }
+
+    @classmethod
+    def _connect(cls):
+        conn = sqlite3.connect(cls.DB_PATH, timeout=30)
+        conn.row_factory = sqlite3.Row
+        for statement in cls.SCHEMA:
+            conn.execute(statement)
+        return conn
+
+    @classmethod
+    def fingerprint(cls, category, record):
+        """Signed 64-bit hash of a mismatch's category and record, stable across runs"""
+        key = json.dumps(
+            [category, {field: value for field, value in record.items() if field not in cls.FINGERPRINT_EXCLUDE}],
+            sort_keys=True, default=str
+        )
+        return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'big', signed=True)
+
+    @staticmethod
+    def _key(value):
+        """Indexed value as text; integer IDs read as floats next to NaNs would otherwise show as 15.0"""
+        if value is None or value != value:
+            return None
+        text = str(value).strip()
+        return text[:-2] if text.endswith('.0') else text
+
+    @classmethod
+    def _indexed(cls, record):
+        return [
+            cls._key(next((record[field] for field in fields if field in record), None))
+            for fields in cls.INDEXED.values()
+        ]
+
+    @classmethod
+    def categories(cls, source):
+        return cls.CATEGORIES['network' if source in cls.NETWORK_SOURCES else source]
+
+    @classmethod
+    def record(cls, source, data, started_at, options=None):
+        """Store one run of a source from its result data; returns the new run_id
+
+        Failures are logged rather than raised so a reconciliation response
+        never fails because its results could not be stored.
+        """
+        run_id = uuid.uuid4().hex
+        finished_at = datetime.now()
+        options = {**(options or {}), 'rules': RuleEngine.digest()}
+        categories = [category for category in cls.categories(source) if isinstance(data.get(category), list)]
+        summary = {key: value for key, value in data.items() if key not in categories and key not in cls.SUMMARY_EXCLUDE}
+        try:
+            with closing(cls._connect()) as conn, conn:
+                conn.execute(
+                    'INSERT INTO runs VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    (run_id, source, started_at.isoformat(timespec='seconds'), finished_at.isoformat(timespec='seconds'),
+                     round((finished_at - started_at).total_seconds(), 2), json.dumps(options, default=str),
+                     json.dumps(summary, default=str), json.dumps({category: len(data[category]) for category in categories}))
+                )
+                seq = 0
+                for category in categories:
+                    rows = []
+                    for record in data[category]:
+                        seq += 1
+                        rows.append((run_id, seq, category, *cls._indexed(record), cls.fingerprint(category, record), json.dumps(record, default=str)))
+                    conn.executemany(
+                        'INSERT INTO mismatches (run_id, seq, category, msisdn, service_id, service_name, fingerprint, record) '
+                        'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                        rows
+                    )
+                cls._prune(conn, source)
+        except sqlite3.Error as e:
+            print(f"Error storing reconciliation run for {source}: {e}")
+            return None
+        return run_id
+
+    @classmethod
+    def _prune(cls, conn, source):
+        expired = [row[0] for row in conn.execute(
+            'SELECT run_id FROM runs WHERE source = ? ORDER BY started_at DESC, rowid DESC LIMIT -1 OFFSET ?',
+            (source, cls.KEEP_RUNS)
+        )]
+        for run_id in expired:
+            conn.execute('DELETE FROM mismatches WHERE run_id = ?', (run_id,))
+            conn.execute('DELETE FROM runs WHERE run_id = ?', (run_id,))
+
+    @classmethod
+    def recorded(cls, source, fn, **options):
+        """Run a reconciliation, store it and add its run_id to the result data"""
+        started_at = datetime.now()
+        result = fn()
+        data = result['data'] if source in cls.NETWORK_SOURCES else result
+        run_id = cls.record(source, data, started_at, options)
+        if run_id:
+            data['run_id'] = run_id
+        return result
+
+    @staticmethod
+    def _run(row):
+        return {
+            'run_id': row['run_id'],
+            'source': row['source'],
+            'started_at': row['started_at'],
+            'finished_at': row['finished_at'],
+            'elapsed_seconds': row['elapsed_seconds'],
+            'options': json.loads(row['options']),
+            'categories': json.loads(row['categories'])
+        }
+
+    @classmethod
+    def runs(cls, source=None, limit=None):
+        """Stored runs, newest first"""
+        limit = min(limit or cls.KEEP_RUNS, cls.MAX_PAGE_SIZE)
+        sql = 'SELECT run_id, source, started_at, finished_at, elapsed_seconds, options, categories FROM runs'
+        params = []
+        if source:
+            sql += ' WHERE source = ?'
+            params.append(source)
+        sql += ' ORDER BY started_at DESC, rowid DESC LIMIT ?'
+        params.append(limit)
+        with closing(cls._connect()) as conn:
+            return [cls._run(row) for row in conn.execute(sql, params)]
+
+    @classmethod
+    def run(cls, run_id):
+        """Metadata and summary of one run, or None"""
+        with closing(cls._connect()) as conn:
+            row = conn.execute('SELECT * FROM runs WHERE run_id = ?', (run_id,)).fetchone()
+        if row is None:
+            return None
+        return {**cls._run(row), 'summary': json.loads(row['summary'])}
+
+    @classmethod
+    def query_args(cls, args):
+        """Translate request query parameters into records() keyword arguments"""
+        filters = {}
+        for name in cls.FILTERS:
+            values = [v for raw in args.getlist(name) for v in raw.split(',') if v]
+            if values:
+                filters[name] = values
+        limit = args.get('limit')
+        cursor = args.get('cursor')
+        try:
+            limit = int(limit) if limit is not None else None
+        except ValueError:
+            raise ValueError("limit must be a positive integer")
+        try:
+            cursor = int(cursor) if cursor else None
+        except ValueError:
+            raise ValueError(f"Invalid cursor: {cursor}")
+        return {'filters': filters, 'limit': limit, 'cursor': cursor}
+
+    @classmethod
+    def _where(cls, run_id, filters):
+        where = ['run_id = ?']
+        params = [run_id]
+        for name, values in (filters or {}).items():
+            if name not in cls.FILTERS:
+                raise ValueError(f"Invalid filter: {name}")
+            where.append(f'{cls.FILTERS[name]} IN ({", ".join("?" for _ in values)})')
+            params.extend(values)
+        return where, params
+
+    @classmethod
+    def records(cls, run_id, filters=None, limit=None, cursor=None):
+        """Filtered mismatch rows of a run, in run order, with keyset pagination on seq"""
+        limit = cls.MAX_PAGE_SIZE if limit is None else limit
+        if limit < 1:
+            raise ValueError("limit must be a positive integer")
+        limit = min(limit, cls.MAX_PAGE_SIZE)
+        where, params = cls._where(run_id, filters)
+        page_where, page_params = list(where), list(params)
+        if cursor:
+            page_where.append('seq > ?')
+            page_params.append(cursor)
+
+        with closing(cls._connect()) as conn:
+            rows = conn.execute(
+                f'SELECT seq, category, record FROM mismatches WHERE {" AND ".join(page_where)} ORDER BY seq LIMIT ?',
+                (*page_params, limit + 1)
+            ).fetchall()
+            total_matching = conn.execute(f'SELECT COUNT(*) FROM mismatches WHERE {" AND ".join(where)}', params).fetchone()[0]
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = str(rows[-1]['seq'])
+        return {
+            'records': [{'category': row['category'], **json.loads(row['record'])} for row in rows],
+            'pagination': {
+                'limit': limit,
+                'next_cursor': next_cursor,
+                'total_matching': total_matching
+            }
+        }
+
+    @classmethod
+    def export(cls, run_id, filters=None):
+        """All filtered mismatch rows of a run, yielded in batches of EXPORT_BATCH records"""
+        where, params = cls._where(run_id, filters)
+        last_seq = 0
+        while True:
+            with closing(cls._connect()) as conn:
+                rows = conn.execute(
+                    f'SELECT seq, category, record FROM mismatches WHERE {" AND ".join(where)} AND seq > ? ORDER BY seq LIMIT ?',
+                    (*params, last_seq, cls.EXPORT_BATCH)
+                ).fetchall()
+            if not rows:
+                return
+            last_seq = rows[-1]['seq']
+            yield [{'category': row['category'], **json.loads(row['record'])} for row in rows]
+
+    # Options that change which records a run covers; runs are only compared when these match
+    COMPARABLE_OPTIONS = ('sample', 'window', 'inputs', 'rules')
+
+    @classmethod
+    def _comparable(cls, options):
+        options = json.loads(options)
+        return {name: options.get(name) for name in cls.COMPARABLE_OPTIONS}
+
+    @classmethod
+    def previous_run(cls, run_id):
+        """run_id of the last run of the same source and comparable options stored before run_id, or None
+
+        A sampled, windowed or batch (inputs) run is only compared with a
+        run over the same sample, window and inputs, made with the same
+        mismatch rules (rules, a digest of config/mismatch_rules.json).
+        """
+        with closing(cls._connect()) as conn:
+            run = conn.execute('SELECT options FROM runs WHERE run_id = ?', (run_id,)).fetchone()
+            if run is None:
+                return None
+            rows = conn.execute('''
+                SELECT p.run_id, p.options FROM runs r JOIN runs p ON p.source = r.source
+                WHERE r.run_id = ? AND (p.started_at < r.started_at OR (p.started_at = r.started_at AND p.rowid < r.rowid))
+                ORDER BY p.started_at DESC, p.rowid DESC
+            ''', (run_id,)).fetchall()
+        comparable = cls._comparable(run['options'])
+        return next((row['run_id'] for row in rows if cls._comparable(row['options']) == comparable), None)
+
+    @staticmethod
+    def _delta_side(status):
+        """(run whose rows are listed, run they are looked up in, whether a match is wanted) for a status"""
+        return {
+            'new': ('run', 'base', False),
+            'resolved': ('base', 'run', False),
+            'persisting': ('run', 'base', True)
+        }[status]
+
+    @classmethod
+    def delta(cls, base_run_id, run_id, status=None, category=None, limit=None, cursor=None):
+        """New, resolved and persisting mismatches of run_id against base_run_id
+
+        Mismatches are matched by fingerprint with indexed anti/semi joins,
+        so the comparison never loads either run into memory. Counts are
+        per category; with status, one page of those records is returned.
+        """
+        runs = {'run': run_id, 'base': base_run_id}
+        categories = [category] if category else None
+        counts = {}
+        with closing(cls._connect()) as conn:
+            for name in cls.DELTA_STATUSES:
+                listed, other, matched = cls._delta_side(name)
+                sql = (
+                    f'SELECT category, COUNT(*) FROM mismatches m WHERE m.run_id = ? '
+                    f'AND {"" if matched else "NOT "}EXISTS (SELECT 1 FROM mismatches o WHERE o.run_id = ? AND o.fingerprint = m.fingerprint)'
+                )
+                params = [runs[listed], runs[other]]
+                if categories:
+                    sql += ' AND m.category = ?'
+                    params.extend(categories)
+                for row_category, count in conn.execute(sql + ' GROUP BY category', params):
+                    counts.setdefault(row_category, dict.fromkeys(cls.DELTA_STATUSES, 0))[name] = count
+
+            result = {
+                'base_run_id': base_run_id,
+                'run_id': run_id,
+                'totals': {name: sum(category_counts[name] for category_counts in counts.values()) for name in cls.DELTA_STATUSES},
+                'categories': counts
+            }
+            if status is None:
+                return result
+            if status not in cls.DELTA_STATUSES:
+                raise ValueError(f"status must be one of: {', '.join(cls.DELTA_STATUSES)}")
+
+            limit = cls.MAX_PAGE_SIZE if limit is None else limit
+            if limit < 1:
+                raise ValueError("limit must be a positive integer")
+            limit = min(limit, cls.MAX_PAGE_SIZE)
+            listed, other, matched = cls._delta_side(status)
+            sql = (
+                f'SELECT seq, category, record FROM mismatches m WHERE m.run_id = ? AND m.seq > ? '
+                f'AND {"" if matched else "NOT "}EXISTS (SELECT 1 FROM mismatches o WHERE o.run_id = ? AND o.fingerprint = m.fingerprint)'
+            )
+            params = [runs[listed], cursor or 0, runs[other]]
+            if categories:
+                sql += ' AND m.category = ?'
+                params.extend(categories)
+            rows = conn.execute(sql + ' ORDER BY seq LIMIT ?', (*params, limit + 1)).fetchall()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = str(rows[-1]['seq'])
+        result['status'] = status
+        result['records'] = [{'category': row['category'], **json.loads(row['record'])} for row in rows]
+        result['pagination'] = {
+            'limit': limit,
+            'next_cursor': next_cursor,
+            'total_matching': sum(category_counts[status] for category_counts in counts.values())
+        }
+        return result
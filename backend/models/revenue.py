@@ -1,4 +1,5 @@
 from models.base import BaseModel
+from models.reconciliation_aggregates import ReconciliationAggregates
 import random
 from datetime import datetime, timedelta
 
@@ -51,14 +52,18 @@ class RevenueModel(BaseModel):
     
     @classmethod
     def get_dashboard_metrics(cls):
-        print(0/0)
         """Get metrics for the dashboard"""
+        reconciliation = ReconciliationAggregates.summary(
+            ReconciliationAggregates.NETWORK_SOURCES + ReconciliationAggregates.MEDIATION_SOURCES + ReconciliationAggregates.CRM_SOURCES
+        )
         return {
             'total_revenue': 12458932.45,
             'revenue_growth': 0.023,
             'average_revenue_per_user': 42.35,
-            'leakage_detected': 0.2,
-            'leakage_value': 12345.67,
+            'leakage_detected': reconciliation['summary']['discrepancy_percentage'],
+            'leakage_value': reconciliation['summary']['financial_impact'],
+            'leakage_trend': reconciliation['trend'],
+            'top_leakage_sources': reconciliation['top_discrepancies'],
             'churn_rate': 2.1,
             'revenue_by_channel': [
                 {'name': 'Voice', 'value': 4523651.23},
@@ -76,42 +81,20 @@ class RevenueModel(BaseModel):
             ]
         }
     
+    @staticmethod
+    def _reconciliation_view(sources, records_key):
+        """Shape materialized aggregates like the reconciliation dashboards expect"""
+        aggregates = ReconciliationAggregates.summary(sources)
+        summary = aggregates['summary']
+        summary[records_key] = summary.pop('total_records')
+        return aggregates
+
     @classmethod
     def get_network_vs_billing(cls):
         """Get network vs billing reconciliation data"""
-        return {
-            'summary': {
-                'total_network_records': 1245789,
-                'total_billing_records': 1243567,
-                'discrepancy_count': 2222,
-                'discrepancy_percentage': 0.18,
-                'financial_impact': 156789.45
-            },
-            'trend': cls.generate_time_series(days=14, base_value=0.2, volatility=0.1),
-            'top_discrepancies': [
-                {'service_type': 'International Roaming', 'count': 876, 'value': 65432.12},
-                {'service_type': 'Premium SMS', 'count': 543, 'value': 43210.98},
-                {'service_type': 'Data Bundles', 'count': 432, 'value': 32109.87},
-                {'service_type': 'Voice Calls', 'count': 371, 'value': 15678.90}
-            ]
-        }
+        return cls._reconciliation_view(ReconciliationAggregates.NETWORK_SOURCES, 'total_network_records')
     
     @classmethod
     def get_mediation_vs_billing(cls):
         """Get mediation vs billing reconciliation data"""
-        return {
-            'summary': {
-                'total_mediation_records': 9876543,
-                'total_billing_records': 9875432,
-                'discrepancy_count': 1111,
-                'discrepancy_percentage': 0.01,
-                'financial_impact': 87654.32
-            },
-            'trend': cls.generate_time_series(days=14, base_value=0.015, volatility=0.2),
-            'top_discrepancies': [
-                {'service_type': 'Content Services', 'count': 456, 'value': 34567.89},
-                {'service_type': 'Third-party Billing', 'count': 321, 'value': 23456.78},
-                {'service_type': 'Premium Services', 'count': 234, 'value': 12345.67},
-                {'service_type': 'Subscription Services', 'count': 100, 'value': 9876.54}
-            ]
-        }
\ No newline at end of file
+        return cls._reconciliation_view(ReconciliationAggregates.MEDIATION_SOURCES, 'total_mediation_records')
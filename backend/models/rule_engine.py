@@ -0,0 +1,210 @@
+import os
+import re
+import json
+import hashlib
+import threading
+import pandas as pd # type: ignore
+
+
+class RuleEngine:
+    """Declarative mismatch rules compiled to one DataFrame.eval per frame
+
+    Rule sets live in config/mismatch_rules.json. Each rule has a name (a
+    Python identifier), a condition in DataFrame.eval syntax (backticks
+    around column names with spaces), a reason, a category and the columns
+    it reads. Columns listed under parse_dates, for a whole rule set or a
+    single rule, are compared as dates by those rules only. {placeholders}
+    in any of these are filled from the keyword arguments given at
+    evaluation, so one rule set serves the data, SMS and voice reconcilers.
+    The rules of a set that parse the same dates are evaluated together
+    over just the columns they declare, with numexpr when it is installed.
+    """
+
+    CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config', 'mismatch_rules.json')
+
+    IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+    # Condition tokens understood by sql(): backticked column, string, number, comparison, bracket, word
+    TOKEN = re.compile(r"\s*(?:(`[^`]+`)|('(?:[^']|'')*')|(\d+(?:\.\d+)?)|(==|!=|<=|>=|<|>)|([()])|([A-Za-z_][A-Za-z0-9_]*))")
+    SQL_OPERATORS = {'==': '=', '!=': '<>', '<=': '<=', '>=': '>=', '<': '<', '>': '>'}
+
+    # Formats tried, in order, when a rule set parses a date column in SQL
+    SQL_DATE_FORMATS = ['%m/%d/%Y %H:%M', '%m/%d/%Y %H:%M:%S', '%m/%d/%Y', '%Y-%m-%d %H:%M:%S', '%Y-%m-%d']
+
+    _lock = threading.Lock()
+    _config = None
+    _config_mtime = None
+    _compiled = {}
+
+    @classmethod
+    def _load_config(cls):
+        mtime = os.path.getmtime(cls.CONFIG_PATH)
+        if cls._config is None or mtime != cls._config_mtime:
+            with open(cls.CONFIG_PATH) as f:
+                cls._config = json.load(f)
+            cls._config_mtime = mtime
+            cls._compiled = {}
+        return cls._config
+
+    @classmethod
+    def digest(cls):
+        """Short hash of the rules file, naming the rule set a result was computed with"""
+        with open(cls.CONFIG_PATH, 'rb') as f:
+            return hashlib.blake2b(f.read(), digest_size=8).hexdigest()
+
+    @staticmethod
+    def _fill(value, params):
+        return value.format(**params) if isinstance(value, str) else value
+
+    @classmethod
+    def compile(cls, ruleset, **params):
+        """Compiled rule set: rules, parsed date columns, referenced columns and the eval program"""
+        with cls._lock:
+            config = cls._load_config()
+            key = (ruleset, tuple(sorted(params.items())))
+            if key in cls._compiled:
+                return cls._compiled[key]
+            if ruleset not in config:
+                raise ValueError(f"Unknown mismatch rule set: {ruleset}")
+
+            spec = config[ruleset]
+            set_dates = {cls._fill(column, params): date_format for column, date_format in spec.get('parse_dates', {}).items()}
+            rules = []
+            programs = {}
+            for rule in spec['rules']:
+                compiled = {
+                    field: cls._fill(value, params) for field, value in rule.items() if field not in ('columns', 'parse_dates')
+                }
+                compiled['columns'] = [cls._fill(column, params) for column in rule.get('columns', [])]
+                compiled['parse_dates'] = {
+                    **set_dates,
+                    **{cls._fill(column, params): date_format for column, date_format in rule.get('parse_dates', {}).items()}
+                }
+                if not cls.IDENTIFIER.match(compiled['name']):
+                    raise ValueError(f"Rule name {compiled['name']!r} in {ruleset} is not an identifier")
+                rules.append(compiled)
+                # Rule outputs are prefixed so they can never shadow an input column
+                dates = tuple(sorted(compiled['parse_dates'].items(), key=lambda item: item[0]))
+                programs.setdefault(dates, []).append(f"__rule_{compiled['name']} = {compiled['condition']}")
+
+            columns = list(dict.fromkeys(column for rule in rules for column in rule['columns']))
+            compiled_set = {
+                'rules': rules,
+                'columns': columns,
+                'parse_dates': {column: date_format for rule in rules for column, date_format in rule['parse_dates'].items()},
+                # One program per set of parsed date columns
+                'programs': [(dict(dates), '\n'.join(program)) for dates, program in programs.items()]
+            }
+            cls._compiled[key] = compiled_set
+            return compiled_set
+
+    @classmethod
+    def rules(cls, ruleset, **params):
+        return cls.compile(ruleset, **params)['rules']
+
+    @classmethod
+    def reason(cls, ruleset, rule_name, **params):
+        for rule in cls.rules(ruleset, **params):
+            if rule['name'] == rule_name:
+                return rule['reason']
+        raise ValueError(f"Unknown rule {rule_name} in {ruleset}")
+
+    @classmethod
+    def evaluate(cls, ruleset, df, **params):
+        """Boolean frame with one column per rule, aligned with df"""
+        compiled = cls.compile(ruleset, **params)
+        missing = [column for column in compiled['columns'] if column not in df.columns]
+        if missing:
+            raise ValueError(f"Rule set {ruleset} needs columns missing from the data: {', '.join(missing)}")
+
+        results = pd.DataFrame(index=df.index)
+        outputs = {}
+        for parse_dates, program in compiled['programs']:
+            frame = df[compiled['columns']].copy()
+            for column, date_format in parse_dates.items():
+                if column in frame.columns:
+                    frame[column] = pd.to_datetime(frame[column], format=date_format, errors='coerce')
+            frame.eval(program, inplace=True)
+            outputs.update({column: frame[column] for column in frame.columns if column.startswith('__rule_')})
+        for rule in compiled['rules']:
+            results[rule['name']] = outputs[f"__rule_{rule['name']}"].fillna(False).astype(bool)
+        return results
+
+    @staticmethod
+    def _sql_column(name):
+        return '"' + name.replace('"', '""') + '"'
+
+    @classmethod
+    def _sql_date(cls, column, date_format):
+        formats = [date_format] if date_format else cls.SQL_DATE_FORMATS
+        parsed = ', '.join(f"try_strptime(CAST({column} AS VARCHAR), '{fmt}')" for fmt in formats)
+        return f"COALESCE({parsed})"
+
+    @classmethod
+    def _sql_condition(cls, condition, parse_dates):
+        """Translate one DataFrame.eval condition to SQL with pandas' null semantics"""
+        tokens, position = [], 0
+        while position < len(condition.rstrip()):
+            match = cls.TOKEN.match(condition, position)
+            if not match:
+                raise ValueError(f"Cannot translate condition to SQL: {condition}")
+            position = match.end()
+            column, string, number, operator, bracket, word = match.groups()
+            if column or (word and word.lower() not in ('and', 'or', 'not')):
+                name = column[1:-1] if column else word
+                tokens.append(('column', name))
+            elif string or number:
+                tokens.append(('literal', string or number))
+            elif operator:
+                tokens.append(('operator', operator))
+            else:
+                tokens.append(('sql', (bracket or word).upper()))
+
+        def operand(token, as_date):
+            kind, text = token
+            if kind == 'literal':
+                return text
+            if text in parse_dates or as_date:
+                return cls._sql_date(cls._sql_column(text), parse_dates.get(text))
+            return cls._sql_column(text)
+
+        # Comparisons with a null are False in pandas except !=, which is True
+        sql, index = [], 0
+        while index < len(tokens):
+            kind, text = tokens[index]
+            if kind in ('column', 'literal') and index + 2 < len(tokens) and tokens[index + 1][0] == 'operator':
+                left, right = tokens[index], tokens[index + 2]
+                operator = tokens[index + 1][1]
+                # pandas parses the other side of a comparison with a date column, so must SQL
+                as_date = any(token[0] == 'column' and token[1] in parse_dates for token in (left, right))
+                default = 'TRUE' if operator == '!=' else 'FALSE'
+                sql.append(f"COALESCE({operand(left, as_date)} {cls.SQL_OPERATORS[operator]} {operand(right, as_date)}, {default})")
+                index += 3
+            elif kind in ('sql',):
+                sql.append(text)
+                index += 1
+            else:
+                raise ValueError(f"Cannot translate condition to SQL: {condition}")
+        return ' '.join(sql)
+
+    @classmethod
+    def sql(cls, ruleset, date_formats=None, **params):
+        """SQL boolean expression per rule, for engines that evaluate the rules in the database
+
+        date_formats fills in formats the rule set leaves to pandas to infer
+        (see SqlReconciliation.date_formats).
+        """
+        compiled = cls.compile(ruleset, **params)
+        date_formats = date_formats or {}
+        return {
+            rule['name']: cls._sql_condition(rule['condition'], {
+                column: date_format or date_formats.get(column) for column, date_format in rule['parse_dates'].items()
+            })
+            for rule in compiled['rules']
+        }
+
+    @classmethod
+    def select(cls, ruleset, df, **params):
+        """Rows of df each rule fires on, as {rule name: DataFrame}"""
+        results = cls.evaluate(ruleset, df, **params)
+        return {name: df[results[name]] for name in results.columns}
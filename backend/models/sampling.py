@@ -0,0 +1,127 @@
+import math
+import pandas as pd # type: ignore
+
+
+class SampledReconciliation:
+    """MSISDN-hash sampling for approximate network vs billing reconciliation
+
+    A subscriber is in the sample when the hash of its MSISDN falls in the
+    first `fraction` of the hash space, so the network and billing samples
+    contain the same subscribers and every rule sees both sides of each of
+    them. The normal rules run on the sample; estimate() scales the counts
+    back up and attaches confidence intervals that treat each subscriber as
+    a sampling unit, because mismatches cluster by MSISDN.
+    """
+
+    DEFAULT_FRACTION = 0.1
+    BUCKETS = 10000
+    CONFIDENCE = 0.95
+    # Two-sided normal quantile for CONFIDENCE
+    Z = 1.959964
+    # 95% upper bound on the count of an event never seen in the sample
+    RULE_OF_THREE = 3.0
+
+    @classmethod
+    def query_fraction(cls, args):
+        """Sample fraction requested by mode=sample[&fraction=], or None for an exact run"""
+        mode = args.get('mode', 'exact')
+        if mode == 'exact':
+            return None
+        if mode != 'sample':
+            raise ValueError("mode must be 'exact' or 'sample'")
+        value = args.get('fraction')
+        if value is None or value == '':
+            return cls.DEFAULT_FRACTION
+        try:
+            fraction = float(value)
+        except ValueError:
+            raise ValueError("fraction must be a number in (0, 1]")
+        if not 0 < fraction <= 1:
+            raise ValueError("fraction must be a number in (0, 1]")
+        return fraction
+
+    @staticmethod
+    def msisdn_keys(values):
+        """MSISDNs as canonical strings, so 9959650797 and 9959650797.0 hash alike"""
+        return pd.Series(values).astype(str).str.strip().str.replace(r'\.0$', '', regex=True)
+
+    @classmethod
+    def select(cls, df, fraction, column='MSISDN'):
+        """Rows of df whose MSISDN hashes into the sample"""
+        if fraction >= 1:
+            return df
+        hashes = pd.util.hash_pandas_object(cls.msisdn_keys(df[column]), index=False).to_numpy()
+        return df[hashes % cls.BUCKETS < round(fraction * cls.BUCKETS)]
+
+    @classmethod
+    def records_per_msisdn(cls, df_Network, df_Billing, column='MSISDN'):
+        """Sampled records per subscriber, counted like total_records (the larger side)"""
+        network = cls.msisdn_keys(df_Network[column]).value_counts()
+        billing = cls.msisdn_keys(df_Billing[column]).value_counts()
+        return pd.concat([network, billing], axis=1).fillna(0).max(axis=1)
+
+    @staticmethod
+    def records_key(count_key):
+        return count_key.replace('mismatch_count', 'mismatched_records').replace('_count', '_records')
+
+    @classmethod
+    def estimate(cls, data, fraction, records_per_msisdn, population_records):
+        """Estimated mismatch counts and rates per category, with confidence intervals
+
+        Counts use the Horvitz-Thompson estimator for a Bernoulli sample of
+        subscribers; rates are ratio estimates (mismatches over records in
+        the sample) with a linearised variance. Categories whose records are
+        not listed per row (e.g. duplicates) are left out.
+        """
+        x = records_per_msisdn
+        sampled_records = float(x.sum())
+        finite = (1 - fraction) / fraction ** 2
+
+        categories = {}
+        for count_key, count in data.items():
+            records_key = cls.records_key(count_key)
+            if not count_key.endswith('_count') or count_key == records_key:
+                continue
+            records = data.get(records_key)
+            if not isinstance(records, list) or len(records) != count:
+                continue
+
+            per_msisdn = (
+                cls.msisdn_keys([record.get('MSISDN') for record in records]).value_counts()
+                if records else pd.Series(dtype=float)
+            )
+            y = per_msisdn.reindex(x.index.union(per_msisdn.index), fill_value=0).astype(float)
+            units = x.reindex(y.index, fill_value=0).astype(float)
+
+            estimated = count / fraction
+            spread = cls.Z * math.sqrt(finite * float((y ** 2).sum()))
+
+            rate = count / sampled_records if sampled_records else 0.0
+            if sampled_records:
+                residual = y - rate * units
+                rate_spread = cls.Z * math.sqrt(finite * float((residual ** 2).sum())) / (sampled_records / fraction)
+            else:
+                rate_spread = 0.0
+            if count == 0 and fraction < 1:
+                # No mismatch in the sample: the variance estimate is zero, use the rule of three
+                spread = cls.RULE_OF_THREE / fraction
+                rate_spread = cls.RULE_OF_THREE / sampled_records if sampled_records else 1.0
+
+            categories[count_key[:-len('_count')]] = {
+                'observed': int(count),
+                'estimated_count': round(estimated),
+                # The sampled mismatches are certain, so they bound the interval below
+                'count_ci': [round(max(count, estimated - spread)), round(estimated + spread)],
+                'estimated_rate': round(rate, 6),
+                'rate_ci': [round(max(0.0, rate - rate_spread), 6), round(min(1.0, rate + rate_spread), 6)]
+            }
+
+        return {
+            'mode': 'sample',
+            'fraction': fraction,
+            'confidence': cls.CONFIDENCE,
+            'sampled_msisdns': int(len(x)),
+            'sampled_records': int(sampled_records),
+            'population_records': int(population_records),
+            'categories': categories
+        }
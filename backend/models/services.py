@@ -1,4 +1,13 @@
 from models.base import BaseModel
+from models.leakage import NetworkLeakage
+from models.reconciliation_aggregates import ReconciliationAggregates
+from models.rule_engine import RuleEngine
+from models.sampling import SampledReconciliation
+from models.heavy_hitters import TopOffenders
+from models.sql_reconciliation import SqlReconciliation
+from models.merge_guard import MergeGuard, MemoryBudgetExceeded
+from models.projection import ResponseProjection
+from models.usage_partitions import UsagePartitions
 import random
 import os
 from datetime import datetime, timedelta
@@ -10,6 +19,73 @@ import time
 class ServicesModel(BaseModel):
     """Model for telecom services data"""
 
+    ASSETS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'assets')
+
+    # (billing file, network file) read by each optimized reconciliation
+    DATA_FILES = (
+        os.path.join(ASSETS_DIR, 'Network_Billing_DATA', 'Billing_100_VSDN.csv'),
+        os.path.join(ASSETS_DIR, 'Network_Billing_DATA', 'Network_100_VSDN.csv')
+    )
+    SMS_FILES = (
+        os.path.join(ASSETS_DIR, 'Network_Billing_SMS', 'Billing_SMS_Big.csv'),
+        os.path.join(ASSETS_DIR, 'Network_Billing_SMS', 'Network_SMS_Big.csv')
+    )
+    VOICE_FILES = (
+        os.path.join(ASSETS_DIR, 'Network_Billing_VOICE', 'Billing_Voice_Big.csv'),
+        os.path.join(ASSETS_DIR, 'Network_Billing_VOICE', 'Network_Voice_Big.csv')
+    )
+
+    # Columns and rule sets of each usage type's reconciliation
+    NETWORK_RECONCILIATIONS = {
+        'data': {
+            'record_columns': ['MSISDN', 'Account Status', 'Usage Type', 'Usage Sub Type', 'Transaction Date', 'Download (MB)', 'Service ID', 'Service Name', 'Service Status', 'Service Start Date', 'Service End Date'],
+            'date': 'Transaction Date',
+            'transaction_keys': ['MSISDN', 'Service ID', 'Service Name', 'Service Start Date', 'Service End Date'],
+            'service_keys': ['MSISDN', 'Account Status', 'Usage Type', 'Usage Sub Type', 'Transaction Date', 'Download (MB)'],
+            'transaction_ruleset': 'network_transaction',
+            'transaction_params': {'date': 'Transaction Date', 'usage': 'Download (MB)'}
+        },
+        'sms': {
+            'record_columns': ['MSISDN', 'Account Status', 'Usage Type', 'Usage Sub Type', 'Transaction Date', 'Count', 'Service ID', 'Service Name', 'Service Status', 'Service Start Date', 'Service End Date'],
+            'date': 'Transaction Date',
+            'transaction_keys': ['MSISDN', 'Service ID', 'Service Name', 'Service Start Date', 'Service End Date'],
+            'service_keys': ['MSISDN', 'Account Status', 'Usage Type', 'Usage Sub Type', 'Transaction Date', 'Count'],
+            'transaction_ruleset': 'network_transaction',
+            'transaction_params': {'date': 'Transaction Date', 'usage': 'Count'}
+        },
+        'voice': {
+            'record_columns': ['MSISDN', 'Account Status', 'Usage Type', 'Usage Sub Type', 'Call Start Time', 'Call End Time', 'Duration (Mins)', 'Service ID', 'Service Name', 'Service Status', 'Service Start Date', 'Service End Date'],
+            'date': 'Call Start Time',
+            'transaction_keys': ['MSISDN', 'Service ID', 'Service Name', 'Service Start Date', 'Service End Date', 'Service Status'],
+            'service_keys': ['MSISDN', 'Account Status', 'Usage Type', 'Usage Sub Type', 'Call Start Time', 'Call End Time', 'Duration (Mins)'],
+            'transaction_ruleset': 'voice_transaction',
+            'transaction_params': {},
+            # Repeated CDRs fan out on the transaction keys; one record per MSISDN is reported
+            'transaction_caps': {'transaction_date_mismatch': 1, 'usage_mismatch': 1}
+        }
+    }
+
+    # Mismatch stages, by the rule frames they produce
+    NETWORK_STAGES = {
+        'mismatched': ('mismatched',),
+        'account_status': ('account_status_mismatch',),
+        'service_status': ('service_status_mismatch',),
+        'window': ('transaction_window_mismatch', 'msisdn_missing'),
+        'transaction': ('transaction_date_mismatch', 'usage_mismatch'),
+        'service': ('service_id_mismatch', 'service_date_mismatch')
+    }
+
+    @classmethod
+    def network_stages(cls, frames=None):
+        """Stages to run for the named rule frames (all when frames is None)"""
+        if frames is None:
+            return set(cls.NETWORK_STAGES)
+        run = {stage for stage, produced in cls.NETWORK_STAGES.items() if set(produced) & set(frames)}
+        # The Network/Billing joins run on the usage the window rules keep
+        if run & {'transaction', 'service'}:
+            run.add('window')
+        return run
+
     @staticmethod
     def generate_time_series(days=30, base_value=1000000, volatility=0.05):
         """Generate time series data for charts"""
@@ -30,7 +106,164 @@ class ServicesModel(BaseModel):
 
         return data
     @classmethod
-    def get_network_vs_billing_data_opt(cls):
+    def network_mismatches(cls, kind, files, sample=None, engine=None, frames=None, window=None):
+        """Mismatching rows of a network vs billing reconciliation, one frame per rule
+
+        Also returns the record and duplicate counts the reconcilers report.
+        engine=duckdb runs the stages as SQL (SqlReconciliation); pandas is
+        the default, and falls back to duckdb (when installed) if a merge
+        would not fit in MergeGuard's memory budget even in chunks. frames
+        names the rule frames wanted (see ResponseProjection); stages none
+        of them needs are skipped and their frames left empty. window=(from,
+        to) reconciles only the usage dated in it, read from the month
+        partitions that overlap it (UsagePartitions). When every frame is
+        wanted, their rows are also counted into a TopOffenders.
+        """
+        started = time.time()
+        engine = SqlReconciliation.engine(engine)
+        spec = cls.NETWORK_RECONCILIATIONS[kind]
+        run = cls.network_stages(frames)
+        if engine == 'pandas':
+            try:
+                mismatches = cls._network_mismatches_pandas(spec, files, sample, run, window)
+            except MemoryBudgetExceeded as e:
+                if not SqlReconciliation.available():
+                    raise
+                # DuckDB spills joins to disk instead of holding them in memory
+                print(f"{kind}: {e}; rerunning on duckdb")
+                engine = 'duckdb'
+        if engine == 'duckdb':
+            mismatches = SqlReconciliation.network_mismatches(spec, files, sample, run, window)
+        top_offenders = TopOffenders() if frames is None else None
+        for produced in cls.NETWORK_STAGES.values():
+            for frame in produced:
+                mismatches.setdefault(frame, pd.DataFrame())
+                if top_offenders is not None:
+                    top_offenders.add(mismatches[frame])
+        if top_offenders is not None:
+            mismatches['top_offenders'] = top_offenders
+        for join, statistics in mismatches['join_statistics'].items():
+            if statistics['many_to_many_keys']:
+                print(f"{kind} {join} join: {statistics['many_to_many_keys']} many-to-many keys, up to "
+                      f"{statistics['max_left_multiplicity']} x {statistics['max_right_multiplicity']} rows per key")
+        print(f"{kind} mismatches ({engine}): {time.time() - started:.2f} seconds")
+        return mismatches
+
+    @staticmethod
+    def _network_mismatches_pandas(spec, files, sample=None, run=None, window=None):
+        billing_file_path, network_file_path = files
+        record_columns = spec['record_columns']
+        mismatches = {'join_statistics': {}}
+
+        def runs(stage):
+            return run is None or stage in run
+
+        if window:
+            df_Billing = UsagePartitions.read(billing_file_path, spec['date'], window)
+            df_Network = UsagePartitions.read(network_file_path, spec['date'], window)
+        else:
+            df_Billing = pd.read_csv(billing_file_path)
+            df_Network = pd.read_csv(network_file_path)
+        if sample:
+            mismatches['population_records'] = int(max(df_Billing.shape[0], df_Network.shape[0]))
+            df_Billing = SampledReconciliation.select(df_Billing, sample)
+            df_Network = SampledReconciliation.select(df_Network, sample)
+            mismatches['records_per_msisdn'] = SampledReconciliation.records_per_msisdn(df_Network, df_Billing)
+        mismatches['total_inc_duplicate'] = int(max(df_Billing.shape[0], df_Network.shape[0]))
+
+        # Remove leading/trailing spaces from column names
+        df_Network.columns = df_Network.columns.str.strip()
+        df_Billing.columns = df_Billing.columns.str.strip()
+
+        # Count, then remove, duplicate rows
+        mismatches['total_duplicates'] = int(
+            df_Billing.duplicated(subset=record_columns).sum() + df_Network.duplicated(subset=record_columns).sum()
+        )
+        df_Network = df_Network.drop_duplicates(subset=record_columns)
+        df_Billing = df_Billing.drop_duplicates(subset=record_columns)
+        mismatches['network_records'] = len(df_Network)
+        mismatches['billing_records'] = len(df_Billing)
+
+        # Network records with no identical billing record
+        if runs('mismatched'):
+            merged_df = pd.merge(
+                df_Network,
+                df_Billing,
+                on=record_columns,
+                how='outer',
+                suffixes=('_Network', '_Billing'),
+                indicator=True,
+                # Both sides are deduplicated on the merge keys, so this cannot fan out
+                validate='one_to_one'
+            )
+            mismatches['mismatched'] = merged_df[merged_df['_merge'] == 'left_only'].copy()
+            del merged_df
+
+        # Active services on inactive accounts
+        if runs('account_status'):
+            df_Network_filtered = df_Network[df_Network['Account Status'] == "I"]
+            account_rules = RuleEngine.evaluate('network_account', df_Network_filtered)
+            mismatches['account_status_mismatch'] = df_Network_filtered[account_rules['account_status_mismatch']]
+
+        # Service status differences between Network and Billing
+        if runs('service_status'):
+            status_keys = ['MSISDN', 'Service ID', 'Service Name', 'Service Start Date', 'Service End Date']
+            mismatches['join_statistics']['service_status'] = MergeGuard.key_statistics(df_Network, df_Billing, status_keys)
+            mismatches.update(MergeGuard.guarded_merge(
+                df_Network,
+                df_Billing,
+                status_keys,
+                (' Network', ' Billing'),
+                lambda merged: RuleEngine.select('network_service_status', merged),
+                label='service status merge'
+            ))
+
+        if not runs('window'):
+            return mismatches
+
+        # Active usage outside its service window, and usage in it from subscribers Billing lacks
+        active_records = df_Network[
+            (df_Network['Account Status'] == "A") &
+            (df_Network['Service Status'] == "A")
+        ]
+        window_rules = RuleEngine.evaluate('network_service_window', active_records, date=spec['date'])
+        mismatches['transaction_window_mismatch'] = active_records[window_rules['transaction_window_mismatch']]
+        valid_transaction_records = active_records[window_rules['transaction_in_window']]
+        mismatches['msisdn_missing'] = valid_transaction_records[~valid_transaction_records['MSISDN'].isin(df_Billing['MSISDN'])]
+
+        # Network usage inside its service window against the Billing records of the same subscribers
+        df_Network_filtered = valid_transaction_records
+        df_Billing_filtered = df_Billing[
+            df_Billing['MSISDN'].isin(df_Network_filtered['MSISDN'])
+        ]
+        for join, keys, ruleset, params, caps in (
+            ('transaction', spec['transaction_keys'], spec['transaction_ruleset'], spec['transaction_params'], spec.get('transaction_caps')),
+            ('service', spec['service_keys'], 'network_service', {}, None)
+        ):
+            if not runs(join):
+                continue
+            mismatches['join_statistics'][join] = MergeGuard.key_statistics(df_Network_filtered, df_Billing_filtered, keys)
+            mismatches.update(MergeGuard.guarded_merge(
+                df_Network_filtered,
+                df_Billing_filtered,
+                keys,
+                ('_Network', '_Billing'),
+                lambda merged, ruleset=ruleset, params=params: RuleEngine.select(ruleset, merged, **params),
+                label=f'{ruleset} merge',
+                caps=caps
+            ))
+        return mismatches
+
+    @classmethod
+    def get_network_vs_billing_data_opt(cls, sample=None, files=None, engine=None, projection=None, window=None):
+        """Reconcile data usage
+
+        sample=<fraction> runs on an MSISDN-hash sample and adds estimates;
+        files=(billing, network) reads other inputs than the bundled assets;
+        engine=pandas|duckdb picks the engine (default REVENUEFIX_ENGINE, else pandas);
+        projection=ResponseProjection skips work no requested section needs;
+        window=(from, to) dates limits it to the usage dated in that window.
+        """
 
         start_time = time.time()
 
@@ -64,57 +297,21 @@ class ServicesModel(BaseModel):
                 'service_distribution': []
             }
         
-        curr_dir = os.path.dirname(os.path.abspath(__file__))
-        billing_file_path = os.path.join(curr_dir, '..', 'assets', 'Network_Billing_DATA', 'Billing_100_VSDN.csv')
-        network_file_path = os.path.join(curr_dir, '..', 'assets', 'Network_Billing_DATA', 'Network_100_VSDN.csv')
+        projection = projection or ResponseProjection()
+        leakage = NetworkLeakage('Transaction Date', 'Download (MB)')
+        mismatches = cls.network_mismatches('data', files or cls.DATA_FILES, sample, engine, projection.network_frames(), window)
+        total_inc_duplicate = mismatches['total_inc_duplicate']
+        total_duplicates = mismatches['total_duplicates']
 
-        df_Billing = pd.read_csv(billing_file_path)
-        df_Network = pd.read_csv(network_file_path)
-        total_inc_duplicate = int(max(df_Billing.shape[0], df_Network.shape[0]))
-        
-        t1 = time.time()
-        # Clean and prepare data
-        # Remove leading/trailing spaces from column names
-        df_Network.columns = df_Network.columns.str.strip()
-        df_Billing.columns = df_Billing.columns.str.strip()
-
-        # Identify duplicate rows in CRM and Billing
-        billing_duplicates = df_Billing.duplicated(subset=['MSISDN', 'Account Status', 'Usage Type', 'Usage Sub Type', 'Transaction Date', 'Download (MB)', 'Service ID', 'Service Name', 'Service Status',	'Service Start Date', 'Service End Date']).sum()
-        network_duplicates = df_Network.duplicated(subset=['MSISDN', 'Account Status', 'Usage Type', 'Usage Sub Type', 'Transaction Date', 'Download (MB)', 'Service ID', 'Service Name', 'Service Status',	'Service Start Date', 'Service End Date']).sum()
-        total_duplicates = int(billing_duplicates + network_duplicates)
-
-        # Remove duplicates for analysis
-        df_Network = df_Network.drop_duplicates(subset=['MSISDN', 'Account Status', 'Usage Type', 'Usage Sub Type', 'Transaction Date', 'Download (MB)', 'Service ID', 'Service Name', 'Service Status', 'Service Start Date', 'Service End Date'])
-        df_Billing = df_Billing.drop_duplicates(subset=['MSISDN', 'Account Status', 'Usage Type', 'Usage Sub Type', 'Transaction Date', 'Download (MB)', 'Service ID', 'Service Name', 'Service Status', 'Service Start Date', 'Service End Date'])
-
-        
-
-        print(f"T1: {time.time() - t1:.2f} seconds") 
-
-        t2 = time.time()
-
-        # Merge datasets on MSISDN
-        merged_df = pd.merge(
-            df_Network,
-            df_Billing,
-            on=['MSISDN', 'Account Status', 'Usage Type', 'Usage Sub Type', 'Transaction Date', 'Download (MB)', 'Service ID', 'Service Name', 'Service Status', 'Service Start Date', 'Service End Date'],
-            how='outer',
-            suffixes=('_Network', '_Billing'),
-            indicator=True
-
-        )
-
-
-        mismatched_records = merged_df[merged_df['_merge'] == 'left_only'].copy()
+        mismatched_records = mismatches['mismatched']
 
         # Append mismatched records to metrics
-        metrics['data']['mismatched_records'].extend(mismatched_records.to_dict(orient='records'))
+        metrics['data']['mismatched_records'].extend(projection.records('mismatched_records', mismatched_records, leakage))
         metrics['data']['mismatch_count'] += len(mismatched_records)
 
         # Process mismatched records to calculate monthly mismatch trend
-        if metrics['data']['mismatched_records']:
-            # Convert mismatched records to a DataFrame for efficient processing
-            mismatched_df = pd.DataFrame(metrics['data']['mismatched_records'])
+        if len(mismatched_records) and projection.wants('revenue_trend'):
+            mismatched_df = mismatched_records[['Transaction Date']].copy()
 
             # Ensure 'Transaction Date_Network' is in datetime format
             mismatched_df['Transaction Date'] = pd.to_datetime(
@@ -132,201 +329,98 @@ class ServicesModel(BaseModel):
                 {'date': period.strftime('%m/%Y'), 'value': count} for period, count in mismatch_trend.items()
             ]
 
-        
         #total records
         metrics['data']['total_records'] = total_inc_duplicate
         #total duplicates
         metrics['data']['duplicate_count'] = total_duplicates
+        # Key multiplicities of the Network/Billing joins
+        metrics['data']['join_statistics'] = mismatches['join_statistics']
 
-
-        # Filter relevant rows
-        df_Network_filtered = df_Network[df_Network['Account Status'] == "I"]
-
-        # Optimize data types
-        df_Network_filtered['Account Status'] = df_Network_filtered['Account Status'].astype('category')
-        df_Network_filtered['Service Status'] = df_Network_filtered['Service Status'].astype('category')
-
-        print(f"T2: {time.time() - t2:.2f} seconds")   
-
-        t3 = time.time()
-
-        # Merge datasets on common keys for comparison
-        serv_status_df = pd.merge(
-            df_Network, 
-            df_Billing, 
-            on=['MSISDN','Service ID', 'Service Name', 'Service Start Date', 'Service End Date'], 
-            how='inner',
-            suffixes=(' Network', ' Billing')
-        )
         # Vectorized Account Status mismatch
-        account_status_mismatch = (
-            (df_Network_filtered['Account Status'] == "I") & 
-            (df_Network_filtered['Service Status'] != "I")
-        )
-        if account_status_mismatch.any():
-            metrics['data']['account_status_mismatch_count'] = account_status_mismatch.sum()
-            metrics['data']['account_status_mismatched_records'] = df_Network_filtered[account_status_mismatch].to_dict(orient='records')
+        account_status_mismatch = mismatches['account_status_mismatch']
+        if len(account_status_mismatch):
+            metrics['data']['account_status_mismatch_count'] = len(account_status_mismatch)
+            metrics['data']['account_status_mismatched_records'] = projection.records('account_status_mismatched_records', account_status_mismatch, leakage)
 
         # Vectorized Service Status mismatch
-        service_status_mismatch = (
-            ((serv_status_df['Service Status Network'] == "A") & (serv_status_df['Service Status Billing'] == "I")) |
-            ((serv_status_df['Service Status Network'] == "I") & (serv_status_df['Service Status Billing'] == "A"))
-        )
-        if service_status_mismatch.any():
-            mismatched_records = serv_status_df[service_status_mismatch].copy()
+        service_status_mismatch = mismatches['service_status_mismatch']
+        if len(service_status_mismatch):
+            mismatched_records = service_status_mismatch.copy()
             mismatched_records['Billing Service Status'] = mismatched_records['Service Status Billing']
-            mismatched_records['Mismatch Reason'] = "Service Status mismatch between Network and Billing"
-            metrics['data']['service_mismatch_count'] = service_status_mismatch.sum()
-            metrics['data']['service_mismatched_records'] = mismatched_records.to_dict(orient='records')
-
-        print(f"T3: {time.time() - t3:.2f} seconds")   
-        t4 = time.time()
-
-        # Filter rows where Account Status and Service Status are both "A"
-        active_records = df_Network[
-            (df_Network['Account Status'] == "A") & 
-            (df_Network['Service Status'] == "A")
-        ]
-
+            mismatched_records['Mismatch Reason'] = RuleEngine.reason('network_service_status', 'service_status_mismatch')
+            metrics['data']['service_mismatch_count'] = len(service_status_mismatch)
+            metrics['data']['service_mismatched_records'] = projection.records('service_mismatched_records', mismatched_records, leakage)
 
         # Vectorized Transaction Date mismatch condition
-        transaction_date_mismatch = (
-            (pd.notna(active_records['Transaction Date'])) &
-            (pd.notna(active_records['Service Start Date'])) &
-            (pd.notna(active_records['Service End Date'])) &
-            ~((active_records['Service Start Date'] <= active_records['Transaction Date']) &
-            (active_records['Transaction Date'] <= active_records['Service End Date']))
-        )
+        transaction_date_mismatch = mismatches['transaction_window_mismatch']
 
         # Process transaction mismatched records
-        if transaction_date_mismatch.any():
-            mismatched_records = active_records[transaction_date_mismatch].copy()
-            mismatched_records['Mismatch Reason'] = "Transaction Date not In Between Service Start/End Date"
-            metrics['data']['transaction_mismatch_count'] = transaction_date_mismatch.sum()
-            metrics['data']['transaction_mismatched_records'] = mismatched_records.to_dict(orient='records')
-
-        # Filter rows where Transaction Date is between Service Start Date and Service End Date
-        valid_transaction_records = active_records[
-            (pd.notna(active_records['Transaction Date'])) &
-            (pd.notna(active_records['Service Start Date'])) &
-            (pd.notna(active_records['Service End Date'])) &
-            (active_records['Service Start Date'] <= active_records['Transaction Date']) &
-            (active_records['Transaction Date'] <= active_records['Service End Date'])
-        ]
+        if len(transaction_date_mismatch):
+            mismatched_records = transaction_date_mismatch.copy()
+            mismatched_records['Mismatch Reason'] = RuleEngine.reason('network_service_window', 'transaction_window_mismatch', date='Transaction Date')
+            metrics['data']['transaction_mismatch_count'] = len(transaction_date_mismatch)
+            metrics['data']['transaction_mismatched_records'] = projection.records('transaction_mismatched_records', mismatched_records, leakage)
 
         # Compare MSISDN values between Network and Billing
-        msisdn_missing_mask = ~valid_transaction_records['MSISDN'].isin(df_Billing['MSISDN'])
+        msisdn_missing = mismatches['msisdn_missing']
 
         # Process MSISDN mismatched records
-        if msisdn_missing_mask.any():
-            msisdn_missing_records = valid_transaction_records[msisdn_missing_mask].copy()
-            metrics['data']['msisdn_missing_count'] = msisdn_missing_mask.sum()
-            metrics['data']['msisdn_missing_records'] = msisdn_missing_records.to_dict(orient='records')
-        print(f"T4: {time.time() - t4:.2f} seconds")   
-        t5 = time.time()
-
-        # Filter Network dataset based on conditions
-        df_Network_filtered = df_Network[
-            (df_Network['Account Status'] == "A") &
-            (df_Network['Service Status'] == "A") &
-            (pd.to_datetime(df_Network['Transaction Date'], errors='coerce') >= pd.to_datetime(df_Network['Service Start Date'], errors='coerce')) &
-            (pd.to_datetime(df_Network['Transaction Date'], errors='coerce') <= pd.to_datetime(df_Network['Service End Date'], errors='coerce'))
-        ]
-
-        # Filter Billing dataset based on MSISDN matching
-        df_Billing_filtered = df_Billing[
-            df_Billing['MSISDN'].isin(df_Network_filtered['MSISDN'])
-        ]
-
-        print(f"T5: {time.time() - t5:.2f} seconds")   
-        t6 = time.time()
-
-        # Merge filtered datasets
-        merged_transaction_df = pd.merge(
-            df_Network_filtered,
-            df_Billing_filtered,
-            on=['MSISDN', 'Service ID', 'Service Name', 'Service Start Date', 'Service End Date'],
-            how='inner',
-            suffixes=('_Network', '_Billing')
-        )
-
-        # Merge filtered datasets
-        merged_service_df = pd.merge(
-            df_Network_filtered,
-            df_Billing_filtered,
-            on=['MSISDN', 'Account Status', 'Usage Type', 'Usage Sub Type', 'Transaction Date', 'Download (MB)'],
-            how='inner',
-            suffixes=('_Network', '_Billing')
-        )
-
-
+        if len(msisdn_missing):
+            msisdn_missing_records = msisdn_missing.copy()
+            metrics['data']['msisdn_missing_count'] = len(msisdn_missing)
+            metrics['data']['msisdn_missing_records'] = projection.records('msisdn_missing_records', msisdn_missing_records, leakage)
 
         # Transaction Date mismatch between Network and Billing
-        transaction_date_mismatch = (
-            merged_transaction_df['Transaction Date_Network'] != merged_transaction_df['Transaction Date_Billing']
-        )
+        transaction_date_mismatch = mismatches['transaction_date_mismatch']
 
         # Process Transaction Date mismatched records
-        if transaction_date_mismatch.any():
-            mismatched_records = merged_transaction_df[transaction_date_mismatch].copy()
-            mismatched_records['Mismatch Reason'] = "Transaction Date not matched between Network and Billing"
-            metrics['data']['transaction_date_mismatch_count'] = transaction_date_mismatch.sum()
-            metrics['data']['transaction_date_mismatched_records'] = mismatched_records.to_dict(orient='records')
-        print(f"T6: {time.time() - t6:.2f} seconds")   
-
-        t7 = time.time()
+        if len(transaction_date_mismatch):
+            mismatched_records = transaction_date_mismatch.copy()
+            mismatched_records['Mismatch Reason'] = RuleEngine.reason('network_transaction', 'transaction_date_mismatch', date='Transaction Date', usage='Download (MB)')
+            metrics['data']['transaction_date_mismatch_count'] = len(transaction_date_mismatch)
+            metrics['data']['transaction_date_mismatched_records'] = projection.records('transaction_date_mismatched_records', mismatched_records, leakage)
 
         # Download (MB) mismatch between Network and Billing
-        download_mismatch = (
-            merged_transaction_df['Download (MB)_Network'] != merged_transaction_df['Download (MB)_Billing']
-        )
+        download_mismatch = mismatches['usage_mismatch']
 
         # Process Download (MB) mismatched records
-        if download_mismatch.any():
-            mismatched_records = merged_transaction_df[download_mismatch].copy()
-            mismatched_records['Mismatch Reason'] = "Download (MB) mismatch between Network and Billing"
-            metrics['data']['download_mismatch_count'] = download_mismatch.sum()
-            metrics['data']['download_mismatched_records'] = mismatched_records.to_dict(orient='records')
-        
-        print(f"T7: {time.time() - t7:.2f} seconds")   
+        if len(download_mismatch):
+            mismatched_records = download_mismatch.copy()
+            mismatched_records['Mismatch Reason'] = RuleEngine.reason('network_transaction', 'usage_mismatch', date='Transaction Date', usage='Download (MB)')
+            metrics['data']['download_mismatch_count'] = len(download_mismatch)
+            metrics['data']['download_mismatched_records'] = projection.records('download_mismatched_records', mismatched_records, leakage)
 
-        t8 = time.time()
         # Service ID and Service Start/End Date mismatch
-        service_id_mismatch = (
-            merged_service_df['Service ID_Network'] != merged_service_df['Service ID_Billing']
-        )
+        service_id_mismatch = mismatches['service_id_mismatch']
 
-        if service_id_mismatch.any():
-            mismatched_records = merged_service_df[service_id_mismatch].copy()
+        if len(service_id_mismatch):
+            mismatched_records = service_id_mismatch.copy()
             mismatched_records['Billing Service ID'] = mismatched_records['Service ID_Billing']
             mismatched_records['Billing Service Name'] = mismatched_records['Service Name_Billing']
-            mismatched_records['Mismatch Reason'] = "Service mismatch between Network and Billing"
-            metrics['data']['service_mismatch_count'] += service_id_mismatch.sum()
-            metrics['data']['service_mismatched_records'].extend(mismatched_records.to_dict(orient='records'))
+            mismatched_records['Mismatch Reason'] = RuleEngine.reason('network_service', 'service_id_mismatch')
+            metrics['data']['service_mismatch_count'] += len(service_id_mismatch)
+            metrics['data']['service_mismatched_records'].extend(projection.records('service_mismatched_records', mismatched_records, leakage))
 
-        service_date_mismatch = (
-            (merged_service_df['Service Start Date_Network'] != merged_service_df['Service Start Date_Billing']) |
-            (merged_service_df['Service End Date_Network'] != merged_service_df['Service End Date_Billing'])
-        )
+        service_date_mismatch = mismatches['service_date_mismatch']
 
-        if service_date_mismatch.any():
-            mismatched_records = merged_service_df[service_date_mismatch].copy()
+        if len(service_date_mismatch):
+            mismatched_records = service_date_mismatch.copy()
             mismatched_records['Billing Service Start Date'] = mismatched_records['Service Start Date_Billing']
             mismatched_records['Billing Service End Date'] = mismatched_records['Service End Date_Billing']
-            mismatched_records['Mismatch Reason'] = "Service Start/End Date mismatch between Network and Billing"
-            metrics['data']['service_mismatch_count'] += service_date_mismatch.sum()
-            metrics['data']['service_mismatched_records'].extend(mismatched_records.to_dict(orient='records'))
-        
-        print(f"T8: {time.time() - t8:.2f} seconds")   
-  
-
-        t11 = time.time() 
+            mismatched_records['Mismatch Reason'] = RuleEngine.reason('network_service', 'service_date_mismatch')
+            metrics['data']['service_mismatch_count'] += len(service_date_mismatch)
+            metrics['data']['service_mismatched_records'].extend(projection.records('service_mismatched_records', mismatched_records, leakage))
 
-       
-
-        print(f"T11: {time.time() - t11:.2f} seconds")   
-        
         t12 = time.time()
+        # Monetary impact per category and per month, from the frames valued as their records were built
+        if projection.full_records:
+            metrics['data']['leakage'] = leakage.summary()
+            # Sampled, windowed, partial and offline (files=) runs stay out of the dashboard aggregates
+            if not sample and not window and not files and projection.network_frames() is None:
+                ReconciliationAggregates.record_leakage('network_data', mismatches['network_records'], mismatches['billing_records'], metrics['data']['leakage'])
+        if 'top_offenders' in mismatches:
+            metrics['data']['top_offenders'] = mismatches['top_offenders'].summary()
+
         # Add named sections to records_display_card
         metrics['data']['records_display_card'] = [
             {
@@ -363,6 +457,9 @@ class ServicesModel(BaseModel):
 
         t13 = time.time()
 
+        if sample and projection.wants('sample'):
+            metrics['data']['sample'] = SampledReconciliation.estimate(metrics['data'], sample, mismatches['records_per_msisdn'], mismatches['population_records'])
+
         # Ensure all data in metrics is JSON serializable
         def convert_to_serializable(data):
             if isinstance(data, list):
@@ -381,7 +478,15 @@ class ServicesModel(BaseModel):
         return metrics
     
     @classmethod
-    def get_network_vs_billing_sms_opt(cls):
+    def get_network_vs_billing_sms_opt(cls, sample=None, files=None, engine=None, projection=None, window=None):
+        """Reconcile SMS usage
+
+        sample=<fraction> runs on an MSISDN-hash sample and adds estimates;
+        files=(billing, network) reads other inputs than the bundled assets;
+        engine=pandas|duckdb picks the engine (default REVENUEFIX_ENGINE, else pandas);
+        projection=ResponseProjection skips work no requested section needs;
+        window=(from, to) dates limits it to the usage dated in that window.
+        """
 
          # Initialize metrics
         metrics = {
@@ -413,50 +518,21 @@ class ServicesModel(BaseModel):
                 'service_distribution': []
             }
         
-        curr_dir = os.path.dirname(os.path.abspath(__file__))
-        billing_file_path = os.path.join(curr_dir, '..', 'assets', 'Network_Billing_SMS', 'Billing_SMS_Big.csv')
-        network_file_path = os.path.join(curr_dir, '..', 'assets', 'Network_Billing_SMS', 'Network_SMS_Big.csv')
+        projection = projection or ResponseProjection()
+        leakage = NetworkLeakage('Transaction Date', 'Count')
+        mismatches = cls.network_mismatches('sms', files or cls.SMS_FILES, sample, engine, projection.network_frames(), window)
+        total_inc_duplicate = mismatches['total_inc_duplicate']
+        total_duplicates = mismatches['total_duplicates']
 
-        df_Billing = pd.read_csv(billing_file_path)
-        df_Network = pd.read_csv(network_file_path)
-        total_inc_duplicate = int(max(df_Billing.shape[0], df_Network.shape[0]))
-        
-        # Clean and prepare data
-        # Remove leading/trailing spaces from column names
-        df_Network.columns = df_Network.columns.str.strip()
-        df_Billing.columns = df_Billing.columns.str.strip()
-
-        # Identify duplicate rows in CRM and Billing
-        billing_duplicates = df_Billing.duplicated(subset=['MSISDN', 'Account Status', 'Usage Type', 'Usage Sub Type', 'Transaction Date', 'Count', 'Service ID', 'Service Name', 'Service Status',	'Service Start Date', 'Service End Date']).sum()
-        network_duplicates = df_Network.duplicated(subset=['MSISDN', 'Account Status', 'Usage Type', 'Usage Sub Type', 'Transaction Date', 'Count', 'Service ID', 'Service Name', 'Service Status',	'Service Start Date', 'Service End Date']).sum()
-        total_duplicates = int(billing_duplicates + network_duplicates)
-
-        # Remove duplicates for analysis
-        df_Network = df_Network.drop_duplicates(subset=['MSISDN', 'Account Status', 'Usage Type', 'Usage Sub Type', 'Transaction Date', 'Count', 'Service ID', 'Service Name', 'Service Status', 'Service Start Date', 'Service End Date'])
-        df_Billing = df_Billing.drop_duplicates(subset=['MSISDN', 'Account Status', 'Usage Type', 'Usage Sub Type', 'Transaction Date', 'Count', 'Service ID', 'Service Name', 'Service Status', 'Service Start Date', 'Service End Date'])
-
-        # Merge datasets on MSISDN
-        merged_df = pd.merge(
-            df_Network,
-            df_Billing,
-            on=['MSISDN', 'Account Status', 'Usage Type', 'Usage Sub Type', 'Transaction Date', 'Count', 'Service ID', 'Service Name', 'Service Status', 'Service Start Date', 'Service End Date'],
-            how='outer',
-            suffixes=('_Network', '_Billing'),
-            indicator=True
-
-        )
-
-
-        mismatched_records = merged_df[merged_df['_merge'] == 'left_only'].copy()
+        mismatched_records = mismatches['mismatched']
 
         # Append mismatched records to metrics
-        metrics['data']['mismatched_records'].extend(mismatched_records.to_dict(orient='records'))
+        metrics['data']['mismatched_records'].extend(projection.records('mismatched_records', mismatched_records, leakage))
         metrics['data']['mismatch_count'] += len(mismatched_records)
 
         # Process mismatched records to calculate monthly mismatch trend
-        if metrics['data']['mismatched_records']:
-            # Convert mismatched records to a DataFrame for efficient processing
-            mismatched_df = pd.DataFrame(metrics['data']['mismatched_records'])
+        if len(mismatched_records) and projection.wants('revenue_trend'):
+            mismatched_df = mismatched_records[['Transaction Date']].copy()
 
             # Ensure 'Transaction Date_Network' is in datetime format
             mismatched_df['Transaction Date'] = pd.to_datetime(
@@ -475,14 +551,6 @@ class ServicesModel(BaseModel):
             ]
    
 
-        # Merge datasets on common keys for comparison
-        serv_status_df = pd.merge(
-            df_Network, 
-            df_Billing, 
-            on=['MSISDN','Service ID', 'Service Name', 'Service Start Date', 'Service End Date'], 
-            how='inner',
-            suffixes=(' Network', ' Billing')
-        )
 
         
         
@@ -490,165 +558,103 @@ class ServicesModel(BaseModel):
         metrics['data']['total_records'] = total_inc_duplicate
         #total duplicates
         metrics['data']['duplicate_count'] = total_duplicates
+        # Key multiplicities of the Network/Billing joins
+        metrics['data']['join_statistics'] = mismatches['join_statistics']
 
-        # Filter relevant rows
-        df_Network_filtered = df_Network[df_Network['Account Status'] == "I"]
-
-        # Optimize data types
-        df_Network_filtered['Account Status'] = df_Network_filtered['Account Status'].astype('category')
-        df_Network_filtered['Service Status'] = df_Network_filtered['Service Status'].astype('category')
 
         # Vectorized Account Status mismatch
-        account_status_mismatch = (
-            (df_Network_filtered['Account Status'] == "I") & 
-            (df_Network_filtered['Service Status'] != "I")
-        )
-        if account_status_mismatch.any():
-            metrics['data']['account_status_mismatch_count'] = account_status_mismatch.sum()
-            metrics['data']['account_status_mismatched_records'] = df_Network_filtered[account_status_mismatch].to_dict(orient='records')
+        account_status_mismatch = mismatches['account_status_mismatch']
+        if len(account_status_mismatch):
+            metrics['data']['account_status_mismatch_count'] = len(account_status_mismatch)
+            metrics['data']['account_status_mismatched_records'] = projection.records('account_status_mismatched_records', account_status_mismatch, leakage)
 
         # Vectorized Service Status mismatch
-        service_status_mismatch = (
-            ((serv_status_df['Service Status Network'] == "A") & (serv_status_df['Service Status Billing'] == "I")) |
-            ((serv_status_df['Service Status Network'] == "I") & (serv_status_df['Service Status Billing'] == "A"))
-        )
-        if service_status_mismatch.any():
-            mismatched_records = serv_status_df[service_status_mismatch].copy()
+        service_status_mismatch = mismatches['service_status_mismatch']
+        if len(service_status_mismatch):
+            mismatched_records = service_status_mismatch.copy()
             mismatched_records['Billing Service Status'] = mismatched_records['Service Status Billing']
-            mismatched_records['Mismatch Reason'] = "Service Status mismatch between Network and Billing"
-            metrics['data']['service_mismatch_count'] = service_status_mismatch.sum()
-            metrics['data']['service_mismatched_records'] = mismatched_records.to_dict(orient='records')
+            mismatched_records['Mismatch Reason'] = RuleEngine.reason('network_service_status', 'service_status_mismatch')
+            metrics['data']['service_mismatch_count'] = len(service_status_mismatch)
+            metrics['data']['service_mismatched_records'] = projection.records('service_mismatched_records', mismatched_records, leakage)
 
-        # Filter rows where Account Status and Service Status are both "A"
-        active_records = df_Network[
-            (df_Network['Account Status'] == "A") & 
-            (df_Network['Service Status'] == "A")
-        ]
 
 
         # Vectorized Transaction Date mismatch condition
-        transaction_date_mismatch = (
-            (pd.notna(active_records['Transaction Date'])) &
-            (pd.notna(active_records['Service Start Date'])) &
-            (pd.notna(active_records['Service End Date'])) &
-            ~((active_records['Service Start Date'] <= active_records['Transaction Date']) &
-            (active_records['Transaction Date'] <= active_records['Service End Date']))
-        )
+        transaction_date_mismatch = mismatches['transaction_window_mismatch']
 
         # Process transaction mismatched records
-        if transaction_date_mismatch.any():
-            mismatched_records = active_records[transaction_date_mismatch].copy()
-            mismatched_records['Mismatch Reason'] = "Transaction Date not In Between Service Start/End Date"
-            metrics['data']['transaction_mismatch_count'] = transaction_date_mismatch.sum()
-            metrics['data']['transaction_mismatched_records'] = mismatched_records.to_dict(orient='records')
-
-        # Filter rows where Transaction Date is between Service Start Date and Service End Date
-        valid_transaction_records = active_records[
-            (pd.notna(active_records['Transaction Date'])) &
-            (pd.notna(active_records['Service Start Date'])) &
-            (pd.notna(active_records['Service End Date'])) &
-            (active_records['Service Start Date'] <= active_records['Transaction Date']) &
-            (active_records['Transaction Date'] <= active_records['Service End Date'])
-        ]
+        if len(transaction_date_mismatch):
+            mismatched_records = transaction_date_mismatch.copy()
+            mismatched_records['Mismatch Reason'] = RuleEngine.reason('network_service_window', 'transaction_window_mismatch', date='Transaction Date')
+            metrics['data']['transaction_mismatch_count'] = len(transaction_date_mismatch)
+            metrics['data']['transaction_mismatched_records'] = projection.records('transaction_mismatched_records', mismatched_records, leakage)
+
 
         # Compare MSISDN values between Network and Billing
-        msisdn_missing_mask = ~valid_transaction_records['MSISDN'].isin(df_Billing['MSISDN'])
+        msisdn_missing = mismatches['msisdn_missing']
 
         # Process MSISDN mismatched records
-        if msisdn_missing_mask.any():
-            msisdn_missing_records = valid_transaction_records[msisdn_missing_mask].copy()
-            metrics['data']['msisdn_missing_count'] = msisdn_missing_mask.sum()
-            metrics['data']['msisdn_missing_records'] = msisdn_missing_records.to_dict(orient='records')
-
-        # Filter Network dataset based on conditions
-        df_Network_filtered = df_Network[
-            (df_Network['Account Status'] == "A") &
-            (df_Network['Service Status'] == "A") &
-            (pd.to_datetime(df_Network['Transaction Date'], errors='coerce') >= pd.to_datetime(df_Network['Service Start Date'], errors='coerce')) &
-            (pd.to_datetime(df_Network['Transaction Date'], errors='coerce') <= pd.to_datetime(df_Network['Service End Date'], errors='coerce'))
-        ]
-
-        # Filter Billing dataset based on MSISDN matching
-        df_Billing_filtered = df_Billing[
-            df_Billing['MSISDN'].isin(df_Network_filtered['MSISDN'])
-        ]
-
-        # Merge filtered datasets
-        merged_transaction_df = pd.merge(
-            df_Network_filtered,
-            df_Billing_filtered,
-            on=['MSISDN', 'Service ID', 'Service Name', 'Service Start Date', 'Service End Date'],
-            how='inner',
-            suffixes=('_Network', '_Billing')
-        )
-
-        # Merge filtered datasets
-        merged_service_df = pd.merge(
-            df_Network_filtered,
-            df_Billing_filtered,
-            on=['MSISDN', 'Account Status', 'Usage Type', 'Usage Sub Type', 'Transaction Date', 'Count'],
-            how='inner',
-            suffixes=('_Network', '_Billing')
-        )
-
-
+        if len(msisdn_missing):
+            msisdn_missing_records = msisdn_missing.copy()
+            metrics['data']['msisdn_missing_count'] = len(msisdn_missing)
+            metrics['data']['msisdn_missing_records'] = projection.records('msisdn_missing_records', msisdn_missing_records, leakage)
 
         # Transaction Date mismatch between Network and Billing
-        transaction_date_mismatch = (
-            merged_transaction_df['Transaction Date_Network'] != merged_transaction_df['Transaction Date_Billing']
-        )
+        transaction_date_mismatch = mismatches['transaction_date_mismatch']
 
         # Process Transaction Date mismatched records
-        if transaction_date_mismatch.any():
-            mismatched_records = merged_transaction_df[transaction_date_mismatch].copy()
+        if len(transaction_date_mismatch):
+            mismatched_records = transaction_date_mismatch.copy()
             mismatched_records['Billing Transaction Date'] = mismatched_records['Transaction Date_Billing']
             mismatched_records['Transaction Date'] = mismatched_records['Transaction Date_Network']
-            mismatched_records['Mismatch Reason'] = "Transaction Date not matched between Network and Billing"
-            metrics['data']['transaction_date_mismatch_count'] = transaction_date_mismatch.sum()
-            metrics['data']['transaction_date_mismatched_records'] = mismatched_records.to_dict(orient='records')
+            mismatched_records['Mismatch Reason'] = RuleEngine.reason('network_transaction', 'transaction_date_mismatch', date='Transaction Date', usage='Count')
+            metrics['data']['transaction_date_mismatch_count'] = len(transaction_date_mismatch)
+            metrics['data']['transaction_date_mismatched_records'] = projection.records('transaction_date_mismatched_records', mismatched_records, leakage)
 
         # Download (MB) mismatch between Network and Billing
-        download_mismatch = (
-            merged_transaction_df['Count_Network'] != merged_transaction_df['Count_Billing']
-        )
+        download_mismatch = mismatches['usage_mismatch']
 
         # Process Download (MB) mismatched records
-        if download_mismatch.any():
-            mismatched_records = merged_transaction_df[download_mismatch].copy()
+        if len(download_mismatch):
+            mismatched_records = download_mismatch.copy()
             mismatched_records['Billing Count'] = mismatched_records['Count_Billing']
             mismatched_records['Count'] = mismatched_records['Count_Network']
             mismatched_records['Usage Type'] = mismatched_records['Usage Type_Network']
             mismatched_records['Usage Sub Type'] = mismatched_records['Usage Sub Type_Network']
-            mismatched_records['Mismatch Reason'] = "Count mismatch between Network and Billing"
-            metrics['data']['count_mismatch_count'] = download_mismatch.sum()
-            metrics['data']['count_mismatched_records'] = mismatched_records.to_dict(orient='records')
+            mismatched_records['Mismatch Reason'] = RuleEngine.reason('network_transaction', 'usage_mismatch', date='Transaction Date', usage='Count')
+            metrics['data']['count_mismatch_count'] = len(download_mismatch)
+            metrics['data']['count_mismatched_records'] = projection.records('count_mismatched_records', mismatched_records, leakage)
         
         # Service ID and Service Start/End Date mismatch
-        service_id_mismatch = (
-            merged_service_df['Service ID_Network'] != merged_service_df['Service ID_Billing']
-        )
+        service_id_mismatch = mismatches['service_id_mismatch']
 
-        if service_id_mismatch.any():
-            mismatched_records = merged_service_df[service_id_mismatch].copy()
+        if len(service_id_mismatch):
+            mismatched_records = service_id_mismatch.copy()
             mismatched_records['Billing Service ID'] = mismatched_records['Service ID_Billing']
             mismatched_records['Billing Service Name'] = mismatched_records['Service Name_Billing']
-            mismatched_records['Mismatch Reason'] = "Service mismatch between Network and Billing"
-            metrics['data']['service_mismatch_count'] += service_id_mismatch.sum()
-            metrics['data']['service_mismatched_records'].extend(mismatched_records.to_dict(orient='records'))
+            mismatched_records['Mismatch Reason'] = RuleEngine.reason('network_service', 'service_id_mismatch')
+            metrics['data']['service_mismatch_count'] += len(service_id_mismatch)
+            metrics['data']['service_mismatched_records'].extend(projection.records('service_mismatched_records', mismatched_records, leakage))
 
-        service_date_mismatch = (
-            (merged_service_df['Service Start Date_Network'] != merged_service_df['Service Start Date_Billing']) |
-            (merged_service_df['Service End Date_Network'] != merged_service_df['Service End Date_Billing'])
-        )
+        service_date_mismatch = mismatches['service_date_mismatch']
 
-        if service_date_mismatch.any():
-            mismatched_records = merged_service_df[service_date_mismatch].copy()
+        if len(service_date_mismatch):
+            mismatched_records = service_date_mismatch.copy()
             mismatched_records['Billing Service Start Date'] = mismatched_records['Service Start Date_Billing']
             mismatched_records['Billing Service End Date'] = mismatched_records['Service End Date_Billing']
-            mismatched_records['Mismatch Reason'] = "Service Start/End Date mismatch between Network and Billing"
-            metrics['data']['service_mismatch_count'] += service_date_mismatch.sum()
-            metrics['data']['service_mismatched_records'].extend(mismatched_records.to_dict(orient='records'))
+            mismatched_records['Mismatch Reason'] = RuleEngine.reason('network_service', 'service_date_mismatch')
+            metrics['data']['service_mismatch_count'] += len(service_date_mismatch)
+            metrics['data']['service_mismatched_records'].extend(projection.records('service_mismatched_records', mismatched_records, leakage))
+
 
+        # Monetary impact per category and per month, from the frames valued as their records were built
+        if projection.full_records:
+            metrics['data']['leakage'] = leakage.summary()
+            # Sampled, windowed, partial and offline (files=) runs stay out of the dashboard aggregates
+            if not sample and not window and not files and projection.network_frames() is None:
+                ReconciliationAggregates.record_leakage('network_sms', mismatches['network_records'], mismatches['billing_records'], metrics['data']['leakage'])
+        if 'top_offenders' in mismatches:
+            metrics['data']['top_offenders'] = mismatches['top_offenders'].summary()
 
         # Add named sections to records_display_card
         metrics['data']['records_display_card'] = [
@@ -684,6 +690,9 @@ class ServicesModel(BaseModel):
 
 
 
+        if sample and projection.wants('sample'):
+            metrics['data']['sample'] = SampledReconciliation.estimate(metrics['data'], sample, mismatches['records_per_msisdn'], mismatches['population_records'])
+
         # Ensure all data in metrics is JSON serializable
         def convert_to_serializable(data):
             if isinstance(data, list):
@@ -701,7 +710,15 @@ class ServicesModel(BaseModel):
 
     
     @classmethod
-    def get_network_vs_billing_voice_opt(cls):
+    def get_network_vs_billing_voice_opt(cls, sample=None, files=None, engine=None, projection=None, window=None):
+        """Reconcile voice usage
+
+        sample=<fraction> runs on an MSISDN-hash sample and adds estimates;
+        files=(billing, network) reads other inputs than the bundled assets;
+        engine=pandas|duckdb picks the engine (default REVENUEFIX_ENGINE, else pandas);
+        projection=ResponseProjection skips work no requested section needs;
+        window=(from, to) dates limits it to the usage dated in that window.
+        """
 
          # Initialize metrics
         metrics = {
@@ -733,50 +750,21 @@ class ServicesModel(BaseModel):
                 'service_distribution': []
             }
         
-        curr_dir = os.path.dirname(os.path.abspath(__file__))
-        billing_file_path = os.path.join(curr_dir, '..', 'assets', 'Network_Billing_VOICE', 'Billing_Voice_Big.csv')
-        network_file_path = os.path.join(curr_dir, '..', 'assets', 'Network_Billing_VOICE', 'Network_Voice_Big.csv')
-
-        df_Billing = pd.read_csv(billing_file_path)
-        df_Network = pd.read_csv(network_file_path)
-        total_inc_duplicate = int(max(df_Billing.shape[0], df_Network.shape[0]))
-        
-        # Clean and prepare data
-        # Remove leading/trailing spaces from column names
-        df_Network.columns = df_Network.columns.str.strip()
-        df_Billing.columns = df_Billing.columns.str.strip()
-
-        # Identify duplicate rows in CRM and Billing
-        billing_duplicates = df_Billing.duplicated(subset=['MSISDN', 'Account Status', 'Usage Type', 'Usage Sub Type', 'Call Start Time', 'Call End Time','Duration (Mins)', 'Service ID', 'Service Name', 'Service Status',	'Service Start Date', 'Service End Date']).sum()
-        network_duplicates = df_Network.duplicated(subset=['MSISDN', 'Account Status', 'Usage Type', 'Usage Sub Type', 'Call Start Time', 'Call End Time','Duration (Mins)', 'Service ID', 'Service Name', 'Service Status',	'Service Start Date', 'Service End Date']).sum()
-        total_duplicates = int(billing_duplicates + network_duplicates)
+        projection = projection or ResponseProjection()
+        leakage = NetworkLeakage('Call Start Time', 'Duration (Mins)')
+        mismatches = cls.network_mismatches('voice', files or cls.VOICE_FILES, sample, engine, projection.network_frames(), window)
+        total_inc_duplicate = mismatches['total_inc_duplicate']
+        total_duplicates = mismatches['total_duplicates']
 
-        # Remove duplicates for analysis
-        df_Network = df_Network.drop_duplicates(subset=['MSISDN', 'Account Status', 'Usage Type', 'Usage Sub Type', 'Call Start Time', 'Call End Time','Duration (Mins)', 'Service ID', 'Service Name', 'Service Status', 'Service Start Date', 'Service End Date'])
-        df_Billing = df_Billing.drop_duplicates(subset=['MSISDN', 'Account Status', 'Usage Type', 'Usage Sub Type', 'Call Start Time', 'Call End Time','Duration (Mins)', 'Service ID', 'Service Name', 'Service Status', 'Service Start Date', 'Service End Date'])
-
-        # Merge datasets on MSISDN
-        merged_df = pd.merge(
-            df_Network,
-            df_Billing,
-            on=['MSISDN', 'Account Status', 'Usage Type', 'Usage Sub Type', 'Call Start Time', 'Call End Time', 'Duration (Mins)', 'Service ID', 'Service Name', 'Service Status', 'Service Start Date', 'Service End Date'],
-            how='outer',
-            suffixes=('_Network', '_Billing'),
-            indicator=True
-
-        )
-
-
-        mismatched_records = merged_df[merged_df['_merge'] == 'left_only'].copy()
+        mismatched_records = mismatches['mismatched']
 
         # Append mismatched records to metrics
-        metrics['data']['mismatched_records'].extend(mismatched_records.to_dict(orient='records'))
+        metrics['data']['mismatched_records'].extend(projection.records('mismatched_records', mismatched_records, leakage))
         metrics['data']['mismatch_count'] += len(mismatched_records)
 
         # Process mismatched records to calculate monthly mismatch trend
-        if metrics['data']['mismatched_records']:
-            # Convert mismatched records to a DataFrame for efficient processing
-            mismatched_df = pd.DataFrame(metrics['data']['mismatched_records'])
+        if len(mismatched_records) and projection.wants('revenue_trend'):
+            mismatched_df = mismatched_records[['Call Start Time']].copy()
 
             # Ensure 'Transaction Date_Network' is in datetime format
             mismatched_df['Call Start Time'] = pd.to_datetime(
@@ -795,14 +783,6 @@ class ServicesModel(BaseModel):
             ]
    
 
-        # Merge datasets on common keys for comparison
-        serv_status_df = pd.merge(
-            df_Network, 
-            df_Billing, 
-            on=['MSISDN','Service ID', 'Service Name', 'Service Start Date', 'Service End Date'], 
-            how='inner',
-            suffixes=(' Network', ' Billing')
-        )
 
         
         
@@ -810,182 +790,108 @@ class ServicesModel(BaseModel):
         metrics['data']['total_records'] = total_inc_duplicate
         #total duplicates
         metrics['data']['duplicate_count'] = total_duplicates
+        # Key multiplicities of the Network/Billing joins
+        metrics['data']['join_statistics'] = mismatches['join_statistics']
 
-        # Filter relevant rows
-        df_Network_filtered = df_Network[df_Network['Account Status'] == "I"]
-
-        # Optimize data types
-        df_Network_filtered['Account Status'] = df_Network_filtered['Account Status'].astype('category')
-        df_Network_filtered['Service Status'] = df_Network_filtered['Service Status'].astype('category')
 
         # Vectorized Account Status mismatch
-        account_status_mismatch = (
-            (df_Network_filtered['Account Status'] == "I") & 
-            (df_Network_filtered['Service Status'] != "I")
-        )
-        if account_status_mismatch.any():
-            metrics['data']['account_status_mismatch_count'] = account_status_mismatch.sum()
-            metrics['data']['account_status_mismatched_records'] = df_Network_filtered[account_status_mismatch].to_dict(orient='records')
+        account_status_mismatch = mismatches['account_status_mismatch']
+        if len(account_status_mismatch):
+            metrics['data']['account_status_mismatch_count'] = len(account_status_mismatch)
+            metrics['data']['account_status_mismatched_records'] = projection.records('account_status_mismatched_records', account_status_mismatch, leakage)
 
         # Vectorized Service Status mismatch
-        service_status_mismatch = (
-            ((serv_status_df['Service Status Network'] == "A") & (serv_status_df['Service Status Billing'] == "I")) |
-            ((serv_status_df['Service Status Network'] == "I") & (serv_status_df['Service Status Billing'] == "A"))
-        )
-        if service_status_mismatch.any():
-            mismatched_records = serv_status_df[service_status_mismatch].copy()
+        service_status_mismatch = mismatches['service_status_mismatch']
+        if len(service_status_mismatch):
+            mismatched_records = service_status_mismatch.copy()
             mismatched_records['Billing Service Status'] = mismatched_records['Service Status Billing']
-            mismatched_records['Mismatch Reason'] = "Service Status mismatch between Network and Billing"
-            metrics['data']['service_mismatch_count'] = service_status_mismatch.sum()
-            metrics['data']['service_mismatched_records'] = mismatched_records.to_dict(orient='records')
+            mismatched_records['Mismatch Reason'] = RuleEngine.reason('network_service_status', 'service_status_mismatch')
+            metrics['data']['service_mismatch_count'] = len(service_status_mismatch)
+            metrics['data']['service_mismatched_records'] = projection.records('service_mismatched_records', mismatched_records, leakage)
 
-        # Filter rows where Account Status and Service Status are both "A"
-        active_records = df_Network[
-            (df_Network['Account Status'] == "A") & 
-            (df_Network['Service Status'] == "A")
-        ]
 
 
         # Vectorized Transaction Date mismatch condition
-        transaction_date_mismatch = (
-            (pd.notna(active_records['Call Start Time'])) &
-            (pd.notna(active_records['Service Start Date'])) &
-            (pd.notna(active_records['Service End Date'])) &
-            ~((active_records['Service Start Date'] <= active_records['Call Start Time']) &
-            (active_records['Call Start Time'] <= active_records['Service End Date']))
-        )
+        transaction_date_mismatch = mismatches['transaction_window_mismatch']
 
         # Process transaction mismatched records
-        if transaction_date_mismatch.any():
-            mismatched_records = active_records[transaction_date_mismatch].copy()
-            mismatched_records['Mismatch Reason'] = "Call Start Time not In Between Service Start/End Date"
-            metrics['data']['transaction_mismatch_count'] = transaction_date_mismatch.sum()
-            metrics['data']['transaction_mismatched_records'] = mismatched_records.to_dict(orient='records')
-
-        # Filter rows where Transaction Date is between Service Start Date and Service End Date
-        valid_transaction_records = active_records[
-            (pd.notna(active_records['Call Start Time'])) &
-            (pd.notna(active_records['Service Start Date'])) &
-            (pd.notna(active_records['Service End Date'])) &
-            (active_records['Service Start Date'] <= active_records['Call Start Time']) &
-            (active_records['Call Start Time'] <= active_records['Service End Date'])
-        ]
+        if len(transaction_date_mismatch):
+            mismatched_records = transaction_date_mismatch.copy()
+            mismatched_records['Mismatch Reason'] = RuleEngine.reason('network_service_window', 'transaction_window_mismatch', date='Call Start Time')
+            metrics['data']['transaction_mismatch_count'] = len(transaction_date_mismatch)
+            metrics['data']['transaction_mismatched_records'] = projection.records('transaction_mismatched_records', mismatched_records, leakage)
+
 
         # Compare MSISDN values between Network and Billing
-        msisdn_missing_mask = ~valid_transaction_records['MSISDN'].isin(df_Billing['MSISDN'])
+        msisdn_missing = mismatches['msisdn_missing']
 
         # Process MSISDN mismatched records
-        if msisdn_missing_mask.any():
-            msisdn_missing_records = valid_transaction_records[msisdn_missing_mask].copy()
-            metrics['data']['msisdn_missing_count'] = msisdn_missing_mask.sum()
-            metrics['data']['msisdn_missing_records'] = msisdn_missing_records.to_dict(orient='records')
-
-        # Filter Network dataset based on conditions
-        df_Network_filtered = df_Network[
-            (df_Network['Account Status'] == "A") &
-            (df_Network['Service Status'] == "A") &
-            (pd.to_datetime(df_Network['Call Start Time'], errors='coerce') >= pd.to_datetime(df_Network['Service Start Date'], errors='coerce')) &
-            (pd.to_datetime(df_Network['Call Start Time'], errors='coerce') <= pd.to_datetime(df_Network['Service End Date'], errors='coerce'))
-        ]
-
-        # Filter Billing dataset based on MSISDN matching
-        df_Billing_filtered = df_Billing[
-            df_Billing['MSISDN'].isin(df_Network_filtered['MSISDN'])
-        ]
-
-        # Merge filtered datasets
-        merged_transaction_df = pd.merge(
-            df_Network_filtered,
-            df_Billing_filtered,
-            on=['MSISDN', 'Service ID', 'Service Name', 'Service Start Date', 'Service End Date','Service Status'],
-            how='inner',
-            suffixes=('_Network', '_Billing')
-        )
-
-        # Merge filtered datasets
-        merged_service_df = pd.merge(
-            df_Network_filtered,
-            df_Billing_filtered,
-            on=['MSISDN', 'Account Status', 'Usage Type', 'Usage Sub Type', 'Call Start Time', 'Call End Time', 'Duration (Mins)'],
-            how='inner',
-            suffixes=('_Network', '_Billing')
-        )
-
-
+        if len(msisdn_missing):
+            msisdn_missing_records = msisdn_missing.copy()
+            metrics['data']['msisdn_missing_count'] = len(msisdn_missing)
+            metrics['data']['msisdn_missing_records'] = projection.records('msisdn_missing_records', msisdn_missing_records, leakage)
 
         # Transaction Date mismatch between Network and Billing
-        transaction_date_mismatch = (
-            (merged_transaction_df['Call Start Time_Network'] != merged_transaction_df['Call Start Time_Billing']) |
-            (merged_transaction_df['Call End Time_Network'] != merged_transaction_df['Call End Time_Billing'])
-        )
+        transaction_date_mismatch = mismatches['transaction_date_mismatch']
 
         # Process Transaction Date mismatched records
-        if transaction_date_mismatch.any():
+        if len(transaction_date_mismatch):
             # Filter mismatched records
-            mismatched_records = merged_transaction_df[transaction_date_mismatch].copy()
+            mismatched_records = transaction_date_mismatch.copy()
 
             # Add mismatch reason for each record
-            mismatched_records['Mismatch Reason'] = mismatched_records.apply(
-                lambda row: "Call Start/End Time not matched between Network and Billing"
-                if (row['Call Start Time_Network'] != row['Call Start Time_Billing']) or (row['Call End Time_Network'] != row['Call End Time_Billing'])    
-                else "Call Start/End Time not matched between Network and Billing",
-                axis=1
-            )
-
-            # Restrict processing to one record per MSISDN
-            mismatched_records = mismatched_records.drop_duplicates(subset=['MSISDN'])
+            mismatched_records['Mismatch Reason'] = RuleEngine.reason('voice_transaction', 'transaction_date_mismatch')
 
             # Update metrics
             metrics['data']['transaction_date_mismatch_count'] = len(mismatched_records)
-            metrics['data']['transaction_date_mismatched_records'] = mismatched_records.to_dict(orient='records')
+            metrics['data']['transaction_date_mismatched_records'] = projection.records('transaction_date_mismatched_records', mismatched_records, leakage)
 
         # Download (MB) mismatch between Network and Billing
-        download_mismatch = (
-            merged_transaction_df['Duration (Mins)_Network'] != merged_transaction_df['Duration (Mins)_Billing']
-        )
+        download_mismatch = mismatches['usage_mismatch']
 
         # Process Download (MB) mismatched records
-        if download_mismatch.any():
-            mismatched_records = merged_transaction_df[download_mismatch].copy()
-
-            # Drop duplicates based on MSISDN to ensure one record per MSISDN
-            mismatched_records = mismatched_records.drop_duplicates(subset=['MSISDN'])
+        if len(download_mismatch):
+            mismatched_records = download_mismatch.copy()
 
             # Add additional columns for mismatch details
             mismatched_records['Billing Duration (Mins)'] = mismatched_records['Duration (Mins)_Billing']
             mismatched_records['Duration (Mins)'] = mismatched_records['Duration (Mins)_Network']
             mismatched_records['Usage Type'] = mismatched_records['Usage Type_Network']
             mismatched_records['Usage Sub Type'] = mismatched_records['Usage Sub Type_Network']
-            mismatched_records['Mismatch Reason'] = "Duration mismatch between Network and Billing"
+            mismatched_records['Mismatch Reason'] = RuleEngine.reason('voice_transaction', 'usage_mismatch')
 
             # Update metrics
             metrics['data']['duration_mismatch_count'] = len(mismatched_records)
-            metrics['data']['duration_mismatched_records'] = mismatched_records.to_dict(orient='records')
+            metrics['data']['duration_mismatched_records'] = projection.records('duration_mismatched_records', mismatched_records, leakage)
         
         # Service ID and Service Start/End Date mismatch
-        service_id_mismatch = (
-            merged_service_df['Service ID_Network'] != merged_service_df['Service ID_Billing']
-        )
+        service_id_mismatch = mismatches['service_id_mismatch']
 
-        if service_id_mismatch.any():
-            mismatched_records = merged_service_df[service_id_mismatch].copy()
-            mismatched_records['Mismatch Reason'] = "Service mismatch between Network and Billing"
-            metrics['data']['service_mismatch_count'] += service_id_mismatch.sum()
-            metrics['data']['service_mismatched_records'].extend(mismatched_records.to_dict(orient='records'))
+        if len(service_id_mismatch):
+            mismatched_records = service_id_mismatch.copy()
+            mismatched_records['Mismatch Reason'] = RuleEngine.reason('network_service', 'service_id_mismatch')
+            metrics['data']['service_mismatch_count'] += len(service_id_mismatch)
+            metrics['data']['service_mismatched_records'].extend(projection.records('service_mismatched_records', mismatched_records, leakage))
 
-        service_date_mismatch = (
-            (merged_service_df['Service Start Date_Network'] != merged_service_df['Service Start Date_Billing']) |
-            (merged_service_df['Service End Date_Network'] != merged_service_df['Service End Date_Billing'])
-        )
+        service_date_mismatch = mismatches['service_date_mismatch']
 
-        if service_date_mismatch.any():
-            mismatched_records = merged_service_df[service_date_mismatch].copy()
+        if len(service_date_mismatch):
+            mismatched_records = service_date_mismatch.copy()
             mismatched_records['Billing Service Start Date'] = mismatched_records['Service Start Date_Billing']
             mismatched_records['Billing Service End Date'] = mismatched_records['Service End Date_Billing']
-            mismatched_records['Mismatch Reason'] = "Service Start/End Date mismatch between Network and Billing"
-            metrics['data']['service_mismatch_count'] += service_date_mismatch.sum()
-            metrics['data']['service_mismatched_records'].extend(mismatched_records.to_dict(orient='records'))
+            mismatched_records['Mismatch Reason'] = RuleEngine.reason('network_service', 'service_date_mismatch')
+            metrics['data']['service_mismatch_count'] += len(service_date_mismatch)
+            metrics['data']['service_mismatched_records'].extend(projection.records('service_mismatched_records', mismatched_records, leakage))
+
 
+        # Monetary impact per category and per month, from the frames valued as their records were built
+        if projection.full_records:
+            metrics['data']['leakage'] = leakage.summary()
+            # Sampled, windowed, partial and offline (files=) runs stay out of the dashboard aggregates
+            if not sample and not window and not files and projection.network_frames() is None:
+                ReconciliationAggregates.record_leakage('network_voice', mismatches['network_records'], mismatches['billing_records'], metrics['data']['leakage'])
+        if 'top_offenders' in mismatches:
+            metrics['data']['top_offenders'] = mismatches['top_offenders'].summary()
 
         # Add named sections to records_display_card
         metrics['data']['records_display_card'] = [
@@ -1021,6 +927,9 @@ class ServicesModel(BaseModel):
 
 
 
+        if sample and projection.wants('sample'):
+            metrics['data']['sample'] = SampledReconciliation.estimate(metrics['data'], sample, mismatches['records_per_msisdn'], mismatches['population_records'])
+
         # Ensure all data in metrics is JSON serializable
         def convert_to_serializable(data):
             if isinstance(data, list):
@@ -1915,9 +1824,3 @@ class ServicesModel(BaseModel):
         # Ensure all data in metrics is JSON serializable
         metrics = convert_to_serializable(metrics)
         return metrics
-
-
-if __name__ == "__main__":
-    metrics = ServicesModel.get_network_vs_billing_data()
-    print("Metrics Output:")
-    print(metrics)
@@ -0,0 +1,180 @@
+import os
+import re
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd # type: ignore
+
+
+class SnapshotProcessor:
+    """Reconcile daily KRA4 CRM/Billing snapshot pairs across a date range"""
+
+    SNAPSHOT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'assets', 'Test_Data_Source_csv')
+
+    # Daily extracts are written without a header row
+    FILE_PATTERN = re.compile(r'^KRA4-(CRM|BILLING)-(\d{2}[A-Za-z]{3}\d{4})\.csv$', re.IGNORECASE)
+
+    CRM_COLUMNS = [
+        'Snapshot_Date', 'Account_ID', 'Customer_ID', 'MSISDN', 'BUS_ENT', 'Account_Status', 'Bill_Plan',
+        'Bill_Day_of_Month', 'Account_Creation_Date', 'Account_Start_Date', 'Account_End_date', 'Last_Change_Dt',
+        'Promotion_Id', 'Promotion_Start_Dt', 'Promotion_End_Dt', 'Subscriber_type', 'Payment_Method', 'Contact_ID',
+        'CTITLE', 'Contact_Name', 'Contact_Address', 'Country', 'Contact_Mail', 'Currency', 'Bus_Unit_ID',
+        'CR_LIMIT', 'Payment_Resp', 'Araf_Last_Bill_date', 'Araf_Filter_Ind'
+    ]
+    BILLING_COLUMNS = [
+        'Araf_Timestamp', 'Account_ID', 'Customer_ID', 'Account_Status', 'Ent_Residence', 'Subscriber_Type',
+        'Account_Start_Date', 'BillPlan_ID', 'MSISDN', 'Called_Number', 'Promotion_Id', 'Bill_ID', 'Bill_From_Dt',
+        'Bill_to_date', 'Bill_processed_Dt', 'Bill_Creation_dt', 'Last_Billed_Date', 'Next_Bill_Dt', 'Bill_Day_Mnth',
+        'araf_bill_amount', 'araf_tr_record_id', 'araf_plan_version_id', 'Araf_Rate', 'Araf_Amount', 'Credit_ID',
+        'Service_ID', 'LI_TYPE', 'Cr_Limit', 'Currency', 'Payement_Response', 'Filter_ind'
+    ]
+
+    JOIN_KEYS = ['Customer_ID', 'MSISDN']
+
+    # Rule name -> (CRM column, Billing column) compared on matched accounts
+    FIELD_RULES = {
+        'account_id_mismatch': ('Account_ID', 'Account_ID'),
+        'account_status_mismatch': ('Account_Status', 'Account_Status'),
+        'ent_residence_mismatch': ('BUS_ENT', 'Ent_Residence'),
+        'bill_plan_mismatch': ('Bill_Plan', 'BillPlan_ID'),
+        'start_date_mismatch': ('Account_Start_Date', 'Account_Start_Date'),
+        'promotion_mismatch': ('Promotion_Id', 'Promotion_Id')
+    }
+
+    @classmethod
+    def discover_days(cls, date_from=None, date_to=None, snapshot_dir=None):
+        """Find dates that have both a CRM and a Billing extract
+
+        Returns a list of (date, crm_file, billing_file) sorted by date.
+        date_from/date_to are inclusive datetime.date bounds.
+        """
+        snapshot_dir = snapshot_dir or cls.SNAPSHOT_DIR
+        files = {}
+        for name in os.listdir(snapshot_dir):
+            match = cls.FILE_PATTERN.match(name)
+            if not match:
+                continue
+            try:
+                day = datetime.strptime(match.group(2), '%d%b%Y').date()
+            except ValueError:
+                continue
+            files.setdefault(day, {})[match.group(1).upper()] = os.path.join(snapshot_dir, name)
+
+        days = []
+        for day in sorted(files):
+            if date_from and day < date_from:
+                continue
+            if date_to and day > date_to:
+                continue
+            if 'CRM' in files[day] and 'BILLING' in files[day]:
+                days.append((day, files[day]['CRM'], files[day]['BILLING']))
+        return days
+
+    @classmethod
+    def reconcile_day(cls, day, crm_file, billing_file):
+        """Reconcile one day's CRM and Billing extracts
+
+        Runs in a worker process, so it only takes and returns plain data.
+        """
+        crm_df = pd.read_csv(crm_file, header=None, names=cls.CRM_COLUMNS, usecols=range(len(cls.CRM_COLUMNS)), dtype=str)
+        billing_df = pd.read_csv(billing_file, header=None, names=cls.BILLING_COLUMNS, usecols=range(len(cls.BILLING_COLUMNS)), dtype=str)
+
+        # Trailing blank lines in some extracts come through as all-empty rows
+        crm_df = crm_df.dropna(subset=cls.JOIN_KEYS)
+        billing_df = billing_df.dropna(subset=cls.JOIN_KEYS)
+        crm_records = len(crm_df)
+        billing_records = len(billing_df)
+
+        duplicate_records = int(crm_df.duplicated().sum() + billing_df.duplicated().sum())
+        crm_df = crm_df.drop_duplicates(subset=cls.JOIN_KEYS)
+        billing_df = billing_df.drop_duplicates(subset=cls.JOIN_KEYS)
+
+        merged_df = pd.merge(
+            crm_df,
+            billing_df,
+            on=cls.JOIN_KEYS,
+            how='outer',
+            suffixes=('_crm', '_billing'),
+            indicator=True
+        )
+        matched = merged_df['_merge'] == 'both'
+
+        def column(name, side):
+            suffixed = f'{name}_{side}'
+            return merged_df[suffixed] if suffixed in merged_df.columns else merged_df[name]
+
+        rules = pd.DataFrame({
+            rule: matched & (column(crm_column, 'crm').fillna('') != column(billing_column, 'billing').fillna(''))
+            for rule, (crm_column, billing_column) in cls.FIELD_RULES.items()
+        })
+        rules['missing_in_billing'] = merged_df['_merge'] == 'left_only'
+        rules['missing_in_crm'] = merged_df['_merge'] == 'right_only'
+
+        flagged = rules.any(axis=1)
+        mismatched = merged_df.loc[flagged, cls.JOIN_KEYS].copy()
+        mismatched['mismatch_type'] = [
+            [rule for rule, hit in zip(rules.columns, row) if hit]
+            for row in rules[flagged].itertuples(index=False, name=None)
+        ]
+
+        matched_accounts = int(matched.sum())
+        mismatch_counts = {rule: int(rules[rule].sum()) for rule in rules.columns}
+        total_accounts = len(merged_df)
+        return {
+            'date': day.isoformat(),
+            'crm_records': crm_records,
+            'billing_records': billing_records,
+            'duplicate_records': duplicate_records,
+            'total_accounts': total_accounts,
+            'matched_accounts': matched_accounts,
+            'mismatched_accounts': int(flagged.sum()),
+            'mismatch_percentage': round(flagged.sum() / total_accounts * 100, 2) if total_accounts else 0,
+            'mismatch_counts': mismatch_counts,
+            'mismatched_records': [
+                {'customer_id': customer_id, 'msisdn': msisdn, 'mismatch_type': mismatch_type}
+                for customer_id, msisdn, mismatch_type in mismatched.itertuples(index=False, name=None)
+            ]
+        }
+
+    @classmethod
+    def get_snapshot_reconciliation(cls, date_from=None, date_to=None, max_workers=None):
+        """Reconcile every day pair in the range, one worker process per day
+
+        Returns per-day results plus a rollup across the whole range.
+        """
+        days = cls.discover_days(date_from, date_to)
+        max_workers = max(1, min(len(days), max_workers or os.cpu_count() or 1))
+
+        if max_workers == 1:
+            results = [cls.reconcile_day(*day) for day in days]
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                results = list(executor.map(cls.reconcile_day, *zip(*days)))
+
+        rollup = {
+            'days_reconciled': len(results),
+            'crm_records': 0,
+            'billing_records': 0,
+            'duplicate_records': 0,
+            'total_accounts': 0,
+            'matched_accounts': 0,
+            'mismatched_accounts': 0,
+            'mismatch_counts': {}
+        }
+        for result in results:
+            for key in ('crm_records', 'billing_records', 'duplicate_records', 'total_accounts', 'matched_accounts', 'mismatched_accounts'):
+                rollup[key] += result[key]
+            for rule, count in result['mismatch_counts'].items():
+                rollup['mismatch_counts'][rule] = rollup['mismatch_counts'].get(rule, 0) + count
+        rollup['mismatch_percentage'] = (
+            round(rollup['mismatched_accounts'] / rollup['total_accounts'] * 100, 2) if rollup['total_accounts'] else 0
+        )
+        rollup['trend_data'] = [
+            {'date': result['date'], 'value': result['mismatched_accounts']} for result in results
+        ]
+
+        return {
+            'date_from': results[0]['date'] if results else None,
+            'date_to': results[-1]['date'] if results else None,
+            'days': results,
+            'rollup': rollup
+        }
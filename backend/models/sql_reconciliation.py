@@ -0,0 +1,341 @@
+import os
+import tempfile
+from pandas.tseries.api import guess_datetime_format # type: ignore
+from models.rule_engine import RuleEngine
+from models.sampling import SampledReconciliation
+from models.usage_partitions import UsagePartitions
+
+try:
+    import duckdb # type: ignore
+except ImportError:
+    duckdb = None
+
+
+class SqlReconciliation:
+    """Reconciliation stages as SQL over an embedded DuckDB database
+
+    The CSV inputs are read by DuckDB directly; deduplication, the
+    anti-join, the service window and the joins run as SQL across all
+    cores, spilling to disk past the memory limit, and the mismatch rules
+    from config/mismatch_rules.json are evaluated in the same queries. Only
+    the mismatching rows come back to pandas, with the columns and
+    suffixes the pandas engine produces, so the rest of each reconciler
+    is shared. Joins match null keys to each other, as pandas merges do.
+
+    The engine is chosen per request (engine=duckdb) or for the process
+    with REVENUEFIX_ENGINE; duckdb is an optional dependency.
+    """
+
+    ENGINES = ('pandas', 'duckdb')
+    DEFAULT_ENGINE = 'pandas'
+
+    # Spill directory, and a memory limit such as 4GB (DuckDB's default is 80% of RAM)
+    TEMP_DIRECTORY = os.path.join(tempfile.gettempdir(), 'revenuefix-duckdb')
+    MEMORY_LIMIT = os.environ.get('REVENUEFIX_DUCKDB_MEMORY_LIMIT')
+
+    # No date detection, so date strings come back exactly as pandas reads them
+    CSV_TYPES = "['BIGINT', 'DOUBLE', 'VARCHAR']"
+
+    # Network/Billing join for the service status check, shared by every usage type
+    SERVICE_STATUS_KEYS = ['MSISDN', 'Service ID', 'Service Name', 'Service Start Date', 'Service End Date']
+
+    @classmethod
+    def engine(cls, requested=None):
+        """Engine to run on: the requested one, else REVENUEFIX_ENGINE, else pandas"""
+        name = (requested or os.environ.get('REVENUEFIX_ENGINE') or cls.DEFAULT_ENGINE).lower()
+        if name not in cls.ENGINES:
+            raise ValueError(f"engine must be one of: {', '.join(cls.ENGINES)}")
+        if name == 'duckdb' and duckdb is None:
+            if requested:
+                raise ValueError("engine=duckdb needs the duckdb package installed")
+            print("REVENUEFIX_ENGINE=duckdb but duckdb is not installed, using pandas")
+            return cls.DEFAULT_ENGINE
+        return name
+
+    @staticmethod
+    def available():
+        return duckdb is not None
+
+    @staticmethod
+    def _column(name):
+        return '"' + name.replace('"', '""') + '"'
+
+    @staticmethod
+    def _literal(value):
+        return "'" + str(value).replace("'", "''") + "'"
+
+    @classmethod
+    def connect(cls):
+        os.makedirs(cls.TEMP_DIRECTORY, exist_ok=True)
+        con = duckdb.connect()
+        con.execute(f"SET temp_directory = {cls._literal(cls.TEMP_DIRECTORY)}")
+        if cls.MEMORY_LIMIT:
+            con.execute(f"SET memory_limit = {cls._literal(cls.MEMORY_LIMIT)}")
+        return con
+
+    @classmethod
+    def _load(cls, con, table, file_path, date=None, window=None):
+        """Read a CSV into a table with stripped column names and its file row number in __row
+
+        With a window, only the rows dated in it are loaded, from the month
+        partitions that overlap it (UsagePartitions).
+        """
+        if window:
+            con.register(f'{table}_window', UsagePartitions.read(file_path, date, window).reset_index(names='__file_row'))
+            source, row_number = f'{table}_window', '__file_row + 1'
+        else:
+            source = f"read_csv({cls._literal(file_path)}, header = true, auto_type_candidates = {cls.CSV_TYPES})"
+            row_number = 'row_number() OVER ()'
+        names = [row[0] for row in con.execute(f"DESCRIBE SELECT * FROM {source}").fetchall() if row[0] != '__file_row']
+        columns = ', '.join(f"{cls._column(name)} AS {cls._column(name.strip())}" for name in names)
+        con.execute(
+            f"CREATE TEMP TABLE {table} AS SELECT {columns}, {row_number} AS __row FROM {source}"
+        )
+        return [name.strip() for name in names]
+
+    @classmethod
+    def _dedupe(cls, con, table, source, subset):
+        """Keep the first row of each duplicate group; returns the number of rows dropped"""
+        partition = ', '.join(cls._column(column) for column in subset)
+        con.execute(
+            f"CREATE TEMP TABLE {table} AS SELECT * FROM {source} "
+            f"QUALIFY row_number() OVER (PARTITION BY {partition} ORDER BY __row) = 1"
+        )
+        return con.execute(f"SELECT (SELECT count(*) FROM {source}) - (SELECT count(*) FROM {table})").fetchone()[0]
+
+    @classmethod
+    def _keys_match(cls, keys, left='n', right='b'):
+        return ' AND '.join(f"{left}.{cls._column(key)} IS NOT DISTINCT FROM {right}.{cls._column(key)}" for key in keys)
+
+    @classmethod
+    def _join_columns(cls, left_columns, right_columns, keys, suffixes):
+        """Select list laid out like pandas.merge: left columns (keys unsuffixed), then right non-keys"""
+        overlap = set(left_columns) & set(right_columns)
+        select = []
+        for column in left_columns:
+            name = column if column in keys or column not in overlap else column + suffixes[0]
+            select.append(f"n.{cls._column(column)} AS {cls._column(name)}")
+        for column in right_columns:
+            if column not in keys:
+                name = column + suffixes[1] if column in overlap else column
+                select.append(f"b.{cls._column(column)} AS {cls._column(name)}")
+        return ', '.join(select)
+
+    @classmethod
+    def date_formats(cls, con, table, where, ruleset, **params):
+        """Formats pandas would infer for the rule set's unformatted date columns
+
+        to_datetime guesses one format from a column's first value and
+        coerces values in any other format to NaT; the SQL does the same.
+        """
+        formats = {}
+        for column, date_format in RuleEngine.compile(ruleset, **params)['parse_dates'].items():
+            if date_format:
+                continue
+            first = con.execute(
+                f"SELECT CAST({cls._column(column)} AS VARCHAR) FROM {table} "
+                f"WHERE {where} AND {cls._column(column)} IS NOT NULL ORDER BY __row LIMIT 1"
+            ).fetchone()
+            guessed = guess_datetime_format(first[0]) if first else None
+            if guessed:
+                formats[column] = guessed
+        return formats
+
+    @staticmethod
+    def _frame(con, query):
+        return con.execute(query).df()
+
+    @classmethod
+    def _rule_frames(cls, con, query, rules, caps=None, cap_column='MSISDN'):
+        """Rows of query where any rule fires, split into one frame per rule
+
+        caps limits named rules to their first N rows per cap_column value,
+        in the database, as MergeGuard.guarded_merge does for pandas.
+        """
+        caps = caps or {}
+        flags = ', '.join(f"({condition}) AS {cls._column('__rule_' + name)}" for name, condition in rules.items())
+        ranks = ''.join(
+            f", row_number() OVER (PARTITION BY {cls._column(cap_column)}, {cls._column('__rule_' + name)} ORDER BY __n, __b)"
+            f" AS {cls._column('__rank_' + name)}"
+            for name in caps
+        )
+        fired = {
+            name: cls._column('__rule_' + name) + (f" AND {cls._column('__rank_' + name)} <= {int(caps[name])}" if name in caps else '')
+            for name in rules
+        }
+        df = cls._frame(con, f"""
+            SELECT * FROM (SELECT *{ranks} FROM (SELECT *, {flags} FROM ({query})))
+            WHERE {' OR '.join(f'({condition})' for condition in fired.values())} ORDER BY __n, __b
+        """)
+        columns = [column for column in df.columns if not column.startswith('__')]
+        frames = {}
+        for name in rules:
+            selected = df['__rule_' + name].astype(bool)
+            if name in caps:
+                selected &= df['__rank_' + name] <= caps[name]
+            frames[name] = df.loc[selected, columns].reset_index(drop=True)
+        return frames
+
+    @classmethod
+    def _key_statistics(cls, con, left, right, keys):
+        """MergeGuard.key_statistics for two tables"""
+        columns = ', '.join(cls._column(key) for key in keys)
+        row = con.execute(f"""
+            SELECT (SELECT count(*) FROM {left}), (SELECT count(*) FROM {right}),
+                   count(*), count(*) FILTER (WHERE n.__count > 1 AND b.__count > 1),
+                   COALESCE(max(n.__count), 0), COALESCE(max(b.__count), 0), COALESCE(sum(n.__count * b.__count), 0)
+            FROM (SELECT {columns}, count(*) AS __count FROM {left} GROUP BY ALL) n
+            JOIN (SELECT {columns}, count(*) AS __count FROM {right} GROUP BY ALL) b ON {cls._keys_match(keys)}
+        """).fetchone()
+        names = ['left_rows', 'right_rows', 'matched_keys', 'many_to_many_keys', 'max_left_multiplicity', 'max_right_multiplicity', 'output_rows']
+        return {name: int(value) for name, value in zip(names, row)}
+
+    @classmethod
+    def network_mismatches(cls, spec, files, sample=None, run=None, window=None):
+        """Mismatch frames of one network vs billing reconciliation, as ServicesModel.network_mismatches
+
+        run names the stages to run (ServicesModel.NETWORK_STAGES), all when None.
+        """
+        billing_file_path, network_file_path = files
+        records = spec['record_columns']
+        date = spec['date']
+
+        def runs(stage):
+            return run is None or stage in run
+
+        con = cls.connect()
+        try:
+            stages = {'join_statistics': {}}
+            billing_columns = cls._load(con, 'billing_raw', billing_file_path, date, window)
+            network_columns = cls._load(con, 'network_raw', network_file_path, date, window)
+            raw_counts = con.execute("SELECT (SELECT count(*) FROM billing_raw), (SELECT count(*) FROM network_raw)").fetchone()
+            if sample:
+                stages['population_records'] = int(max(raw_counts))
+                # The subscribers SampledReconciliation.select keeps in pandas, so both engines sample alike
+                msisdn = "COALESCE(regexp_replace(trim(CAST(\"MSISDN\" AS VARCHAR)), '\\.0$', ''), 'nan')"
+                msisdns = cls._frame(con, f"SELECT DISTINCT {msisdn} AS msisdn FROM (SELECT \"MSISDN\" FROM billing_raw UNION ALL SELECT \"MSISDN\" FROM network_raw)")
+                sampled_msisdns = SampledReconciliation.select(msisdns, sample, column='msisdn')
+                con.register('sampled_msisdns', sampled_msisdns)
+                for table in ('billing_raw', 'network_raw'):
+                    con.execute(f"DELETE FROM {table} WHERE {msisdn} NOT IN (SELECT msisdn FROM sampled_msisdns)")
+                raw_counts = con.execute("SELECT (SELECT count(*) FROM billing_raw), (SELECT count(*) FROM network_raw)").fetchone()
+                per_msisdn = cls._frame(con, f"""
+                    SELECT msisdn, max(records) AS records FROM (
+                        SELECT {msisdn} AS msisdn, count(*) AS records FROM network_raw GROUP BY ALL
+                        UNION ALL
+                        SELECT {msisdn} AS msisdn, count(*) AS records FROM billing_raw GROUP BY ALL
+                    ) GROUP BY msisdn
+                """)
+                stages['records_per_msisdn'] = per_msisdn.set_index('msisdn')['records'].astype(float)
+            stages['total_inc_duplicate'] = int(max(raw_counts))
+
+            stages['total_duplicates'] = int(
+                cls._dedupe(con, 'billing', 'billing_raw', records) + cls._dedupe(con, 'network', 'network_raw', records)
+            )
+            stages['network_records'], stages['billing_records'] = con.execute(
+                "SELECT (SELECT count(*) FROM network), (SELECT count(*) FROM billing)"
+            ).fetchone()
+
+            network_select = ', '.join(cls._column(column) for column in network_columns)
+
+            # Network records with no identical billing record (the outer merge's left_only rows)
+            if runs('mismatched'):
+                stages['mismatched'] = cls._frame(con, f"""
+                    SELECT {network_select}, 'left_only' AS _merge FROM network n
+                    WHERE NOT EXISTS (SELECT 1 FROM billing b WHERE {cls._keys_match(records)})
+                    ORDER BY __row
+                """)
+
+            if runs('account_status'):
+                account_rule = RuleEngine.sql('network_account')['account_status_mismatch']
+                stages['account_status_mismatch'] = cls._frame(con, f"""
+                    SELECT {network_select} FROM network
+                    WHERE "Account Status" = 'I' AND ({account_rule})
+                    ORDER BY __row
+                """)
+
+            if runs('service_status'):
+                status_query = f"""
+                    SELECT {cls._join_columns(network_columns, billing_columns, cls.SERVICE_STATUS_KEYS, (' Network', ' Billing'))},
+                           n.__row AS __n, b.__row AS __b
+                    FROM network n JOIN billing b ON {cls._keys_match(cls.SERVICE_STATUS_KEYS)}
+                """
+                stages['join_statistics']['service_status'] = cls._key_statistics(con, 'network', 'billing', cls.SERVICE_STATUS_KEYS)
+                stages.update(cls._rule_frames(con, status_query, RuleEngine.sql('network_service_status')))
+
+            if not runs('window'):
+                return stages
+
+            active = "\"Account Status\" = 'A' AND \"Service Status\" = 'A'"
+            window = RuleEngine.sql(
+                'network_service_window',
+                cls.date_formats(con, 'network', active, 'network_service_window', date=date),
+                date=date
+            )
+            stages['transaction_window_mismatch'] = cls._frame(con, f"""
+                SELECT {network_select} FROM network
+                WHERE {active} AND ({window['transaction_window_mismatch']})
+                ORDER BY __row
+            """)
+            stages['msisdn_missing'] = cls._frame(con, f"""
+                SELECT {network_select} FROM network n
+                WHERE {active} AND ({window['transaction_in_window']})
+                  AND NOT EXISTS (SELECT 1 FROM billing b WHERE {cls._keys_match(['MSISDN'])})
+                ORDER BY __row
+            """)
+
+            # Active usage inside its service window, and the billing records of those subscribers
+            con.execute(f"CREATE TEMP VIEW network_filtered AS SELECT * FROM network WHERE {active} AND ({window['transaction_in_window']})")
+            con.execute("""
+                CREATE TEMP VIEW billing_filtered AS SELECT * FROM billing b
+                WHERE EXISTS (SELECT 1 FROM network_filtered n WHERE n."MSISDN" IS NOT DISTINCT FROM b."MSISDN")
+            """)
+            for join, keys, ruleset, params, caps in (
+                ('transaction', spec['transaction_keys'], spec['transaction_ruleset'], spec['transaction_params'], spec.get('transaction_caps')),
+                ('service', spec['service_keys'], 'network_service', {}, None)
+            ):
+                if not runs(join):
+                    continue
+                stages['join_statistics'][join] = cls._key_statistics(con, 'network_filtered', 'billing_filtered', keys)
+                query = f"""
+                    SELECT {cls._join_columns(network_columns, billing_columns, keys, ('_Network', '_Billing'))},
+                           n.__row AS __n, b.__row AS __b
+                    FROM network_filtered n JOIN billing_filtered b ON {cls._keys_match(keys)}
+                """
+                stages.update(cls._rule_frames(con, query, RuleEngine.sql(ruleset, **params), caps))
+            return stages
+        finally:
+            con.close()
+
+    @classmethod
+    def crm_merge(cls, files, duplicate_subsets, dedupe_subset, keys):
+        """Deduplicated CRM/Billing inner merge, as DataProcessor.get_crm_billing_analytics builds it"""
+        crm_file, billing_file = files
+        con = cls.connect()
+        try:
+            crm_columns = cls._load(con, 'crm_raw', crm_file)
+            billing_columns = cls._load(con, 'billing_raw', billing_file)
+            raw_counts = con.execute("SELECT (SELECT count(*) FROM crm_raw), (SELECT count(*) FROM billing_raw)").fetchone()
+            duplicates = 0
+            for table, subset in zip(('crm_raw', 'billing_raw'), duplicate_subsets):
+                distinct = ', '.join(cls._column(column) for column in subset)
+                duplicates += con.execute(
+                    f"SELECT (SELECT count(*) FROM {table}) - (SELECT count(*) FROM (SELECT DISTINCT {distinct} FROM {table}))"
+                ).fetchone()[0]
+            cls._dedupe(con, 'crm', 'crm_raw', dedupe_subset)
+            cls._dedupe(con, 'billing', 'billing_raw', dedupe_subset)
+            merged = cls._frame(con, f"""
+                SELECT {cls._join_columns(crm_columns, billing_columns, keys, ('_crm', '_billing'))}
+                FROM crm n JOIN billing b ON {cls._keys_match(keys)}
+                ORDER BY n.__row, b.__row
+            """)
+            crm_rows, billing_rows = con.execute("SELECT (SELECT count(*) FROM crm), (SELECT count(*) FROM billing)").fetchone()
+            return {
+                'merged': merged,
+                'total_inc_duplicates': int(max(raw_counts)),
+                'total_duplicates': int(duplicates),
+                'crm_records': crm_rows,
+                'billing_records': billing_rows
+            }
+        finally:
+            con.close()
@@ -0,0 +1,508 @@
+import os
+import json
+import uuid
+import base64
+import sqlite3
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'assets')
+
+
+class TicketStore:
+    """Indexed SQLite mirror of the alarm and case CSV files
+
+    The CSV files stay the source of truth. Each worker keeps an in-memory
+    SQLite copy with indexes on the filterable columns and reloads it
+    whenever the file fingerprint (mtime/size) changes underneath it.
+    Writes go through add() and update(), which read, change and write
+    the CSV under a lock file shared by every worker (fcntl; only the
+    in-process lock where fcntl is unavailable), so concurrent writers
+    never lose each other's rows or hand out the same id. They are applied
+    to the mirror in place, along with the per-assignee workload counters
+    behind /api/users/tasks.
+    """
+
+    TABLES = {
+        'alarms': {
+            'file': 'alarms.csv',
+            'id_prefix': 'ALM',
+            'columns': ['id', 'severity', 'source', 'message', 'timestamp', 'status', 'assigned_to'],
+            'time_column': 'timestamp',
+            'filters': {
+                'status': 'status',
+                'severity': 'severity',
+                'source': 'source',
+                'assignee': 'assigned_to'
+            }
+        },
+        'cases': {
+            'file': 'cases.csv',
+            'id_prefix': 'CS',
+            'columns': ['id', 'priority', 'customer', 'subject', 'status', 'created_at', 'assigned_to', 'description'],
+            'time_column': 'created_at',
+            'filters': {
+                'status': 'status',
+                'priority': 'priority',
+                'customer': 'customer',
+                'assignee': 'assigned_to'
+            }
+        }
+    }
+
+    MAX_PAGE_SIZE = 1000
+
+    # Statuses counted as resolved; any other item is claimed once it has an
+    # assignee (claiming only sets assigned_to) and open until then.
+    # Deleted items only count towards tasks.
+    STATUS_BUCKETS = {
+        'Resolved': 'resolved',
+        'Closed': 'resolved',
+        'Archived': 'resolved',
+        'Deleted': None
+    }
+    UNASSIGNED = 'Unassigned'
+
+    _lock = threading.RLock()
+    _conn = None
+    _fingerprints = {}
+    _workload = {}
+
+    @classmethod
+    def file_path(cls, table):
+        """Absolute path of the CSV backing a table"""
+        return os.path.join(ASSETS_DIR, cls.TABLES[table]['file'])
+
+    @staticmethod
+    def fingerprint(file_path):
+        """Cheap change detector for a CSV file"""
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    @classmethod
+    def _connection(cls):
+        if cls._conn is None:
+            cls._conn = sqlite3.connect(':memory:', check_same_thread=False)
+            cls._conn.row_factory = sqlite3.Row
+        return cls._conn
+
+    @classmethod
+    def _load(cls, table):
+        """Rebuild a table and its indexes from the CSV file"""
+        spec = cls.TABLES[table]
+        file_path = cls.file_path(table)
+        fingerprint = cls.fingerprint(file_path)
+
+        df = pd.read_csv(file_path, dtype=str, keep_default_na=False)
+        if 'assigned_to' not in df.columns:
+            df['assigned_to'] = 'Unassigned'
+        for column in spec['columns']:
+            if column not in df.columns:
+                df[column] = ''
+        df = df[spec['columns']]
+
+        conn = cls._connection()
+        columns_sql = ', '.join(f'"{c}" TEXT' for c in spec['columns'])
+        conn.execute(f'DROP TABLE IF EXISTS {table}')
+        conn.execute(f'CREATE TABLE {table} (seq INTEGER PRIMARY KEY, {columns_sql})')
+        placeholders = ', '.join('?' for _ in range(len(spec['columns']) + 1))
+        conn.executemany(
+            f'INSERT INTO {table} VALUES ({placeholders})',
+            ((seq, *row) for seq, row in enumerate(df.itertuples(index=False, name=None)))
+        )
+        indexed = list(spec['filters'].values()) + [spec['time_column'], 'id']
+        for column in indexed:
+            conn.execute(f'CREATE INDEX idx_{table}_{column} ON {table} ("{column}", seq)')
+        conn.commit()
+
+        workload = {}
+        for assignee, status in zip(df['assigned_to'], df['status']):
+            cls._count_task(workload, assignee, status, 1)
+        cls._workload[table] = workload
+
+        cls._fingerprints[table] = fingerprint
+        print(f"Indexed {len(df)} rows from {file_path}")
+
+    @classmethod
+    def _count_task(cls, workload, assignee, status, delta):
+        counts = workload.setdefault(assignee, {'tasks': 0, 'open': 0, 'claimed': 0, 'resolved': 0})
+        counts['tasks'] += delta
+        if status in cls.STATUS_BUCKETS:
+            bucket = cls.STATUS_BUCKETS[status]
+        else:
+            bucket = 'open' if assignee == cls.UNASSIGNED else 'claimed'
+        if bucket:
+            counts[bucket] += delta
+
+    @classmethod
+    def _ensure_fresh(cls, table):
+        fingerprint = cls._fingerprints.get(table)
+        if fingerprint is None or fingerprint != cls.fingerprint(cls.file_path(table)):
+            cls._load(table)
+
+    @classmethod
+    @contextmanager
+    def _locked(cls, table):
+        """Hold the table for a read-modify-write, across threads and worker processes"""
+        with cls._lock:
+            if fcntl is None:
+                yield
+                return
+            lock_path = os.path.join(ASSETS_DIR, f'.{table}.lock')
+            with open(os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o600), 'r+') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @classmethod
+    def _read(cls, table):
+        df = pd.read_csv(cls.file_path(table))
+        if 'assigned_to' not in df.columns:
+            df['assigned_to'] = cls.UNASSIGNED
+        return df
+
+    @classmethod
+    def _next_id(cls, table, df):
+        """Next ID after the last one in the file"""
+        prefix = cls.TABLES[table]['id_prefix']
+        try:
+            if df.empty:
+                return f"{prefix}-1001"
+            num = int(df['id'].iloc[-1].split('-')[1])
+            return f"{prefix}-{num + 1}"
+        except Exception as e:
+            print(f"Error generating {table} ID: {e}")
+            return f"{prefix}-{uuid.uuid4().hex[:6]}"
+
+    @classmethod
+    def add(cls, table, record):
+        """Append a record under the next free ID; returns it with its id"""
+        with cls._locked(table):
+            df = cls._read(table)
+            record = {'id': cls._next_id(table, df), **record}
+            df = pd.concat([df, pd.DataFrame([record])], ignore_index=True)
+            cls._save(table, df, record)
+        return record
+
+    @classmethod
+    def update(cls, table, item_id, changes):
+        """Set columns of the record with this ID; returns the updated record, or None when there is none"""
+        with cls._locked(table):
+            df = cls._read(table)
+            index = df[df['id'] == item_id].index
+            if len(index) == 0:
+                return None
+            for column, value in changes.items():
+                df.loc[index, column] = value
+            record = df.loc[index].to_dict('records')[0]
+            cls._save(table, df, record)
+        return record
+
+    @classmethod
+    def _save(cls, table, df, record):
+        """Write the DataFrame back to CSV and apply the changed record to the index
+
+        If the index was already stale before this write (another worker
+        changed the file), it is simply reloaded on the next read instead.
+        """
+        file_path = cls.file_path(table)
+        with cls._lock:
+            was_fresh = (
+                table in cls._fingerprints and
+                cls._fingerprints[table] == cls.fingerprint(file_path)
+            )
+            # Written aside and renamed over the file, so other workers
+            # never read it half-written
+            fd, temp_path = tempfile.mkstemp(prefix=f'.{table}-', suffix='.csv', dir=os.path.dirname(file_path))
+            try:
+                with os.fdopen(fd, 'w', newline='') as f:
+                    df.to_csv(f, index=False)
+                if os.path.exists(file_path):
+                    os.chmod(temp_path, os.stat(file_path).st_mode & 0o777)
+                os.replace(temp_path, file_path)
+            except BaseException:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+            if not was_fresh:
+                cls._fingerprints.pop(table, None)
+                cls._workload.pop(table, None)
+                return
+
+            columns = cls.TABLES[table]['columns']
+            values = ['' if pd.isna(record.get(c)) else str(record.get(c, '')) for c in columns]
+            conn = cls._connection()
+            existing = conn.execute(f'SELECT * FROM {table} WHERE id = ?', (values[0],)).fetchone()
+            workload = cls._workload[table]
+            if existing:
+                cls._count_task(workload, existing['assigned_to'], existing['status'], -1)
+                if workload[existing['assigned_to']]['tasks'] == 0:
+                    del workload[existing['assigned_to']]
+                assignments = ', '.join(f'"{c}" = ?' for c in columns)
+                conn.execute(f'UPDATE {table} SET {assignments} WHERE seq = ?', (*values, existing['seq']))
+            else:
+                column_list = ', '.join(f'"{c}"' for c in columns)
+                placeholders = ', '.join('?' for _ in columns)
+                conn.execute(
+                    f'INSERT INTO {table} (seq, {column_list}) '
+                    f'VALUES ((SELECT COALESCE(MAX(seq), -1) + 1 FROM {table}), {placeholders})',
+                    values
+                )
+            conn.commit()
+            record_values = dict(zip(columns, values))
+            cls._count_task(workload, record_values['assigned_to'], record_values['status'], 1)
+            cls._fingerprints[table] = cls.fingerprint(file_path)
+
+    @classmethod
+    def workload(cls):
+        """Task counts per assignee across alarms and cases
+
+        Reads only touch the cached counters, so the cost is proportional to
+        the number of assignees rather than the number of alarms and cases.
+        """
+        merged = {}
+        with cls._lock:
+            for table in ('alarms', 'cases'):
+                cls._ensure_fresh(table)
+                for assignee, counts in cls._workload[table].items():
+                    total = merged.setdefault(assignee, {'tasks': 0, 'open': 0, 'claimed': 0, 'resolved': 0})
+                    for key, value in counts.items():
+                        total[key] += value
+        return [{'name': name, **counts} for name, counts in merged.items()]
+
+    @staticmethod
+    def encode_cursor(value, seq):
+        raw = json.dumps([value, seq]).encode('utf-8')
+        return base64.urlsafe_b64encode(raw).decode('ascii')
+
+    @staticmethod
+    def decode_cursor(cursor):
+        try:
+            value, seq = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+            return value, int(seq)
+        except Exception:
+            raise ValueError(f"Invalid cursor: {cursor}")
+
+    @classmethod
+    def query_args(cls, table, args):
+        """Translate request query parameters into query() keyword arguments"""
+        filters = {}
+        for name in cls.TABLES[table]['filters']:
+            values = [v for raw in args.getlist(name) for v in raw.split(',') if v]
+            if values:
+                filters[name] = values
+
+        limit = args.get('limit')
+        if limit is not None:
+            try:
+                limit = int(limit)
+            except ValueError:
+                raise ValueError("limit must be a positive integer")
+
+        return {
+            'filters': filters,
+            'time_from': args.get('from'),
+            'time_to': args.get('to'),
+            'sort': args.get('sort'),
+            'limit': limit,
+            'cursor': args.get('cursor')
+        }
+
+    @classmethod
+    def query(cls, table, filters=None, time_from=None, time_to=None, sort=None, limit=None, cursor=None):
+        """Filter, sort and page through a table
+
+        filters maps public filter names to a list of accepted values.
+        time_from and time_to bound the ISO time column, inclusive; a
+        time_to given as a date (YYYY-MM-DD) takes in that whole day.
+        sort is a column name, prefixed with '-' for descending order; rows
+        are otherwise returned in file order. Pagination is keyset based, so
+        each page costs an index seek regardless of how deep it is.
+        """
+        spec = cls.TABLES[table]
+        filters = filters or {}
+
+        descending = bool(sort) and sort.startswith('-')
+        sort_column = sort.lstrip('-') if sort else 'seq'
+        if sort_column != 'seq' and sort_column not in spec['columns']:
+            raise ValueError(f"Invalid sort column: {sort_column}")
+        if limit is not None:
+            if limit < 1:
+                raise ValueError("limit must be a positive integer")
+            limit = min(limit, cls.MAX_PAGE_SIZE)
+
+        where = []
+        params = []
+        for name, values in filters.items():
+            if name not in spec['filters']:
+                raise ValueError(f"Invalid filter: {name}")
+            if values:
+                where.append(f'"{spec["filters"][name]}" IN ({", ".join("?" for _ in values)})')
+                params.extend(values)
+        if time_from:
+            where.append(f'"{spec["time_column"]}" >= ?')
+            params.append(time_from)
+        if time_to:
+            try:
+                # A bare date covers the whole day
+                next_day = datetime.strptime(time_to, '%Y-%m-%d') + timedelta(days=1)
+                where.append(f'"{spec["time_column"]}" < ?')
+                params.append(next_day.strftime('%Y-%m-%d'))
+            except ValueError:
+                where.append(f'"{spec["time_column"]}" <= ?')
+                params.append(time_to)
+
+        page_where = list(where)
+        page_params = list(params)
+        if cursor:
+            last_value, last_seq = cls.decode_cursor(cursor)
+            op = '<' if descending else '>'
+            if sort_column == 'seq':
+                page_where.append(f'seq {op} ?')
+                page_params.append(last_seq)
+            else:
+                page_where.append(f'("{sort_column}" {op} ? OR ("{sort_column}" = ? AND seq {op} ?))')
+                page_params.extend([last_value, last_value, last_seq])
+
+        direction = 'DESC' if descending else 'ASC'
+        order_by = f'seq {direction}' if sort_column == 'seq' else f'"{sort_column}" {direction}, seq {direction}'
+        sql = f'SELECT * FROM {table}'
+        if page_where:
+            sql += ' WHERE ' + ' AND '.join(page_where)
+        sql += f' ORDER BY {order_by}'
+        if limit is not None:
+            # Fetch one extra row to know whether another page exists
+            sql += f' LIMIT {limit + 1}'
+
+        count_sql = f'SELECT COUNT(*) FROM {table}'
+        if where:
+            count_sql += ' WHERE ' + ' AND '.join(where)
+
+        with cls._lock:
+            cls._ensure_fresh(table)
+            conn = cls._connection()
+            rows = conn.execute(sql, page_params).fetchall()
+            total_matching = conn.execute(count_sql, params).fetchone()[0]
+
+        next_cursor = None
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            next_cursor = cls.encode_cursor(last[sort_column] if sort_column != 'seq' else None, last['seq'])
+
+        return {
+            'records': [{c: row[c] for c in spec['columns']} for row in rows],
+            'pagination': {
+                'limit': limit,
+                'next_cursor': next_cursor,
+                'total_matching': total_matching
+            }
+        }
+
+    @classmethod
+    def grouped_counts(cls, table, columns, extra_select=None, extra_params=()):
+        """Single GROUP BY pass over a table, ordered by first appearance"""
+        select = ', '.join(f'"{c}"' for c in columns)
+        group = select
+        if extra_select:
+            select += f', {extra_select} AS extra'
+            group += ', extra'
+        sql = (
+            f'SELECT {select}, COUNT(*) AS count, MIN(seq) AS first_seq '
+            f'FROM {table} GROUP BY {group} ORDER BY first_seq'
+        )
+        with cls._lock:
+            cls._ensure_fresh(table)
+            return [dict(row) for row in cls._connection().execute(sql, extra_params).fetchall()]
+
+    @staticmethod
+    def _assignees(groups):
+        assigned_to_list = []
+        for group in groups:
+            if group['assigned_to'] not in assigned_to_list and group['assigned_to'] != 'Unassigned':
+                assigned_to_list.append(group['assigned_to'])
+        return assigned_to_list
+
+    @classmethod
+    def alarm_summary(cls):
+        """Summary cards, category breakdown and assignees for alarms"""
+        groups = cls.grouped_counts('alarms', ['severity', 'status', 'source', 'assigned_to'])
+
+        by_severity = {}
+        by_status = {}
+        by_source = {}
+        for group in groups:
+            by_severity[group['severity']] = by_severity.get(group['severity'], 0) + group['count']
+            by_status[group['status']] = by_status.get(group['status'], 0) + group['count']
+            by_source[group['source']] = by_source.get(group['source'], 0) + group['count']
+
+        return {
+            'summary': {
+                'total_alarms': sum(group['count'] for group in groups),
+                'critical_alarms': by_severity.get('Critical', 0),
+                'major_alarms': by_severity.get('Major', 0),
+                'minor_alarms': by_severity.get('Minor', 0),
+                'open_alarms': by_status.get('Open', 0),
+                'resolved_alarms': by_status.get('Resolved', 0),
+                'archived_alarms': by_status.get('Archived', 0),
+                'resolved_today': by_status.get('Resolved', 0)  # Simplified for now
+            },
+            'alarm_by_category': [
+                {'category': source, 'count': count} for source, count in sorted(by_source.items())
+            ],
+            'assigned_to_list': cls._assignees(groups)
+        }
+
+    @classmethod
+    def case_summary(cls, today):
+        """Summary cards, breakdowns and assignees for cases"""
+        groups = cls.grouped_counts(
+            'cases', ['status', 'priority', 'assigned_to'],
+            extra_select='substr(created_at, 1, 10) = ?', extra_params=(today,)
+        )
+
+        by_status = {}
+        by_priority = {}
+        created_today = 0
+        closed_today = 0
+        for group in groups:
+            by_status[group['status']] = by_status.get(group['status'], 0) + group['count']
+            by_priority[group['priority']] = by_priority.get(group['priority'], 0) + group['count']
+            if group['extra']:
+                created_today += group['count']
+                if group['status'] == 'Resolved':
+                    closed_today += group['count']
+
+        return {
+            'summary': {
+                'total_cases': sum(group['count'] for group in groups),
+                'open_cases': by_status.get('Open', 0),
+                'resolved_cases': by_status.get('Resolved', 0),
+                'archived_cases': by_status.get('Archived', 0),
+                'deleted_cases': by_status.get('Deleted', 0),
+                'cases_created_today': created_today,
+                'cases_closed_today': closed_today,
+                'average_resolution_time': 24.5  # Placeholder value
+            },
+            'case_by_priority': [
+                {'priority': priority, 'count': count} for priority, count in sorted(by_priority.items())
+            ],
+            'case_by_department': [
+                {'department': status, 'count': count} for status, count in sorted(by_status.items())
+            ],
+            'assigned_to_list': cls._assignees(groups)
+        }
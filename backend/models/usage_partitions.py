@@ -0,0 +1,164 @@
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import threading
+import importlib.util
+from datetime import datetime, timedelta
+import pandas as pd # type: ignore
+
+
+class UsagePartitions:
+    """Network and Billing usage files split into one columnar file per month
+
+    A reconciliation over a from/to window reads only the months that
+    overlap it, so its cost follows the window rather than the retention
+    of the input files. Partitions are built from a usage CSV the first
+    time a window is asked of it and rebuilt when the file changes: each
+    build goes to a directory named after the file's size and mtime,
+    written aside and renamed into place, so workers never read a
+    half-written build, and a read whose build is removed by a newer one
+    is retried on that. Months are keyed by the usage date column
+    (Transaction Date, Call Start Time); rows whose date does not parse
+    fall outside every window.
+
+    Partitions are Parquet when pyarrow or fastparquet is installed, else
+    pickled DataFrames. Either way each keeps the dtypes of the whole-file
+    read and the file row number as its index, so a windowed read matches
+    filtering the CSV itself, in file order.
+    """
+
+    ROOT = os.environ.get('REVENUEFIX_PARTITION_DIR') or os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'assets', 'usage_partitions'
+    )
+    FORMAT = 'parquet' if importlib.util.find_spec('pyarrow') or importlib.util.find_spec('fastparquet') else 'pickle'
+    MANIFEST = 'manifest.json'
+    # Zero-row partition holding the file's columns and dtypes, for windows with no months
+    SCHEMA = 'schema'
+
+    _lock = threading.Lock()
+
+    @staticmethod
+    def query_window(args):
+        """(from, to) dates from from=/to= (YYYY-MM-DD, inclusive), or None; raises ValueError"""
+        bounds = []
+        for name in ('from', 'to'):
+            value = args.get(name)
+            try:
+                bounds.append(datetime.strptime(value, '%Y-%m-%d').date() if value else None)
+            except ValueError:
+                raise ValueError(f"{name} must be a date as YYYY-MM-DD")
+        date_from, date_to = bounds
+        if date_from is None and date_to is None:
+            return None
+        if date_from and date_to and date_from > date_to:
+            raise ValueError("from must not be after to")
+        return date_from, date_to
+
+    @staticmethod
+    def dates(values):
+        """Usage timestamps, in the format of the first one (as pandas infers it); others are NaT"""
+        return pd.to_datetime(values, errors='coerce')
+
+    @classmethod
+    def _write(cls, df, path):
+        if cls.FORMAT == 'parquet':
+            df.to_parquet(path)
+        else:
+            df.to_pickle(path)
+
+    @classmethod
+    def _read(cls, path):
+        return pd.read_parquet(path) if path.endswith('.parquet') else pd.read_pickle(path)
+
+    @classmethod
+    def _directory(cls, file_path):
+        """(directory of this file's builds, directory of the build for its current contents)"""
+        file_path = os.path.abspath(file_path)
+        stat = os.stat(file_path)
+        digest = hashlib.blake2b(file_path.encode(), digest_size=6).hexdigest()
+        parent = os.path.join(cls.ROOT, f"{os.path.splitext(os.path.basename(file_path))[0]}-{digest}")
+        return parent, os.path.join(parent, f"{stat.st_size}-{stat.st_mtime_ns}")
+
+    @classmethod
+    def build(cls, file_path, date_column):
+        """Partition a usage file by month (when not already done for its current contents); returns the build directory"""
+        parent, directory = cls._directory(file_path)
+        if os.path.exists(os.path.join(directory, cls.MANIFEST)):
+            return directory
+        with cls._lock:
+            if os.path.exists(os.path.join(directory, cls.MANIFEST)):
+                return directory
+            os.makedirs(parent, exist_ok=True)
+            df = pd.read_csv(file_path)
+            column = next(name for name in df.columns if name.strip() == date_column)
+            months = cls.dates(df[column]).dt.to_period('M')
+            extension = 'parquet' if cls.FORMAT == 'parquet' else 'pkl'
+
+            staging = tempfile.mkdtemp(prefix='.build-', dir=parent)
+            manifest = {
+                'source': os.path.abspath(file_path),
+                'date_column': date_column,
+                'rows': len(df),
+                'schema': f'{cls.SCHEMA}.{extension}',
+                'months': {}
+            }
+            cls._write(df.iloc[:0], os.path.join(staging, manifest['schema']))
+            for month, part in df.groupby(months, sort=True):
+                name = f'{month}.{extension}'
+                cls._write(part, os.path.join(staging, name))
+                manifest['months'][str(month)] = {'file': name, 'rows': len(part)}
+            with open(os.path.join(staging, cls.MANIFEST), 'w') as f:
+                json.dump(manifest, f, indent=2)
+            try:
+                os.rename(staging, directory)
+            except OSError:
+                # Another worker finished the same build first
+                shutil.rmtree(staging, ignore_errors=True)
+            for name in os.listdir(parent):
+                if name != os.path.basename(directory) and not name.startswith('.build-'):
+                    shutil.rmtree(os.path.join(parent, name), ignore_errors=True)
+            print(f"Partitioned {file_path} into {len(manifest['months'])} months")
+        return directory
+
+    @classmethod
+    def read(cls, file_path, date_column, window):
+        """Rows of a usage file whose date falls in window (from, to), reading only the overlapping months
+
+        A rebuild for newer contents removes the previous build, possibly
+        while this read is loading it; the read is then retried once on
+        the current build.
+        """
+        try:
+            return cls._read_window(cls.build(file_path, date_column), date_column, window)
+        except FileNotFoundError:
+            return cls._read_window(cls.build(file_path, date_column), date_column, window)
+
+    @classmethod
+    def _read_window(cls, directory, date_column, window):
+        date_from, date_to = window
+        with open(os.path.join(directory, cls.MANIFEST)) as f:
+            manifest = json.load(f)
+
+        frames = []
+        for month, partition in manifest['months'].items():
+            period = pd.Period(month, freq='M')
+            if date_from and period.end_time.date() < date_from:
+                continue
+            if date_to and period.start_time.date() > date_to:
+                continue
+            frames.append(cls._read(os.path.join(directory, partition['file'])))
+        if not frames:
+            return cls._read(os.path.join(directory, manifest['schema']))
+        df = pd.concat(frames).sort_index() if len(frames) > 1 else frames[0]
+
+        # Months at the edges of the window are only partly in it
+        column = next(name for name in df.columns if name.strip() == date_column)
+        dates = cls.dates(df[column])
+        keep = dates.notna()
+        if date_from:
+            keep &= dates >= pd.Timestamp(date_from)
+        if date_to:
+            keep &= dates < pd.Timestamp(date_to + timedelta(days=1))
+        return df[keep]
@@ -1,9 +1,10 @@
 from models.base import BaseModel
 from datetime import datetime, timedelta
 import random
-import pandas as pd
-import os
-from collections import defaultdict
+from lazy_import import LazyImport
+
+TicketStore = LazyImport('models.ticket_store', 'TicketStore')
+
 class UserModel(BaseModel):
     """Model for user data"""
     current_time = datetime.now()
@@ -104,16 +105,5 @@ class UserModel(BaseModel):
     
     @classmethod
     def get_tasks(cls):
-        """Get available departments"""
-        file_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'assets', 'alarms.csv')
-        alarm = pd.read_csv(file_path).to_dict('records')
-        file_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'assets', 'cases.csv')
-        cases = pd.read_csv(file_path).to_dict('records')
-
-        user_map = defaultdict(int)
-        for alarm in alarm:
-            user_map[alarm['assigned_to']] += 1
-        for case in cases:
-            user_map[case['assigned_to']] += 1
-
-        return [{"name": name, "tasks": id_} for name, id_ in user_map.items()]
\ No newline at end of file
+        """Get open, claimed and resolved task counts per assignee"""
+        return TicketStore.workload()
@@ -1,82 +1,42 @@
 from flask import Blueprint, jsonify, request
-import pandas as pd
-import os
 import datetime
-import uuid
+from middleware.conditional import ConditionalGet
+from lazy_import import LazyImport
 
 alarms_bp = Blueprint('alarms', __name__)
 
-def get_next_alarm_id():
-    """Generate the next alarm ID based on existing alarms"""
-    try:
-        df = pd.read_csv(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'assets', 'alarms.csv'))
-        if df.empty:
-            return "ALM-1001"
-        
-        # Extract numbers from IDs
-        last_id = df['id'].iloc[-1]
-        num = int(last_id.split('-')[1])
-        return f"ALM-{num + 1}"
-    except Exception as e:
-        print(f"Error generating alarm ID: {e}")
-        return f"ALM-{uuid.uuid4().hex[:6]}"
+TicketStore = LazyImport('models.ticket_store', 'TicketStore')
 
 @alarms_bp.route('', methods=['GET'])
+@ConditionalGet.cached(lambda: [TicketStore.file_path('alarms')])
 def get_alarm_data():
-    """Get alarm management data"""
+    """Get alarm management data
+
+    Supports status, severity, source and assignee filters (comma separated
+    for several values), from/to on the alarm timestamp, sort=<column> or
+    sort=-<column>, and limit/cursor for keyset pagination.
+    """
     try:
-        # Read alarms from CSV
-        file_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'assets', 'alarms.csv')
-        df = pd.read_csv(file_path)
-        
-        # Convert to list of dictionaries
-        alarms = df.to_dict('records')
-        
-        # Get unique assigned_to values
-        if 'assigned_to' in df.columns:
-            assigned_to_list = df['assigned_to'].unique().tolist()
-            # Remove 'Unassigned' if it exists
-            if 'Unassigned' in assigned_to_list:
-                assigned_to_list.remove('Unassigned')
-        else:
-            # Add assigned_to column if it doesn't exist
-            df['assigned_to'] = 'Unassigned'
-            df.to_csv(file_path, index=False)
-            assigned_to_list = []
-            alarms = df.to_dict('records')
-        
-        # Calculate summary statistics
-        total_alarms = len(alarms)
-        critical_alarms = len(df[df['severity'] == 'Critical'])
-        major_alarms = len(df[df['severity'] == 'Major'])
-        minor_alarms = len(df[df['severity'] == 'Minor'])
-        
-        # Count by status
-        open_alarms = len(df[df['status'] == 'Open'])
-        resolved_alarms = len(df[df['status'] == 'Resolved'])
-        archived_alarms = len(df[df['status'] == 'Archived']) if 'Archived' in df['status'].values else 0
-        deleted_alarms = len(df[df['status'] == 'Deleted']) if 'Deleted' in df['status'].values else 0
+        try:
+            query_args = TicketStore.query_args('alarms', request.args)
+            page = TicketStore.query('alarms', **query_args)
+        except ValueError as e:
+            return jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), 400
         
-        # Group alarms by source for category breakdown
-        alarm_by_category = df.groupby('source').size().reset_index(name='count')
-        alarm_by_category.columns = ['category', 'count']
+        # Summary counts come from one grouped pass over the index
+        overview = TicketStore.alarm_summary()
         
         return jsonify({
             'status': 'success',
             'data': {
-                'summary': {
-                    'total_alarms': total_alarms,
-                    'critical_alarms': critical_alarms,
-                    'major_alarms': major_alarms,
-                    'minor_alarms': minor_alarms,
-                    'open_alarms': open_alarms,
-                    'resolved_alarms': resolved_alarms,
-                    'archived_alarms': archived_alarms,
-                    'resolved_today': resolved_alarms  # Simplified for now
-                },
-                'alarm_by_category': alarm_by_category.to_dict('records'),
-                'recent_alarms': alarms,
-                'assigned_to_list': assigned_to_list
+                'summary': overview['summary'],
+                'alarm_by_category': overview['alarm_by_category'],
+                'recent_alarms': page['records'],
+                'assigned_to_list': overview['assigned_to_list'],
+                'pagination': page['pagination']
             }
         })
     except Exception as e:
@@ -101,30 +61,15 @@ def add_alarm():
                     'message': f"Missing required field: {field}"
                 }), 400
         
-        # Read existing alarms
-        file_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'assets', 'alarms.csv')
-        df = pd.read_csv(file_path)
-        
-        # Check if assigned_to column exists, add if not
-        if 'assigned_to' not in df.columns:
-            df['assigned_to'] = 'Unassigned'
-        
-        # Create new alarm
-        new_alarm = {
-            'id': get_next_alarm_id(),
+        # Append the new alarm under the next ID and refresh the index
+        new_alarm = TicketStore.add('alarms', {
             'severity': data['severity'],
             'source': data['source'],
             'message': data['message'],
             'timestamp': datetime.datetime.now().isoformat(),
             'status': data.get('status', 'Open'),
             'assigned_to': data.get('assigned_to', 'Unassigned')
-        }
-        
-        # Append new alarm to DataFrame
-        df = pd.concat([df, pd.DataFrame([new_alarm])], ignore_index=True)
-        
-        # Save updated DataFrame to CSV
-        df.to_csv(file_path, index=False)
+        })
         
         return jsonify({
             'status': 'success',
@@ -152,38 +97,25 @@ def update_alarm(alarm_id):
                     'message': f"Missing required field: {field}"
                 }), 400
         
-        # Read existing alarms
-        file_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'assets', 'alarms.csv')
-        df = pd.read_csv(file_path)
+        changes = {
+            'severity': data['severity'],
+            'source': data['source'],
+            'message': data['message'],
+            'status': data['status']
+        }
         
-        # Check if assigned_to column exists, add if not
-        if 'assigned_to' not in df.columns:
-            df['assigned_to'] = 'Unassigned'
+        # Update assigned_to if provided
+        if 'assigned_to' in data:
+            changes['assigned_to'] = data['assigned_to']
         
-        # Find the alarm to update
-        alarm_index = df[df['id'] == alarm_id].index
-        if len(alarm_index) == 0:
+        # Update the alarm in the CSV and refresh the index
+        updated_alarm = TicketStore.update('alarms', alarm_id, changes)
+        if updated_alarm is None:
             return jsonify({
                 'status': 'error',
                 'message': f"Alarm with ID {alarm_id} not found"
             }), 404
         
-        # Update the alarm
-        df.loc[alarm_index, 'severity'] = data['severity']
-        df.loc[alarm_index, 'source'] = data['source']
-        df.loc[alarm_index, 'message'] = data['message']
-        df.loc[alarm_index, 'status'] = data['status']
-        
-        # Update assigned_to if provided
-        if 'assigned_to' in data:
-            df.loc[alarm_index, 'assigned_to'] = data['assigned_to']
-        
-        # Save updated DataFrame to CSV
-        df.to_csv(file_path, index=False)
-        
-        # Get the updated alarm
-        updated_alarm = df.loc[alarm_index].to_dict('records')[0]
-        
         return jsonify({
             'status': 'success',
             'data': updated_alarm
@@ -207,31 +139,14 @@ def claim_alarm(alarm_id):
                 'message': "Missing required field: assigned_to"
             }), 400
         
-        # Read existing alarms
-        file_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'assets', 'alarms.csv')
-        df = pd.read_csv(file_path)
-        
-        # Check if assigned_to column exists, add if not
-        if 'assigned_to' not in df.columns:
-            df['assigned_to'] = 'Unassigned'
-        
-        # Find the alarm to claim
-        alarm_index = df[df['id'] == alarm_id].index
-        if len(alarm_index) == 0:
+        # Update the assigned_to field and refresh the index
+        updated_alarm = TicketStore.update('alarms', alarm_id, {'assigned_to': data['assigned_to']})
+        if updated_alarm is None:
             return jsonify({
                 'status': 'error',
                 'message': f"Alarm with ID {alarm_id} not found"
             }), 404
         
-        # Update the assigned_to field
-        df.loc[alarm_index, 'assigned_to'] = data['assigned_to']
-        
-        # Save updated DataFrame to CSV
-        df.to_csv(file_path, index=False)
-        
-        # Get the updated alarm
-        updated_alarm = df.loc[alarm_index].to_dict('records')[0]
-        
         return jsonify({
             'status': 'success',
             'data': updated_alarm
@@ -247,27 +162,14 @@ def claim_alarm(alarm_id):
 def archive_alarm(alarm_id):
     """Archive an alarm"""
     try:
-        # Read existing alarms
-        file_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'assets', 'alarms.csv')
-        df = pd.read_csv(file_path)
-        
-        # Find the alarm to archive
-        alarm_index = df[df['id'] == alarm_id].index
-        if len(alarm_index) == 0:
+        # Update the status field to Archived and refresh the index
+        updated_alarm = TicketStore.update('alarms', alarm_id, {'status': 'Archived'})
+        if updated_alarm is None:
             return jsonify({
                 'status': 'error',
                 'message': f"Alarm with ID {alarm_id} not found"
             }), 404
         
-        # Update the status field to Archived
-        df.loc[alarm_index, 'status'] = 'Archived'
-        
-        # Save updated DataFrame to CSV
-        df.to_csv(file_path, index=False)
-        
-        # Get the updated alarm
-        updated_alarm = df.loc[alarm_index].to_dict('records')[0]
-        
         return jsonify({
             'status': 'success',
             'data': updated_alarm
@@ -283,27 +185,14 @@ def archive_alarm(alarm_id):
 def delete_alarm(alarm_id):
     """Mark an alarm as deleted (soft delete)"""
     try:
-        # Read existing alarms
-        file_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'assets', 'alarms.csv')
-        df = pd.read_csv(file_path)
-        
-        # Find the alarm to delete
-        alarm_index = df[df['id'] == alarm_id].index
-        if len(alarm_index) == 0:
+        # Update the status field to Deleted and refresh the index
+        updated_alarm = TicketStore.update('alarms', alarm_id, {'status': 'Deleted'})
+        if updated_alarm is None:
             return jsonify({
                 'status': 'error',
                 'message': f"Alarm with ID {alarm_id} not found"
             }), 404
         
-        # Update the status field to Deleted
-        df.loc[alarm_index, 'status'] = 'Deleted'
-        
-        # Save updated DataFrame to CSV
-        df.to_csv(file_path, index=False)
-        
-        # Get the updated alarm
-        updated_alarm = df.loc[alarm_index].to_dict('records')[0]
-        
         return jsonify({
             'status': 'success',
             'data': updated_alarm
@@ -1,23 +1,111 @@
-from flask import Blueprint, jsonify
-from models.data_processor import DataProcessor
+from functools import partial
+from flask import Blueprint, jsonify, request
+from datetime import datetime
+from middleware.conditional import ConditionalGet
+from middleware.single_flight import SingleFlight
+from middleware.admission import AdmissionControl, AdmissionRefused
+from lazy_import import LazyImport
 
 crm_billing_bp = Blueprint('crm_billing', __name__)
 
+DataProcessor = LazyImport('models.data_processor', 'DataProcessor')
+SnapshotProcessor = LazyImport('models.snapshot_processor', 'SnapshotProcessor')
+LeakageModel = LazyImport('models.leakage', 'LeakageModel')
+SqlReconciliation = LazyImport('models.sql_reconciliation', 'SqlReconciliation')
+ResultStore = LazyImport('models.result_store', 'ResultStore')
+ResponseProjection = LazyImport('models.projection', 'ResponseProjection')
+RuleEngine = LazyImport('models.rule_engine', 'RuleEngine')
+
+def sources():
+    return DataProcessor.CRM_BILLING_FILES + LeakageModel.CHARGE_FILES + (RuleEngine.CONFIG_PATH,)
+
+def reconcile(engine=None, projection=None):
+    """Run (or share) the CRM vs Billing reconciliation for the current inputs, storing each computed run
+
+    The CRM files are small, so a projection is cut from the full, shared result.
+    """
+    engine = SqlReconciliation.engine(engine)
+    projection = projection or ResponseProjection()
+    name = 'crm_billing' if engine == SqlReconciliation.DEFAULT_ENGINE else f'crm_billing-{engine}'
+    reconciliation = partial(DataProcessor.get_crm_billing_analytics, engine=engine)
+    reconciliation = partial(ResultStore.recorded, 'crm_billing', reconciliation, engine=engine)
+    # Only the default engine's run is kept in memory between requests
+    retain = engine == SqlReconciliation.DEFAULT_ENGINE
+    return projection.apply(SingleFlight.run(name, sources(), reconciliation, 'reconciliation', retain))
+
+def snapshot_sources():
+    return [SnapshotProcessor.SNAPSHOT_DIR]
+
 @crm_billing_bp.route('', methods=['GET'])
+@ConditionalGet.cached(sources)
 def get_crm_billing_data():
-    """Get CRM vs Billing reconciliation data"""
+    """Get CRM vs Billing reconciliation data; engine=duckdb merges the files in SQL
+
+    sections= (comma separated top-level keys, e.g. summary) returns only
+    those, and fields= keeps only the named columns of mismatched_accounts.
+    """
     try:
+        try:
+            engine = SqlReconciliation.engine(request.args.get('engine'))
+            projection = ResponseProjection.from_args(request.args, ResponseProjection.CRM_SECTIONS, ResponseProjection.CRM_FIELDS)
+        except ValueError as e:
+            return jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), 400
+
         # Process CRM and Billing data
-        data = DataProcessor.get_crm_billing_analytics()
+        data = reconcile(engine, projection)
         
         return jsonify({
             'status': 'success',
             'data': data
         })
         
+    except AdmissionRefused as e:
+        return AdmissionControl.refused(e)
     except Exception as e:
         print(f"Error processing CRM vs Billing data: {e}")
         return jsonify({
             'status': 'error',
             'message': str(e)
-        }), 500
\ No newline at end of file
+        }), 500
+
+@crm_billing_bp.route('/snapshots', methods=['GET'])
+@ConditionalGet.cached(snapshot_sources)
+def get_crm_billing_snapshots():
+    """Reconcile daily CRM/Billing snapshots between from and to (YYYY-MM-DD, inclusive)"""
+    try:
+        date_from = request.args.get('from')
+        date_to = request.args.get('to')
+        workers = request.args.get('workers')
+        try:
+            date_from = datetime.strptime(date_from, '%Y-%m-%d').date() if date_from else None
+            date_to = datetime.strptime(date_to, '%Y-%m-%d').date() if date_to else None
+            workers = int(workers) if workers else None
+        except ValueError as e:
+            return jsonify({
+                'status': 'error',
+                'message': f"Invalid parameter: {e}"
+            }), 400
+        
+        data = SingleFlight.run(
+            f'crm_billing_snapshots-{date_from}-{date_to}',
+            snapshot_sources(),
+            lambda: SnapshotProcessor.get_snapshot_reconciliation(date_from, date_to, max_workers=workers),
+            'snapshot'
+        )
+        
+        return jsonify({
+            'status': 'success',
+            'data': data
+        })
+        
+    except AdmissionRefused as e:
+        return AdmissionControl.refused(e)
+    except Exception as e:
+        print(f"Error processing CRM vs Billing snapshots: {e}")
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
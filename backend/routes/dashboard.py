@@ -1,15 +1,25 @@
 from flask import Blueprint, jsonify, request
 from models.revenue import RevenueModel
+from models.reconciliation_aggregates import ReconciliationAggregates
+from middleware.conditional import ConditionalGet
 
 dashboard_bp = Blueprint('dashboard', __name__)
 
 @dashboard_bp.route('', methods=['GET'])
+@ConditionalGet.cached(lambda: [ReconciliationAggregates.DB_PATH], dated=True)
 def get_dashboard_data():
     """Get dashboard data"""
-    return jsonify({
-        'status': 'success',
-        'data': RevenueModel.get_dashboard_metriics()
-    })
+    try:
+        return jsonify({
+            'status': 'success',
+            'data': RevenueModel.get_dashboard_metrics()
+        })
+    except Exception as e:
+        print(f"Error loading dashboard metrics: {e}")
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
 
 @dashboard_bp.route('/kra/<kra_id>', methods=['GET'])
 def get_kra_data(kra_id):
@@ -1,8 +1,10 @@
 from flask import Blueprint, jsonify
-from models.services import ServicesModel
+from lazy_import import LazyImport
 
 fixed_line_bp = Blueprint('fixed_line', __name__)
 
+ServicesModel = LazyImport('models.services', 'ServicesModel')
+
 @fixed_line_bp.route('', methods=['GET'])
 def get_fixed_line_data():
     """Get fixed line data"""
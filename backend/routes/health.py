@@ -0,0 +1,21 @@
+from flask import Blueprint, jsonify
+from warmup import Warmup
+
+health_bp = Blueprint('health', __name__)
+
+@health_bp.route('', methods=['GET'])
+def get_health():
+    """Liveness: the worker is up and serving requests"""
+    return jsonify({
+        'status': 'success',
+        'data': {'alive': True}
+    })
+
+@health_bp.route('/ready', methods=['GET'])
+def get_readiness():
+    """Readiness: 200 once this worker's warmup has finished, 503 while it runs"""
+    status = Warmup.status()
+    return jsonify({
+        'status': 'success' if status['ready'] else 'warming_up',
+        'data': status
+    }), 200 if status['ready'] else 503
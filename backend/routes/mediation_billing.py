@@ -1,9 +1,12 @@
 from flask import Blueprint, jsonify
 from models.revenue import RevenueModel
+from models.reconciliation_aggregates import ReconciliationAggregates
+from middleware.conditional import ConditionalGet
 
 mediation_billing_bp = Blueprint('mediation_billing', __name__)
 
 @mediation_billing_bp.route('', methods=['GET'])
+@ConditionalGet.cached(lambda: [ReconciliationAggregates.DB_PATH], dated=True)
 def get_mediation_billing_data():
     """Get mediation vs billing data"""
     return jsonify({
@@ -1,9 +1,12 @@
 from flask import Blueprint, jsonify
 from models.revenue import RevenueModel
+from models.reconciliation_aggregates import ReconciliationAggregates
+from middleware.conditional import ConditionalGet
 
 network_billing_bp = Blueprint('network_billing', __name__)
 
 @network_billing_bp.route('', methods=['GET'])
+@ConditionalGet.cached(lambda: [ReconciliationAggregates.DB_PATH], dated=True)
 def get_network_billing_data():
     """Get network vs billing data"""
     return jsonify({
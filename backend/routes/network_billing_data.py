@@ -1,18 +1,86 @@
-from flask import Blueprint, jsonify
-from models.services import ServicesModel
+from functools import partial
+from flask import Blueprint, jsonify, request
+from middleware.conditional import ConditionalGet
+from middleware.single_flight import SingleFlight
+from middleware.admission import AdmissionControl, AdmissionRefused
+from lazy_import import LazyImport
 
 network_billing_data_bp = Blueprint('network_billing_data', __name__)
 
+ServicesModel = LazyImport('models.services', 'ServicesModel')
+LeakageModel = LazyImport('models.leakage', 'LeakageModel')
+SampledReconciliation = LazyImport('models.sampling', 'SampledReconciliation')
+SqlReconciliation = LazyImport('models.sql_reconciliation', 'SqlReconciliation')
+ResultStore = LazyImport('models.result_store', 'ResultStore')
+ResponseProjection = LazyImport('models.projection', 'ResponseProjection')
+UsagePartitions = LazyImport('models.usage_partitions', 'UsagePartitions')
+RuleEngine = LazyImport('models.rule_engine', 'RuleEngine')
+
+def sources():
+    return ServicesModel.DATA_FILES + LeakageModel.CHARGE_FILES + (RuleEngine.CONFIG_PATH,)
+
+def reconcile(sample=None, engine=None, projection=None, window=None):
+    """Run (or share) the reconciliation for the current inputs, on an MSISDN sample when given a fraction
+
+    Each complete run is stored in ResultStore and its run_id added to the
+    result. A projection runs only what its sections need and is not stored.
+    """
+    engine = SqlReconciliation.engine(engine)
+    projection = projection or ResponseProjection()
+    name = 'network_billing_data'
+    if engine != SqlReconciliation.DEFAULT_ENGINE:
+        name += f'-{engine}'
+    if sample:
+        name += f'-sample-{sample}'
+    if window:
+        name += f'-window-{window[0]}-{window[1]}'
+    reconciliation = partial(ServicesModel.get_network_vs_billing_data_opt, sample=sample, engine=engine, projection=projection, window=window)
+    if projection.complete:
+        reconciliation = partial(ResultStore.recorded, 'network_data', reconciliation, sample=sample, engine=engine, window=window)
+    else:
+        name += f'-{projection.digest}'
+    # Only the default reconciliation is kept in memory between requests
+    retain = engine == SqlReconciliation.DEFAULT_ENGINE and not sample and not window and projection.complete
+    result = SingleFlight.run(name, sources(), reconciliation, 'reconciliation', retain)
+    # The shared result is kept for other requests, so the projection works on a copy
+    return dict(result, data=projection.apply(result['data']))
+
 @network_billing_data_bp.route('', methods=['GET'])
+@ConditionalGet.cached(sources)
 def get_network_billing_data():
-    """Get Network vs Billing data"""
+    """Get Network vs Billing data
+
+    mode=sample (with an optional fraction, default 0.1) reconciles an
+    MSISDN-hash sample and adds estimated counts and rates with confidence
+    intervals under data.sample. engine=duckdb runs the joins and rules
+    as SQL when duckdb is installed (default pandas, or REVENUEFIX_ENGINE).
+    sections= (comma separated data keys, e.g. mismatch_count) returns only
+    those, skipping the rules and joins no requested section needs, and
+    fields= keeps only the named columns in record lists. from= and to=
+    (YYYY-MM-DD, inclusive) reconcile only the usage dated in that window,
+    reading just the months that overlap it.
+    """
     try:
+        try:
+            sample = SampledReconciliation.query_fraction(request.args)
+            engine = SqlReconciliation.engine(request.args.get('engine'))
+            projection = ResponseProjection.from_args(
+                request.args, ResponseProjection.NETWORK_SECTIONS, ResponseProjection.network_fields(ServicesModel.DATA_FILES)
+            )
+            window = UsagePartitions.query_window(request.args)
+        except ValueError as e:
+            return jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), 400
         
         return jsonify({
             'status': 'success',
-            'data': ServicesModel.get_network_vs_billing_data_opt()
+            'data': reconcile(sample, engine, projection, window)
         })
         
+    except AdmissionRefused as e:
+        return AdmissionControl.refused(e)
     except Exception as e:
         print(f"Error processing Network vs Billing data: {e}")
         return jsonify({
@@ -0,0 +1,187 @@
+import io
+import csv
+import json
+from flask import Blueprint, Response, jsonify, request
+from lazy_import import LazyImport
+
+reconciliation_runs_bp = Blueprint('reconciliation_runs', __name__)
+
+ResultStore = LazyImport('models.result_store', 'ResultStore')
+
+EXPORT_FORMATS = ('csv', 'json')
+
+@reconciliation_runs_bp.route('', methods=['GET'])
+def get_runs():
+    """Stored reconciliation runs, newest first; source= and limit= narrow the list"""
+    try:
+        try:
+            limit = int(request.args['limit']) if request.args.get('limit') else None
+            if limit is not None and limit < 1:
+                raise ValueError
+        except ValueError:
+            return jsonify({
+                'status': 'error',
+                'message': "limit must be a positive integer"
+            }), 400
+
+        return jsonify({
+            'status': 'success',
+            'data': ResultStore.runs(request.args.get('source'), limit)
+        })
+    except Exception as e:
+        print(f"Error fetching reconciliation runs: {e}")
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+@reconciliation_runs_bp.route('/<run_id>', methods=['GET'])
+def get_run(run_id):
+    """Metadata, summary metrics and per-category counts of one run"""
+    try:
+        run = ResultStore.run(run_id)
+        if run is None:
+            return jsonify({
+                'status': 'error',
+                'message': f"Run {run_id} not found"
+            }), 404
+
+        return jsonify({
+            'status': 'success',
+            'data': run
+        })
+    except Exception as e:
+        print(f"Error fetching reconciliation run {run_id}: {e}")
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+@reconciliation_runs_bp.route('/<run_id>/records', methods=['GET'])
+def get_run_records(run_id):
+    """Mismatch rows of a run
+
+    Supports category, msisdn, service (Service ID) and service_name
+    filters (comma separated for several values) and limit/cursor for
+    keyset pagination.
+    """
+    try:
+        if ResultStore.run(run_id) is None:
+            return jsonify({
+                'status': 'error',
+                'message': f"Run {run_id} not found"
+            }), 404
+        try:
+            page = ResultStore.records(run_id, **ResultStore.query_args(request.args))
+        except ValueError as e:
+            return jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), 400
+
+        return jsonify({
+            'status': 'success',
+            'data': page
+        })
+    except Exception as e:
+        print(f"Error fetching records of reconciliation run {run_id}: {e}")
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+@reconciliation_runs_bp.route('/<run_id>/delta', methods=['GET'])
+def get_run_delta(run_id):
+    """New, resolved and persisting mismatches of a run against base= (default: the previous comparable run of its source)
+
+    Returns counts per category; status=new|resolved|persisting also lists
+    those records, with an optional category filter and limit/cursor
+    pagination.
+    """
+    try:
+        base_run_id = request.args.get('base') or ResultStore.previous_run(run_id)
+        for required in (run_id, base_run_id):
+            if required is None or ResultStore.run(required) is None:
+                return jsonify({
+                    'status': 'error',
+                    'message': f"Run {required} not found" if required else f"No run before {run_id} with the same sample, window and inputs to compare with"
+                }), 404
+        try:
+            query_args = ResultStore.query_args(request.args)
+            category = query_args['filters'].get('category')
+            if category and len(category) > 1:
+                raise ValueError("delta takes a single category")
+            delta = ResultStore.delta(
+                base_run_id,
+                run_id,
+                status=request.args.get('status'),
+                category=category[0] if category else None,
+                limit=query_args['limit'],
+                cursor=query_args['cursor']
+            )
+        except ValueError as e:
+            return jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), 400
+
+        return jsonify({
+            'status': 'success',
+            'data': delta
+        })
+    except Exception as e:
+        print(f"Error comparing reconciliation run {run_id}: {e}")
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+@reconciliation_runs_bp.route('/<run_id>/export', methods=['GET'])
+def export_run_records(run_id):
+    """Download the filtered mismatch rows of a run as CSV or JSON lines (format=csv|json)"""
+    try:
+        if ResultStore.run(run_id) is None:
+            return jsonify({
+                'status': 'error',
+                'message': f"Run {run_id} not found"
+            }), 404
+        export_format = request.args.get('format', 'csv')
+        try:
+            if export_format not in EXPORT_FORMATS:
+                raise ValueError(f"format must be one of: {', '.join(EXPORT_FORMATS)}")
+            filters = ResultStore.query_args(request.args)['filters']
+        except ValueError as e:
+            return jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), 400
+
+        if export_format == 'json':
+            def generate():
+                for batch in ResultStore.export(run_id, filters):
+                    yield ''.join(json.dumps(record, default=str) + '\n' for record in batch)
+            mimetype = 'application/x-ndjson'
+        else:
+            def generate():
+                # Categories have different columns, so the header is the union over a first pass
+                columns = list(dict.fromkeys(key for batch in ResultStore.export(run_id, filters) for record in batch for key in record))
+                buffer = io.StringIO()
+                writer = csv.DictWriter(buffer, fieldnames=columns)
+                writer.writeheader()
+                for batch in ResultStore.export(run_id, filters):
+                    writer.writerows(batch)
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+                yield buffer.getvalue()
+            mimetype = 'text/csv'
+
+        return Response(generate(), mimetype=mimetype, headers={
+            'Content-Disposition': f'attachment; filename={run_id}.{"jsonl" if export_format == "json" else "csv"}'
+        })
+    except Exception as e:
+        print(f"Error exporting reconciliation run {run_id}: {e}")
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
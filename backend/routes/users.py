@@ -1,8 +1,12 @@
 from flask import Blueprint, jsonify, request
 from models.users import UserModel
+from middleware.conditional import ConditionalGet
+from lazy_import import LazyImport
 
 users_bp = Blueprint('users', __name__)
 
+TicketStore = LazyImport('models.ticket_store', 'TicketStore')
+
 @users_bp.route('', methods=['GET'])
 def get_users():
     """Get all users"""
@@ -34,6 +38,7 @@ def get_roles():
     })
 
 @users_bp.route('/tasks', methods=['GET'])
+@ConditionalGet.cached(lambda: [TicketStore.file_path('alarms'), TicketStore.file_path('cases')])
 def get_tasks():
     """Get available task"""
 
@@ -0,0 +1,94 @@
+import os
+import time
+import threading
+import importlib
+from datetime import datetime
+
+
+class Warmup:
+    """Background warmup that preloads datasets and precomputes reconciliations
+
+    Started once per worker (gunicorn's post_worker_init hook, or app start
+    when run directly). Tasks come from REVENUEFIX_WARMUP_TASKS, a comma
+    separated subset of TASKS; REVENUEFIX_WARMUP=0 disables the warmup. The
+    readiness endpoint reports the worker ready once every task has
+    finished, successfully or not, so a failed task never keeps a worker
+    out of rotation, or right away when the warmup is disabled; a worker
+    whose warmup has not started yet is not ready.
+    """
+
+    # Task name -> (module, function) run in this order
+    TASKS = {
+        'imports': ('lazy_import', 'warm_imports'),
+        'tickets': ('models.ticket_store', 'TicketStore.workload'),
+        'network_billing_data': ('routes.network_billing_data', 'reconcile'),
+        'network_billing_sms': ('routes.network_billing_sms', 'reconcile'),
+        'network_billing_voice': ('routes.network_billing_voice', 'reconcile'),
+        'crm_billing': ('routes.crm_billing', 'reconcile')
+    }
+
+    _lock = threading.Lock()
+    _thread = None
+    _started_at = None
+    _finished_at = None
+    _tasks = {}
+
+    @staticmethod
+    def enabled():
+        return os.environ.get('REVENUEFIX_WARMUP', '1').lower() not in ('0', 'false', 'no', 'off')
+
+    @classmethod
+    def configured_tasks(cls):
+        names = os.environ.get('REVENUEFIX_WARMUP_TASKS')
+        if not names:
+            return list(cls.TASKS)
+        return [name.strip() for name in names.split(',') if name.strip() in cls.TASKS]
+
+    @classmethod
+    def start(cls):
+        """Start the warmup thread once for this process; no-op when disabled"""
+        with cls._lock:
+            if cls._thread is not None or not cls.enabled():
+                return
+            cls._tasks = {name: {'status': 'pending'} for name in cls.configured_tasks()}
+            cls._started_at = datetime.now().isoformat(timespec='seconds')
+            cls._thread = threading.Thread(target=cls._run, name='revenuefix-warmup', daemon=True)
+            cls._thread.start()
+
+    @classmethod
+    def _resolve(cls, name):
+        module_name, path = cls.TASKS[name]
+        target = importlib.import_module(module_name)
+        for part in path.split('.'):
+            target = getattr(target, part)
+        return target
+
+    @classmethod
+    def _run(cls):
+        for name in list(cls._tasks):
+            cls._tasks[name] = {'status': 'running'}
+            started = time.monotonic()
+            try:
+                cls._resolve(name)()
+                cls._tasks[name] = {'status': 'done', 'seconds': round(time.monotonic() - started, 2)}
+            except Exception as e:
+                print(f"Warmup task {name} failed: {e}")
+                cls._tasks[name] = {'status': 'failed', 'seconds': round(time.monotonic() - started, 2), 'error': str(e)}
+        cls._finished_at = datetime.now().isoformat(timespec='seconds')
+        print(f"Warmup finished in worker {os.getpid()}: {cls._tasks}")
+
+    @classmethod
+    def status(cls):
+        """Readiness of this worker and the state of each warmup task"""
+        if cls._thread is None:
+            state = 'disabled' if not cls.enabled() else 'not_started'
+        else:
+            state = 'done' if cls._finished_at else 'running'
+        return {
+            'ready': state in ('done', 'disabled'),
+            'state': state,
+            'pid': os.getpid(),
+            'started_at': cls._started_at,
+            'finished_at': cls._finished_at,
+            'tasks': dict(cls._tasks)
+        }